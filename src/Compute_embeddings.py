@@ -1,82 +1,393 @@
+import hashlib
 import json
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import get_context
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from embedding_store import CONTENT_FILE, METADATA_FILE, TEXT_FILE, EmbeddingStore, StoreWriter, apply_delta
+from json_stream import iter_chunks, iter_jsonl, iter_records, write_json_array
+from lexical_index import build_lexical_index
+from metadata_store import build_metadata_index
+from scoring_engine import FIELDS, ScoringEngine
+from stub_encoder import STUB_MODEL_PREFIX, load_encoder
+from vector_index import normalize_rows
 
-def compute_embeddings(input_file, output_json, output_npy, model_name='all-MiniLM-L6-v2', batch_size=32):
+# Row-aligned sidecar files kept inside the store
+SIDECAR_FILES = (METADATA_FILE, CONTENT_FILE, TEXT_FILE)
+
+def product_texts(product):
+    """
+    Return the text embedded for each field of a product.
+    """
+    return {
+        'titles': product.get('title', ''),
+        'categories': " ".join(product.get('categories', [])),  # Ensure categories are a single string
+        'features': " ".join(product.get('features', [])),  # Ensure features are a single string
+    }
+
+def product_metadata(product):
+    """
+    Metadata (without embeddings) saved for each product for reference.
+    """
+    return {
+        'title': product.get('title', ''),
+        'description': product.get('description', ''),
+        'categories': product.get('categories', []),
+        'features': product.get('features', [])
+    }
+
+def product_text(product):
+    """
+    Text indexed for lexical (BM25) search: the preprocessed combined_text when present.
+    """
+    if product.get('combined_text'):
+        return product['combined_text']
+    return " ".join([product.get('title', ''), product.get('description', '')] + product.get('features', []) + product.get('categories', []))
+
+def sidecar_records(products, keys):
+    """
+    Records of each row-aligned sidecar file for a list of products and their keys.
+    """
+    return {
+        METADATA_FILE: [product_metadata(product) for product in products],
+        CONTENT_FILE: [content_record(product, key) for product, key in zip(products, keys)],
+        TEXT_FILE: [product_text(product) for product in products],
+    }
+
+def product_key(product):
+    """
+    Stable identity of a product across catalog refreshes: its id if it has one, else its title.
+    """
+    if product.get('id') is not None:
+        return str(product['id'])
+    return hashlib.sha1(product.get('title', '').encode('utf-8')).hexdigest()
+
+class ProductKeys:
+    """
+    Assigns the products of a catalog unique keys, in catalog order. A product's key is its
+    product_key; products repeating a key (several products with one title, or a duplicated
+    id) get its n-th occurrence as "<key>#<n>", so no two rows of a store share a key.
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def __call__(self, product):
+        key = product_key(product)
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        return key if count == 0 else f"{key}#{count}"
+
+def content_record(product, key):
+    """
+    Key and content hashes of a product: one per embedded field plus one for its metadata
+    and one for its lexical text.
+    """
+    texts = product_texts(product)
+    texts['metadata'] = json.dumps(product_metadata(product), sort_keys=True)
+    texts['text'] = product_text(product)
+    return {
+        'key': key,
+        'hashes': {name: hashlib.sha1(text.encode('utf-8')).hexdigest()[:16] for name, text in texts.items()},
+    }
+
+def encode_chunk(model, products, batch_size=32):
+    """
+    Encode every field of a chunk of products in a single model call.
+    """
+    texts = [product_texts(product) for product in products]
+    embeddings = model.encode([text[field] for field in FIELDS for text in texts], batch_size=batch_size, convert_to_numpy=True)
+    return {field: embeddings[i * len(products):(i + 1) * len(products)] for i, field in enumerate(FIELDS)}
+
+def write_store_chunks(writer, chunks, label='Embedded'):
+    """
+    Append (embeddings, sidecar records) chunks to a StoreWriter together with the row-aligned
+    sidecar files, checkpointing after each chunk, then build the lexical and metadata indexes and publish the store.
+    `sidecar records` maps each sidecar file name to the chunk's records.
+    """
+    sidecars = {name: open(os.path.join(writer.staging_path, name), 'a+b') for name in SIDECAR_FILES}
+    try:
+        for name, file in sidecars.items():
+            file.truncate(writer.resume_state.get(name, 0))  # Drop records past the checkpoint
+
+        for embeddings, records in chunks:
+            writer.append(embeddings)
+            for name, file in sidecars.items():
+                file.write(b''.join(json.dumps(record).encode('utf-8') + b'\n' for record in records[name]))
+                file.flush()
+            writer.checkpoint({name: file.tell() for name, file in sidecars.items()})
+            print(f"{label} {writer.rows} products")
+    finally:
+        for file in sidecars.values():
+            file.close()
+
+    build_lexical_index(writer.staging_path)
+    build_metadata_index(writer.staging_path)
+    writer.finalize()
+
+# Model loaded once per encoding pool worker by init_encoding_worker
+worker_model = None
+
+def init_encoding_worker(model_name, threads):
+    """
+    Load the model once in a pool worker and cap its intra-op threads, so that
+    workers x threads stays within the available cores.
+    """
+    global worker_model
+    if not model_name.startswith(STUB_MODEL_PREFIX):
+        import torch
+
+        os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+        torch.set_num_threads(threads)
+    worker_model = load_model(model_name)
+
+def encode_worker_chunk(products, batch_size=32):
+    return encode_chunk(worker_model, products, batch_size)
+
+def worker_dimension(_=None):
+    return worker_model.get_sentence_embedding_dimension()
+
+def encoding_pool(model_name, workers, threads_per_worker=None):
+    """
+    Start a process pool of `workers` encoders. Each worker gets threads_per_worker
+    intra-op threads (default: the cores divided evenly between workers).
+    Workers are spawned rather than forked so none inherits the parent's thread pools.
     """
-    Compute embeddings for each product in the preprocessed dataset and save in JSON and NumPy format.
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context('spawn'),
+        initializer=init_encoding_worker,
+        initargs=(model_name, threads),
+    )
+
+def encode_chunks_parallel(executor, chunks, batch_size=32, max_pending=2):
+    """
+    Encode chunks on an encoding pool and yield (chunk, embeddings) in input order.
+    At most max_pending chunks are in flight at once, which bounds memory use.
+    """
+    pending = deque()
+    for chunk in chunks:
+        pending.append((chunk, executor.submit(encode_worker_chunk, chunk, batch_size)))
+        if len(pending) >= max_pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+    while pending:
+        chunk, future = pending.popleft()
+        yield chunk, future.result()
+
+def compute_embeddings(input_file, output_json, output_store, model_name='all-MiniLM-L6-v2', batch_size=32, dtype='float32', chunk_size=10_000,
+                       workers=1, threads_per_worker=None):
+    """
+    Compute embeddings for each product in the preprocessed dataset (JSON array or JSONL) and save the
+    metadata as JSON and the embeddings as a memory-mapped embedding store (L2-normalized, float32 or float16).
+
+    Products are streamed and encoded chunk_size at a time; each chunk is appended to the store and
+    checkpointed, so memory stays bounded and an interrupted run resumes from the last completed chunk.
+    With workers > 1, chunks are encoded in parallel by a process pool (one model per worker) and
+    appended to the store in input order.
     """
+    executor = None
     try:
-        # Load the preprocessed data
-        with open(input_file, 'r', encoding='utf-8') as file:
-            preprocessed_data = json.load(file)
-
-        # Initialize the SentenceTransformer model
-        model = SentenceTransformer(model_name)
-
-        # Prepare texts for embedding
-        product_titles = []
-        product_categories = []
-        product_features = []
-        metadata = []
-
-        for product in preprocessed_data:
-            title = product.get('title', '')
-            description = product.get('description', '')
-            categories = " ".join(product.get('categories', []))  # Ensure categories are a single string
-            features = " ".join(product.get('features', []))  # Ensure features are a single string
-
-            product_titles.append(title)
-            product_categories.append(categories)
-            product_features.append(features)
-
-            # Save metadata (without embeddings) for reference
-            metadata.append({
-                'title': title,
-                'description': description,
-                'categories': product.get('categories', []),
-                'features': product.get('features', [])
-            })
-
-        # Compute embeddings in batches for each field
-        title_embeddings = model.encode(product_titles, batch_size=batch_size, convert_to_numpy=True)
-        category_embeddings = model.encode(product_categories, batch_size=batch_size, convert_to_numpy=True)
-        features_embeddings = model.encode(product_features, batch_size=batch_size, convert_to_numpy=True)
-
-        # Save metadata and embeddings separately
-        with open(output_json, 'w', encoding='utf-8') as file:
-            json.dump(metadata, file, indent=4)
-
-        np.save(output_npy, {
-            'titles': title_embeddings,
-            'categories': category_embeddings,
-            'features': features_embeddings
-        })  # Save embeddings as a NumPy binary file
-
-        print(f"Embeddings computed and saved to {output_json} and {output_npy}")
+        if workers > 1:
+            executor = encoding_pool(model_name, workers, threads_per_worker)
+            dim = executor.submit(worker_dimension).result()
+        else:
+            # Initialize the SentenceTransformer model
+            model = load_model(model_name)
+            dim = model.get_sentence_embedding_dimension()
+
+        # Resume a partial build of the same input with the same settings, if there is one
+        input_stat = os.stat(input_file)
+        writer = StoreWriter(output_store, FIELDS, dim, dtype, build_info={
+            'input': os.path.abspath(input_file),
+            'input_size': input_stat.st_size,
+            'input_mtime': input_stat.st_mtime,
+            'model': model_name,
+        })
+
+        # Skip completed chunks, replaying their keys so repeated titles keep their occurrence numbers
+        products, keys = iter_records(input_file), ProductKeys()
+        for product in islice(products, writer.rows):
+            keys(product)
+        if executor:
+            encoded = encode_chunks_parallel(executor, iter_chunks(products, chunk_size), batch_size, max_pending=2 * workers)
+        else:
+            encoded = ((chunk, encode_chunk(model, chunk, batch_size)) for chunk in iter_chunks(products, chunk_size))
+        chunks = ((embeddings, sidecar_records(chunk, [keys(product) for product in chunk])) for chunk, embeddings in encoded)
+        write_store_chunks(writer, chunks)
+
+        # Save metadata separately
+        write_json_array(iter_jsonl(os.path.join(output_store, METADATA_FILE)), output_json)
+
+        print(f"Embeddings computed and saved to {output_json} and {output_store}")
 
     except Exception as e:
         print(f"Error during embedding computation: {e}")
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
 
-def compute_cosine_similarity(query, product_embeddings, model_name='all-MiniLM-L6-v2'):
+def rewrite_sidecar(source_path, path, replacements, additions):
     """
-    Compute cosine similarity between the query and product embeddings for title, category, and features.
+    Write a copy of a row-aligned JSONL sidecar to `path`, replacing records by row and appending new ones.
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        for row, record in enumerate(iter_jsonl(source_path)):
+            file.write(json.dumps(replacements.get(row, record)) + '\n')
+        for record in additions:
+            file.write(json.dumps(record) + '\n')
+
+def has_content_hashes(store_path):
+    """
+    Whether a store exists and records the content hashes update_embeddings diffs against.
     """
     try:
-        # Initialize the SentenceTransformer model for encoding the query
-        model = SentenceTransformer(model_name)
+        return os.path.exists(EmbeddingStore.open(store_path).file_path(CONTENT_FILE))
+    except (OSError, ValueError):
+        return False
 
-        # Compute the query embedding
-        query_embedding = model.encode(query, convert_to_numpy=True).reshape(1, -1)  # Ensure it's 2D for cosine similarity
+def update_embeddings(input_file, output_json, output_store, model_name='all-MiniLM-L6-v2', batch_size=32, compact_threshold=0.2):
+    """
+    Incrementally refresh an existing store from a new version of the preprocessed dataset.
+
+    Products are matched by key (see ProductKeys) and compared by per-field content hash: only changed fields of
+    changed products and new products are encoded; products missing from the input are tombstoned.
+    The changed sidecars and their indexes are written to a staging directory (`<store>.delta`) and
+    published with the patched matrices by apply_delta under a new version, which running search engines
+    pick up without a restart; an update that fails midway leaves the store as it was.
+    Once more than compact_threshold of the rows are tombstones the store is compacted.
+    """
+    try:
+        store = EmbeddingStore.open(output_store)
+        deleted = set(store.deleted.tolist())
+        content_path = store.file_path(CONTENT_FILE)
+
+        # Current content hashes by product key
+        rows_by_key, hashes_by_row = {}, []
+        for row, record in enumerate(iter_jsonl(content_path)):
+            hashes_by_row.append(record['hashes'])
+            if row not in deleted:
+                rows_by_key.setdefault(record['key'], row)
+
+        # Diff the new catalog against the store
+        updates = {field: ([], []) for field in FIELDS}  # field -> (rows, texts)
+        replacements = {name: {} for name in SIDECAR_FILES}
+        new_products, new_keys, matched = [], [], set()
+        keys = ProductKeys()
+        for product in iter_records(input_file):
+            key = keys(product)
+            record = content_record(product, key)
+            row = rows_by_key.get(key)
+            if row is None:
+                new_products.append(product)
+                new_keys.append(key)
+                continue
+            matched.add(row)
+            if record['hashes'] == hashes_by_row[row]:
+                continue
+            texts = product_texts(product)
+            for field in FIELDS:
+                if record['hashes'][field] != hashes_by_row[row].get(field):
+                    updates[field][0].append(row)
+                    updates[field][1].append(texts[field])
+            for name, records in sidecar_records([product], [key]).items():
+                replacements[name][row] = records[0]
+
+        # Live rows no product matched, including rows of stores built before keys were unique
+        removed = [row for row in range(len(hashes_by_row)) if row not in deleted and row not in matched]
+        changed = len(replacements[CONTENT_FILE])
+        if not (changed or new_products or removed):
+            print(f"{output_store} is up to date")
+            return
+        print(f"Updating {changed} changed, {len(new_products)} new and {len(removed)} removed products")
 
-        # Calculate cosine similarities with each product field's embedding
-        title_similarity = cosine_similarity(query_embedding, product_embeddings['titles'])
-        category_similarity = cosine_similarity(query_embedding, product_embeddings['categories'])
-        features_similarity = cosine_similarity(query_embedding, product_embeddings['features'])
+        # Encode only the changed fields and the new products
+        model = load_model(model_name)
+        updated = {
+            field: (np.array(rows, dtype=np.int64), model.encode(texts, batch_size=batch_size, convert_to_numpy=True))
+            for field, (rows, texts) in updates.items() if rows
+        }
+        appended = encode_chunk(model, new_products, batch_size) if new_products else None
 
-        # Average the similarities for final similarity score
-        final_similarity = np.mean([title_similarity, category_similarity, features_similarity], axis=0)
+        # Sidecars and their indexes are staged aside; the manifest written by apply_delta publishes them with the vectors
+        staging_path = f"{output_store}.delta"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        staged = {}
+        if changed or new_products:
+            os.makedirs(staging_path)
+            for name, records in sidecar_records(new_products, new_keys).items():
+                rewrite_sidecar(store.file_path(name), os.path.join(staging_path, name), replacements[name], records)
+            build_lexical_index(staging_path)
+            build_metadata_index(staging_path)
+            staged = {name: os.path.join(staging_path, name) for name in os.listdir(staging_path)}
+        apply_delta(output_store, updated, appended, removed, staged)
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+        # Precombined field matrices cached for the previous version are stale now
+        for name in os.listdir(output_store):
+            if name.startswith('combined-') and name.endswith('.emb'):
+                os.remove(os.path.join(output_store, name))
+
+        store = EmbeddingStore.open(output_store)
+        if len(store.deleted) > compact_threshold * len(store):
+            compact_store(output_store)
+
+        write_json_array(iter_jsonl(EmbeddingStore.open(output_store).file_path(METADATA_FILE)), output_json)
+        print(f"Embeddings updated in {output_json} and {output_store}")
+
+    except Exception as e:
+        print(f"Error during incremental embedding update: {e}")
+
+def compact_store(store_path, chunk_size=10_000):
+    """
+    Rewrite a store without its tombstoned rows. Row ids of the remaining products shift,
+    so running search engines reload the store and rebuild their vector index.
+    """
+    store = EmbeddingStore.open(store_path)
+    deleted = set(store.deleted.tolist())
+    writer = StoreWriter(store_path, store.fields, store.manifest['dim'], store.manifest['dtype'],
+                         build_info={'compact_of': store.version})
+
+    live_rows = (
+        (row, records)
+        for row, records in enumerate(zip(*(iter_jsonl(store.file_path(name)) for name in SIDECAR_FILES)))
+        if row not in deleted
+    )
+    chunks = (
+        ({field: np.asarray(store[field][[row for row, _ in chunk]]) for field in store.fields},
+         {name: [records[i] for _, records in chunk] for i, name in enumerate(SIDECAR_FILES)})
+        for chunk in iter_chunks(islice(live_rows, writer.rows, None), chunk_size)
+    )
+    write_store_chunks(writer, chunks, label='Compacted')
+
+@lru_cache(maxsize=None)
+def load_model(model_name='all-MiniLM-L6-v2'):
+    """
+    Load a SentenceTransformer model once per process and reuse it. "stub" loads the
+    deterministic offline encoder used by the benchmarks.
+    """
+    return load_encoder(model_name)
+
+def compute_cosine_similarity(query, product_embeddings, model_name='all-MiniLM-L6-v2', weights=None):
+    """
+    Compute the weighted cosine similarity between the query and product embeddings over the
+    title, category, and features fields. `weights` overrides the default per-field weights.
+    """
+    try:
+        # Reuse the cached SentenceTransformer model for encoding the query
+        model = load_model(model_name)
+
+        # Compute the query embedding
+        query_embedding = normalize_rows(model.encode(query, convert_to_numpy=True))
+
+        # Fuse the field similarities with the scoring engine's precombined matrix
+        engine = ScoringEngine(product_embeddings)
+        final_similarity = engine.score(query_embedding, weights).reshape(1, -1)
 
         return final_similarity
 
@@ -86,24 +397,27 @@ def compute_cosine_similarity(query, product_embeddings, model_name='all-MiniLM-
 
 
 # Example usage of the embedding and similarity functions
+if __name__ == "__main__":
+    # Define input and output file paths
+    input_file = './data/preprocessed.jsonl'  # Path to the preprocessed data
+    output_json = './data/product_metadata.json'  # Save metadata without embeddings
+    output_store = './data/embedding_store'  # Save embeddings as a memory-mapped store
 
-# Define input and output file paths
-input_file = './data/preprocessed.json'  # Path to the preprocessed data
-output_json = './data/product_metadata.json'  # Save metadata without embeddings
-output_npy = './data/product_embeddings.npy'  # Save embeddings as NumPy binary file
-
-# Run embedding computation
-compute_embeddings(input_file, output_json, output_npy)
+    # Run embedding computation, only re-encoding changed products when a store already exists
+    if has_content_hashes(output_store):
+        update_embeddings(input_file, output_json, output_store)
+    else:
+        compute_embeddings(input_file, output_json, output_store, workers=int(os.getenv('EMBED_WORKERS', 1)))
 
-# Example query
-query = "wireless mouse"
+    # Example query
+    query = "wireless mouse"
 
-# Load product embeddings
-product_embeddings = np.load(output_npy, allow_pickle=True).item()
+    # Load product embeddings
+    product_embeddings = EmbeddingStore.open(output_store)
 
-# Compute cosine similarity between query and product embeddings
-similarities = compute_cosine_similarity(query, product_embeddings)
+    # Compute cosine similarity between query and product embeddings
+    similarities = compute_cosine_similarity(query, product_embeddings)
 
-# Print the similarity scores
-if similarities is not None:
-    print(similarities)
+    # Print the similarity scores
+    if similarities is not None:
+        print(similarities)
@@ -1,8 +1,24 @@
-from flask import Flask, render_template, request, jsonify
-from search_engine import search_products, get_user_search_history
+import time
+from flask import Flask, render_template, request, jsonify, g
+from metrics import CONTENT_TYPE_LATEST, metrics
+from search_engine import search_products, get_user_search_history, record_chat_turn
 
 app = Flask(__name__)
 
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    metrics.observe("http_request_seconds", time.perf_counter() - g.request_started,
+                    "Seconds spent handling each request.", endpoint=request.endpoint or "unknown", method=request.method)
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    return metrics.render(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -12,14 +28,22 @@ def chat():
     data = request.get_json()
     user_id = data.get('user_id', 'guest')
     query = data.get('query', '')
+    weights = data.get('weights')  # Optional per-field weights, e.g. {"titles": 1, "features": 0.5}
+    filters = {field: data[field] for field in ('categories', 'features') if data.get(field)}  # Optional filters, e.g. ["kitchen"]
+    lexical_weight = data.get('lexical_weight')  # Optional share of keyword (BM25) matching, 0-1
     
     if not query:
         return jsonify({'error': 'Query cannot be empty'}), 400
+    if weights is not None and not isinstance(weights, dict):
+        return jsonify({'error': 'Weights must be an object mapping field to weight'}), 400
     
-    results = search_products(user_id, query)
-    history = get_user_search_history(user_id)
+    try:
+        results = search_products(user_id, query, weights=weights, filters=filters, lexical_weight=lexical_weight)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    history, context = record_chat_turn(user_id, query, results)  # One pipelined round-trip
     
-    return jsonify({'results': results, 'history': history})
+    return jsonify({'results': results, 'history': history, 'context': context})
 
 @app.route('/chat', methods=['GET'])
 def get_chat_history():
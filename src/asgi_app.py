@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quart, render_template, request, jsonify, g
+import redis.asyncio as aioredis
+from context_manager import redis_settings
+from metrics import CONTENT_TYPE_LATEST, metrics
+from result_cache import AsyncSingleFlight
+import search_engine
+
+# Asyncio serving mode: same /chat contract as app.py, but Redis round-trips never block
+# the event loop and model inference runs on a thread pool (or the micro-batcher).
+app = Quart(__name__)
+
+inference_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_INFERENCE_THREADS", os.cpu_count() or 1)),
+    thread_name_prefix="inference",
+)
+redis_client = None
+single_flight = AsyncSingleFlight()
+store_refresher = None
+
+@app.before_serving
+async def warm_up():
+    """Loads the search resources before the first request, off the event loop."""
+    await asyncio.get_running_loop().run_in_executor(inference_executor, search_engine.warm_up)
+
+async def refresh_store_periodically():
+    """
+    Picks up catalog updates every SEARCH_STORE_REFRESH_INTERVAL seconds on a worker thread.
+    Reopening the store and rebuilding its indexes takes seconds on a large catalog, so it
+    never runs on the event loop; requests keep using the loaded version until it is swapped.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(search_engine.STORE_REFRESH_INTERVAL)
+        try:
+            await loop.run_in_executor(None, search_engine.refresh_embeddings, True)
+        except Exception as e:
+            logging.error(f"Embedding store refresh failed: {str(e)}")
+
+@app.before_serving
+async def start_store_refresher():
+    global store_refresher
+    store_refresher = asyncio.create_task(refresh_store_periodically())
+
+@app.before_serving
+async def connect_redis():
+    global redis_client
+    redis_client = aioredis.Redis(**redis_settings())  # Same server, DB and timeouts as the sync client
+
+@app.after_serving
+async def close_redis():
+    store_refresher.cancel()
+    await redis_client.aclose()
+    inference_executor.shutdown(wait=False)
+
+async def compute_results(query, top_n, weights, filters=None, lexical_weight=None):
+    """Ranks a query off the event loop, sharing the micro-batcher when it is enabled."""
+    scheduler = search_engine.get_batch_scheduler()
+    if scheduler:
+        return await asyncio.wrap_future(scheduler.submit((query, top_n, weights, filters, lexical_weight)))
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(inference_executor, search_engine.search_batch, [(query, top_n, weights, filters, lexical_weight)])
+    return results[0]
+
+async def record_chat_turn(user_id, query, results, redis_key=None):
+    """
+    Records the /chat turn in the conversation context and returns (history, context) in one
+    pipelined round-trip; with a redis_key, the cache and history writes of a miss go along.
+    """
+    try:
+        with metrics.stage("history"):
+            async with redis_client.pipeline(transaction=False) as pipe:
+                if redis_key:
+                    search_engine.queue_result_writes(pipe, redis_key, user_id, query, results)
+                search_engine.queue_chat_turn(pipe, user_id, query, results)
+                return search_engine.chat_turn_replies(await pipe.execute())
+    except aioredis.RedisError as e:
+        logging.error(f"Redis unavailable: {str(e)}")
+        return [], []
+
+async def search_with_history(user_id, query, weights=None, top_n=5, filters=None, lexical_weight=None):
+    """
+    Returns (results, history, context). An L1 hit costs one pipelined round-trip that records
+    the turn and reads history and context; an L2 hit first GETs the results. A miss sends the
+    cache and history writes with the turn. Concurrent misses on one key share a computation.
+    """
+    # Loading and catalog refreshes happen off the event loop (see warm_up and refresh_store_periodically)
+    redis_key, weights, filters, lexical_weight = search_engine.build_cache_key(query, top_n, weights, filters, lexical_weight)
+    cache = search_engine.result_cache
+
+    cached_results = cache.l1.get(redis_key)
+    if cached_results is not None:
+        cache.count("l1_hits")
+        return (cached_results, *await record_chat_turn(user_id, query, cached_results))
+
+    try:
+        with metrics.stage("cache_get"):
+            cached_results = await redis_client.get(redis_key)
+    except aioredis.RedisError as e:
+        logging.error(f"Redis unavailable: {str(e)}")
+    if cached_results:
+        cache.count("l2_hits")
+        cached_results = json.loads(cached_results)
+        cache.l1.put(redis_key, cached_results)
+        return (cached_results, *await record_chat_turn(user_id, query, cached_results))
+
+    logging.info("Cache miss for query: %s", query)
+    cache.count("coalesced" if redis_key in single_flight.inflight else "misses")
+    try:
+        results = await single_flight.run(redis_key, lambda: compute_results(query, top_n, weights, filters, lexical_weight))
+        cache.l1.put(redis_key, results)
+    except Exception as e:
+        logging.error("Error computing search results: %s", str(e))
+        return [], [], []
+    return (results, *await record_chat_turn(user_id, query, results, redis_key))
+
+@app.before_request
+async def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def record_request_time(response):
+    metrics.observe("http_request_seconds", time.perf_counter() - g.request_started,
+                    "Seconds spent handling each request.", endpoint=request.endpoint or "unknown", method=request.method)
+    return response
+
+@app.route('/metrics')
+async def get_metrics():
+    return metrics.render(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    data = await request.get_json()
+    user_id = data.get('user_id', 'guest')
+    query = data.get('query', '')
+    weights = data.get('weights')  # Optional per-field weights, e.g. {"titles": 1, "features": 0.5}
+    filters = {field: data[field] for field in ('categories', 'features') if data.get(field)}  # Optional filters, e.g. ["kitchen"]
+    lexical_weight = data.get('lexical_weight')  # Optional share of keyword (BM25) matching, 0-1
+
+    if not query:
+        return jsonify({'error': 'Query cannot be empty'}), 400
+    if weights is not None and not isinstance(weights, dict):
+        return jsonify({'error': 'Weights must be an object mapping field to weight'}), 400
+
+    try:
+        results, history, context = await search_with_history(user_id, query, weights, filters=filters, lexical_weight=lexical_weight)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'results': results, 'history': history, 'context': context})
+
+@app.route('/chat', methods=['GET'])
+async def get_chat_history():
+    user_id = request.args.get('user_id', 'guest')
+    try:
+        history = await redis_client.lrange(search_engine.search_history_key(user_id), 0, -1)
+    except aioredis.RedisError as e:
+        logging.error(f"Redis unavailable: {str(e)}")
+        history = []
+    return jsonify({'history': [json.loads(entry) for entry in history]})
+
+if __name__ == '__main__':
+    app.run(debug=True)
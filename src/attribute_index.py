@@ -0,0 +1,217 @@
+import re
+from collections import defaultdict
+import numpy as np
+
+# Product fields that search filters apply to
+FILTER_FIELDS = ("categories", "features")
+
+# Feature values are free text with a large vocabulary, so only feature tokens up to this
+# length tolerate typos; longer feature tokens (and filter words) match exactly
+FUZZY_FEATURE_MAX_LENGTH = 7
+
+
+def normalize_terms(text):
+    """
+    Split a category, feature or filter value into lowercase word tokens.
+    """
+    return re.findall(r"\w+", str(text).lower())
+
+
+def max_edits(token):
+    """
+    Typos tolerated when matching a token: none for short tokens or tokens with digits
+    (sizes, model numbers), one up to 7 characters, two beyond.
+    """
+    if len(token) < 4 or any(char.isdigit() for char in token):
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+def deletion_variants(token, edits):
+    """
+    All strings obtained by deleting up to `edits` characters from token. Two tokens within
+    `edits` edits of each other always share at least one variant.
+    """
+    variants, frontier = {token}, {token}
+    for _ in range(edits):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance between a and b, or limit + 1 once it is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def field_max_edits(field, token):
+    """
+    Typos tolerated for a token of a field: see max_edits and FUZZY_FEATURE_MAX_LENGTH.
+    """
+    if field == "features" and len(token) > FUZZY_FEATURE_MAX_LENGTH:
+        return 0
+    return max_edits(token)
+
+
+def joined_variants(words):
+    """
+    Word lists with one pair of adjacent words written together, so the filter "non-stick"
+    also finds products saying "nonstick".
+    """
+    return [words[:i] + [words[i] + words[i + 1]] + words[i + 2:] for i in range(len(words) - 1)]
+
+
+def normalize_filters(filters):
+    """
+    Validate {"categories": [...], "features": [...]} filters (a single string is accepted
+    for either field) and return them in a canonical form, or None when no filter is set.
+    Raises ValueError on bad input.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("Filters must be an object mapping field to values")
+    normalized = {}
+    for field, values in filters.items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Unknown filter field: {field}")
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise ValueError(f"Filter '{field}' must be a string or a list of strings")
+        terms = sorted({" ".join(normalize_terms(value)) for value in values} - {""})
+        if terms:
+            normalized[field] = terms
+    return normalized or None
+
+
+class AttributeIndex:
+    """
+    Inverted index from normalized category and feature tokens to the rows of the products
+    that have them, built once when the catalog is loaded.
+
+    Each category token and each short feature token is also registered under its deletion
+    variants, so a filter word with a typo finds its vocabulary tokens with a few dictionary
+    lookups instead of a fuzzy comparison against every product. Long feature tokens, the
+    bulk of a free-text vocabulary, are matched exactly. Compound words are resolved at query
+    time: "nonstick" also matches "non stick" and "non-stick" also matches "nonstick".
+    A filter resolves to a boolean row mask (a bitset over the catalog) that restricts the
+    candidates before vector scoring.
+
+    Matching follows the fuzzy post-filter it replaces: a product passes the category filter
+    if it matches any category term and the feature filter if it matches every feature term.
+    A multi-word term matches when each of its words matches.
+    """
+
+    def __init__(self, postings, variants, n_rows):
+        self.postings = postings  # field -> token -> sorted int32 row ids
+        self.variants = variants  # field -> deletion variant -> vocabulary tokens
+        self.n_rows = n_rows
+
+    @classmethod
+    def build(cls, metadata):
+        rows_by_token = {field: defaultdict(list) for field in FILTER_FIELDS}
+        for row, product in enumerate(metadata):
+            for field in FILTER_FIELDS:
+                values = product.get(field) or []
+                if isinstance(values, str):
+                    values = [values]
+                for token in set().union(*map(normalize_terms, values)):
+                    rows_by_token[field][token].append(row)
+
+        postings, variants = {}, {}
+        for field in FILTER_FIELDS:
+            postings[field] = {token: np.asarray(rows, dtype=np.int32) for token, rows in rows_by_token[field].items()}
+            variants[field] = defaultdict(set)
+            for token in postings[field]:
+                edits = field_max_edits(field, token)
+                if edits:
+                    for variant in deletion_variants(token, edits):
+                        variants[field][variant].add(token)
+        return cls(postings, variants, len(metadata))
+
+    def fuzzy_tokens(self, field, word):
+        """
+        Vocabulary tokens of a field within the tolerated number of edits of word.
+        """
+        matches = {word} & self.postings[field].keys()
+        edits = field_max_edits(field, word)
+        if edits == 0:
+            return matches
+        candidates = set()
+        for variant in deletion_variants(word, edits):
+            candidates |= self.variants[field].get(variant, set())
+        for token in candidates - matches:
+            limit = min(edits, field_max_edits(field, token))
+            if edit_distance(word, token, limit) <= limit:
+                matches.add(token)
+        return matches
+
+    def word_mask(self, field, word):
+        """
+        Row mask of the products with a token matching word, or with both halves of word
+        split in two (so "nonstick" finds "non stick").
+        """
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for token in self.fuzzy_tokens(field, word):
+            mask[self.postings[field][token]] = True
+        vocabulary = self.postings[field]
+        for i in range(1, len(word)):
+            first, second = word[:i], word[i:]
+            if first in vocabulary and second in vocabulary:
+                mask[np.intersect1d(vocabulary[first], vocabulary[second], assume_unique=True)] = True
+        return mask
+
+    def words_mask(self, field, words):
+        mask = np.ones(self.n_rows, dtype=bool)
+        for word in words:
+            mask &= self.word_mask(field, word)
+        return mask
+
+    def term_mask(self, field, term):
+        """
+        Row mask of the products whose field matches every word of a filter term, or every
+        word of the term with two adjacent words joined.
+        """
+        words = normalize_terms(term)
+        mask = self.words_mask(field, words)
+        for joined in joined_variants(words):
+            mask |= self.words_mask(field, joined)
+        return mask
+
+    def mask(self, filters):
+        """
+        Row mask of the products passing normalized filters (see normalize_filters).
+        """
+        mask = np.ones(self.n_rows, dtype=bool)
+        if filters.get("categories"):
+            mask &= np.logical_or.reduce([self.term_mask("categories", term) for term in filters["categories"]])
+        for term in filters.get("features", []):
+            mask &= self.term_mask("features", term)
+        return mask
+
+    def candidates(self, filters):
+        """
+        Row ids of the products passing normalized filters.
+        """
+        return np.flatnonzero(self.mask(filters))
+
+
+def product_matches(filters, product):
+    """
+    Whether a single product (metadata dict) passes normalized filters, using the same
+    token and typo rules as AttributeIndex.
+    """
+    return AttributeIndex.build([product]).mask(filters)[0]
@@ -0,0 +1,104 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Gathers concurrently submitted items into small batches for a batch handler.
+
+    The first item of a batch waits at most `max_wait_ms` for company; a batch is
+    dispatched as soon as it holds `max_batch_size` items. A larger window raises
+    throughput under load at the cost of up to `max_wait_ms` added latency.
+
+    `handler` receives a list of items and must return a list of results in the
+    same order. When a batch raises, its items are retried one at a time, so only the
+    items that fail on their own get the exception.
+    """
+
+    def __init__(self, handler, max_batch_size=32, max_wait_ms=5.0):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.queue_wait_total = 0.0
+        self.handler_time_total = 0.0
+        self.batch_sizes = {}
+        self.worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, item):
+        """
+        Queue an item and return a Future resolved with its result.
+        """
+        future = Future()
+        self.pending.put((item, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                results = self.handler([item for item, _, _ in batch])
+            except Exception as e:
+                logging.error(f"Micro-batch of {len(batch)} items failed: {str(e)}")
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    self._run_each(batch)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            self._record(batch, started, time.perf_counter())
+
+    def _run_each(self, batch):
+        """Retry the items of a failed batch one at a time."""
+        for item, future, _ in batch:
+            try:
+                future.set_result(self.handler([item])[0])
+            except Exception as e:
+                future.set_exception(e)
+
+    def _record(self, batch, started, finished):
+        with self.lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.queue_wait_total += sum(started - submitted for _, _, submitted in batch)
+            self.handler_time_total += finished - started
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+    def stats(self):
+        """
+        Return batching counters: mean batch size, mean queue wait (the latency added by
+        batching) and mean handler time per batch.
+        """
+        with self.lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "mean_queue_wait_ms": 1000 * self.queue_wait_total / self.items if self.items else 0.0,
+                "mean_handler_ms": 1000 * self.handler_time_total / self.batches if self.batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            }
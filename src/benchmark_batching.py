@@ -0,0 +1,78 @@
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from batch_scheduler import MicroBatcher
+import search_engine
+
+def run_load(compute, queries, concurrency):
+    """
+    Fire every query from `concurrency` client threads; returns (wall seconds, latencies in ms).
+    """
+    def timed(query):
+        start = time.perf_counter()
+        compute(query)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, queries))
+    return time.perf_counter() - start, np.array(latencies)
+
+def benchmark_setting(queries, concurrency, max_wait_ms=None, max_batch_size=32, top_n=5):
+    """
+    Measure throughput and latency without batching (max_wait_ms=None) or with a micro-batcher.
+    """
+    if max_wait_ms is None:
+        compute = lambda query: search_engine.search_batch([(query, top_n, None, None, None)])[0]
+        batcher = None
+    else:
+        batcher = MicroBatcher(search_engine.search_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        compute = lambda query: batcher.submit((query, top_n, None, None, None)).result()
+
+    seconds, latencies = run_load(compute, queries, concurrency)
+    row = {
+        "window_ms": max_wait_ms,
+        "max_batch_size": max_batch_size if batcher else 1,
+        "concurrency": concurrency,
+        "queries_per_s": len(queries) / seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+    if batcher:
+        stats = batcher.stats()
+        row["mean_batch_size"] = stats["mean_batch_size"]
+        row["mean_queue_wait_ms"] = stats["mean_queue_wait_ms"]
+    return row
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput vs. latency of micro-batched query encoding and scoring.")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--windows", type=float, nargs="+", default=[1, 2, 5, 10])
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    search_engine.warm_up()
+
+    # Suffix catalog titles so every query is distinct and needs at least one encoder call
+    titles = [product["title"] for product in search_engine.catalog.metadata]
+    queries = [titles[i % len(titles)] + f" {i}" for i in range(args.queries)]
+
+    report = []
+    for concurrency in args.concurrency:
+        report.append(benchmark_setting(queries, concurrency))
+        for window in args.windows:
+            report.append(benchmark_setting(queries, concurrency, window, args.max_batch))
+
+    print(f"{'clients':>8}{'window':>8}{'batch':>7}{'q/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for row in report:
+        window = "-" if row["window_ms"] is None else f"{row['window_ms']:g}"
+        print(f"{row['concurrency']:>8}{window:>8}{row.get('mean_batch_size', 1):>7.1f}"
+              f"{row['queries_per_s']:>9.1f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
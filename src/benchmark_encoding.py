@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import time
+from itertools import islice
+from Compute_embeddings import encode_chunks_parallel, encode_worker_chunk, encoding_pool
+from json_stream import iter_chunks, iter_records
+
+def benchmark_workers(products, model_name, workers, threads_per_worker=None, batch_size=32, chunk_size=1000):
+    """
+    Encode the products on a pool of `workers` encoders and return one report row.
+    Pool startup (spawning workers and loading the models) is timed separately from encoding.
+    """
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    start = time.perf_counter()
+    with encoding_pool(model_name, workers, threads) as executor:
+        # One small chunk per worker starts every process and loads its model
+        list(executor.map(encode_worker_chunk, [products[:batch_size]] * workers))
+        startup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in encode_chunks_parallel(executor, iter_chunks(products, chunk_size), batch_size, max_pending=2 * workers):
+            pass
+        seconds = time.perf_counter() - start
+
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "products": len(products),
+        "startup_s": startup,
+        "encode_s": seconds,
+        "products_per_s": len(products) / seconds,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Products/sec of the multiprocess encoding pool per worker count.")
+    parser.add_argument("--input", default="./data/preprocessed.jsonl", help="Preprocessed products (JSON array or JSONL)")
+    parser.add_argument("--limit", type=int, default=20_000, help="Number of products to encode per setting")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads-per-worker", type=int, help="Intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    products = list(islice(iter_records(args.input), args.limit))
+    report = [
+        benchmark_workers(products, args.model, workers, args.threads_per_worker, args.batch_size, args.chunk_size)
+        for workers in args.workers
+    ]
+
+    baseline = report[0]["products_per_s"]
+    print(f"{'workers':>8}{'threads':>9}{'startup s':>11}{'products/s':>12}{'speedup':>9}")
+    for row in report:
+        print(f"{row['workers']:>8}{row['threads_per_worker']:>9}{row['startup_s']:>11.1f}"
+              f"{row['products_per_s']:>12.1f}{row['products_per_s'] / baseline:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
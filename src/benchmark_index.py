@@ -0,0 +1,132 @@
+import argparse
+import json
+import time
+import numpy as np
+from embedding_store import EmbeddingStore
+from vector_index import build_index, normalize_rows, resident_bytes
+
+def synthetic_embeddings(n_rows, dim=384, n_topics=1000, seed=0):
+    """
+    Generate clustered unit vectors that mimic the structure of real product embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    topics = normalize_rows(rng.standard_normal((n_topics, dim)).astype(np.float32))
+    vectors = topics[rng.integers(0, n_topics, size=n_rows)]
+    vectors += 0.6 * rng.standard_normal((n_rows, dim)).astype(np.float32) / np.sqrt(dim)
+    return normalize_rows(vectors)
+
+def make_queries(vectors, n_queries=200, noise=0.3, seed=1):
+    """
+    Build queries by perturbing random catalog rows.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(vectors[rng.choice(len(vectors), size=n_queries, replace=False)], dtype=np.float32)
+    rows += noise * rng.standard_normal(rows.shape).astype(np.float32) / np.sqrt(rows.shape[1])
+    return normalize_rows(rows)
+
+def time_queries(index, queries, k, **search_params):
+    """
+    Run every query through the index and return (result ids, latencies in ms).
+    """
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = index.search(query, k, **search_params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids)
+    return results, np.array(latencies)
+
+def recall_at_k(results, ground_truth):
+    """
+    Fraction of the exact top-k that the approximate search returned, averaged over queries.
+    """
+    return float(np.mean([len(np.intersect1d(r, g)) / len(g) for r, g in zip(results, ground_truth)]))
+
+def run_benchmark(vectors, queries, k=5, nlists=(256, 1024), nprobes=(1, 4, 8, 16, 32), reranks=(0, 4), pq_ms=(48,)):
+    """
+    Compare IVF and compressed (int8, pq) settings against the exact float32 scan and
+    return one report row per setting, with its recall loss and resident memory.
+    """
+    exact = build_index(vectors, "exact")
+    ground_truth, exact_latency = time_queries(exact, queries, k)
+    report = [{
+        "backend": "exact",
+        "recall_at_k": 1.0,
+        "recall_loss": 0.0,
+        "memory_mb": resident_bytes(exact) / 2**20,
+        "p50_ms": float(np.percentile(exact_latency, 50)),
+        "p95_ms": float(np.percentile(exact_latency, 95)),
+    }]
+
+    for nlist in nlists:
+        start = time.perf_counter()
+        index = build_index(vectors, "ivf", nlist=nlist)
+        build_seconds = time.perf_counter() - start
+        for nprobe in nprobes:
+            if nprobe > nlist:
+                continue
+            results, latency = time_queries(index, queries, k, nprobe=nprobe)
+            recall = recall_at_k(results, ground_truth)
+            report.append({
+                "backend": "ivf",
+                "nlist": nlist,
+                "nprobe": nprobe,
+                "build_s": round(build_seconds, 2),
+                "recall_at_k": recall,
+                "recall_loss": 1.0 - recall,
+                "memory_mb": resident_bytes(index) / 2**20,
+                "p50_ms": float(np.percentile(latency, 50)),
+                "p95_ms": float(np.percentile(latency, 95)),
+            })
+
+    compressed = [("int8", {})] + [("pq", {"m": m}) for m in pq_ms]
+    for backend, params in compressed:
+        start = time.perf_counter()
+        index = build_index(vectors, backend, **params)
+        build_seconds = time.perf_counter() - start
+        for rerank in reranks:
+            results, latency = time_queries(index, queries, k, rerank=rerank)
+            recall = recall_at_k(results, ground_truth)
+            report.append({
+                "backend": backend,
+                **params,
+                "rerank": rerank,
+                "build_s": round(build_seconds, 2),
+                "recall_at_k": recall,
+                "recall_loss": 1.0 - recall,
+                "memory_mb": resident_bytes(index) / 2**20,
+                "p50_ms": float(np.percentile(latency, 50)),
+                "p95_ms": float(np.percentile(latency, 95)),
+            })
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k, memory and latency of the IVF and compressed indexes against the exact scan.")
+    parser.add_argument("--store", help="Embedding store to benchmark (defaults to a synthetic catalog)")
+    parser.add_argument("--synthetic", type=int, default=1_000_000, help="Rows of the synthetic catalog")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, nargs="+", default=[256, 1024, 4096])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4, 8], help="Short list multipliers of the int8 and pq backends (0: no float re-rank)")
+    parser.add_argument("--pq-m", type=int, nargs="+", default=[48, 96], help="Subspaces of the pq backend")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = EmbeddingStore.open(args.store)["titles"]
+    else:
+        vectors = synthetic_embeddings(args.synthetic)
+    queries = make_queries(vectors, args.queries)
+
+    report = run_benchmark(vectors, queries, args.k, args.nlist, args.nprobe, args.rerank, args.pq_m)
+    print(f"{'backend':<8}{'nlist':>7}{'nprobe':>8}{'m':>5}{'rerank':>8}{'recall@' + str(args.k):>10}"
+          f"{'loss':>8}{'MB':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for row in report:
+        print(f"{row['backend']:<8}{row.get('nlist', '-'):>7}{row.get('nprobe', '-'):>8}{row.get('m', '-'):>5}"
+              f"{row.get('rerank', '-'):>8}{row['recall_at_k']:>10.3f}{row['recall_loss']:>8.3f}"
+              f"{row['memory_mb']:>10.1f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import random
+import time
+from preprocess import preprocess_data
+
+WORDS = ["wireless", "mouse", "usb-c", "charger", "stainless", "steel", "bottle", "Bluetooth®", "speaker",
+         "café", "ergonomic", "keyboard", "4K", "monitor", "cotton", "t-shirt", "non-stick", "pan", "LED", "lamp"]
+
+def synthetic_product(rng, index):
+    """
+    Generate a raw product shaped like the source dataset, with punctuation and non-ASCII text to clean.
+    """
+    words = lambda n: " ".join(rng.choice(WORDS) for _ in range(n))
+    return {
+        "title": f"{words(6)} #{index}",
+        "description": words(60) + ".",
+        "categories": [words(2).title() for _ in range(3)],
+        "features": [words(8) + "!" for _ in range(5)],
+        "product_details": [{"type": words(1).title(), "value": words(2)} for _ in range(4)],
+    }
+
+def write_synthetic_dataset(path, size_mb, seed=0):
+    """
+    Write a JSON array of synthetic products of roughly size_mb megabytes; returns the product count.
+    """
+    rng = random.Random(seed)
+    count, target = 0, size_mb * 1024 * 1024
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("[\n")
+        while file.tell() < target:
+            if count:
+                file.write(",\n")
+            file.write(json.dumps(synthetic_product(rng, count), ensure_ascii=False))
+            count += 1
+        file.write("\n]\n")
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Records/sec of streaming, parallel preprocessing per worker count.")
+    parser.add_argument("--input", help="Raw products file (JSON array or JSONL); omit to generate a synthetic one")
+    parser.add_argument("--synthetic-mb", type=int, default=1024, help="Size of the generated dataset in MB")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    input_file = args.input
+    if input_file is None:
+        input_file = "./data/synthetic_products.json"
+        print(f"Generated {write_synthetic_dataset(input_file, args.synthetic_mb)} products in {input_file}")
+    input_mb = os.path.getsize(input_file) / (1024 * 1024)
+    output_file = "./data/benchmark_preprocessed.jsonl"
+
+    report = []
+    for workers in args.workers:
+        start = time.perf_counter()
+        count = preprocess_data(input_file, output_file, workers, args.chunk_size)
+        seconds = time.perf_counter() - start
+        report.append({
+            "workers": workers,
+            "records": count,
+            "input_mb": input_mb,
+            "seconds": seconds,
+            "records_per_s": count / seconds,
+            "mb_per_s": input_mb / seconds,
+        })
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+    print(f"{'workers':>8}{'records':>10}{'seconds':>9}{'records/s':>11}{'MB/s':>8}")
+    for row in report:
+        print(f"{row['workers']:>8}{row['records']:>10}{row['seconds']:>9.1f}{row['records_per_s']:>11.0f}{row['mb_per_s']:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+import numpy as np
+from benchmark_preprocess import synthetic_product
+from Compute_embeddings import compute_embeddings
+from preprocess import preprocess_data
+
+# Encoder used by every stage of the suite: deterministic and offline (see stub_encoder)
+BENCHMARK_MODEL = "stub"
+
+def write_synthetic_catalog(path, n_products, seed=0):
+    """
+    Write n_products raw synthetic products as JSON Lines.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as file:
+        for index in range(n_products):
+            file.write(json.dumps(synthetic_product(rng, index), ensure_ascii=False) + "\n")
+
+def latency_report(latencies_ms, seconds):
+    """
+    Percentiles of per-call latencies and the throughput of a run.
+    """
+    return {
+        "calls": len(latencies_ms),
+        "seconds": seconds,
+        "per_s": len(latencies_ms) / seconds if seconds else 0.0,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+def benchmark_indexing(workdir, n_products, preprocess_workers=None, embed_workers=1, chunk_size=10_000):
+    """
+    Generate a catalog, then time preprocess_data and compute_embeddings over it.
+    """
+    raw_path = os.path.join(workdir, "raw.jsonl")
+    preprocessed_path = os.path.join(workdir, "preprocessed.jsonl")
+    store_path = os.path.join(workdir, "embedding_store")
+
+    start = time.perf_counter()
+    write_synthetic_catalog(raw_path, n_products)
+    generate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    records = preprocess_data(raw_path, preprocessed_path, preprocess_workers)
+    preprocess_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compute_embeddings(preprocessed_path, os.path.join(workdir, "product_metadata.json"), store_path,
+                       model_name=BENCHMARK_MODEL, chunk_size=chunk_size, workers=embed_workers)
+    embed_seconds = time.perf_counter() - start
+
+    return {
+        "generate_s": generate_seconds,
+        "preprocess": {
+            "records": records,
+            "input_mb": os.path.getsize(raw_path) / (1024 * 1024),
+            "seconds": preprocess_seconds,
+            "records_per_s": records / preprocess_seconds,
+        },
+        "compute_embeddings": {
+            "workers": embed_workers,
+            "seconds": embed_seconds,
+            "products_per_s": n_products / embed_seconds,
+        },
+    }
+
+def benchmark_search_products(search_engine, queries, concurrency_levels, top_n=5):
+    """
+    Latency and throughput of search_products per client concurrency. Every run uses fresh
+    queries so each call computes its results; a second pass over the same queries measures
+    cache hits.
+    """
+    from benchmark_batching import run_load
+
+    report = []
+    for concurrency in concurrency_levels:
+        run_queries = [f"{query} c{concurrency}" for query in queries]
+        search = lambda query: search_engine.search_products("benchmark", query, top_n)
+        seconds, latencies = run_load(search, run_queries, concurrency)
+        cached_seconds, cached_latencies = run_load(search, run_queries, concurrency)
+        report.append({
+            "concurrency": concurrency,
+            "uncached": latency_report(latencies, seconds),
+            "cached": latency_report(cached_latencies, cached_seconds),
+        })
+    return report
+
+def post_chat(url, query):
+    request = urllib.request.Request(url, data=json.dumps({"user_id": "benchmark", "query": query}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+
+def benchmark_chat(url, queries, concurrency_levels):
+    """
+    POST /chat under concurrent load over HTTP; each client thread sends one request at a time.
+    """
+    from benchmark_batching import run_load
+
+    report = []
+    for concurrency in concurrency_levels:
+        run_queries = [f"{query} chat c{concurrency}" for query in queries]
+        seconds, latencies = run_load(lambda query: post_chat(url, query), run_queries, concurrency)
+        report.append({"concurrency": concurrency, **latency_report(latencies, seconds)})
+    return report
+
+def run_search_benchmarks(args):
+    """
+    Search and /chat benchmarks against the store in args.search_store. Runs in its own process
+    (see benchmark_search), because search_engine reads its configuration when it is imported.
+    """
+    import search_engine
+
+    if not args.redis:
+        # L1 cache only, so the run needs no Redis server
+        search_engine.redis_client = None
+        search_engine.result_cache.redis_client = None
+
+    timings = dict(search_engine.warm_up())
+    if args.index != "exact":
+        from vector_index import build_index
+
+        start = time.perf_counter()
+        search_engine.catalog.engine.index = build_index(search_engine.catalog.engine.combined, args.index)
+        timings["index_build"] = time.perf_counter() - start
+
+    metadata = search_engine.catalog.metadata
+    queries = [metadata[i % len(metadata)]["title"] + f" q{i}" for i in range(args.queries)]
+    report = {"startup_s": timings, "search_products": benchmark_search_products(search_engine, queries, args.concurrency)}
+
+    url = args.chat_url
+    server = None
+    if url is None:
+        from werkzeug.serving import make_server
+        from app import app
+
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/chat"
+    try:
+        report["chat"] = benchmark_chat(url, queries[:args.chat_requests], args.concurrency)
+    finally:
+        if server:
+            server.shutdown()
+    report["cache"] = search_engine.result_cache.stats()
+    return report
+
+def benchmark_search(store_path, args):
+    """
+    Run the search benchmarks over a store in a fresh interpreter configured for it.
+    """
+    result_path = os.path.join(os.path.dirname(store_path), "search_report.json")
+    command = [sys.executable, os.path.abspath(__file__), "--search-store", store_path, "--search-result", result_path,
+               "--index", args.index, "--queries", str(args.queries), "--chat-requests", str(args.chat_requests),
+               "--concurrency", *map(str, args.concurrency)]
+    if args.redis:
+        command.append("--redis")
+    if args.chat_url:
+        command += ["--chat-url", args.chat_url]
+    env = {
+        **os.environ,
+        "SEARCH_STORE_PATH": store_path,
+        "SEARCH_MODEL": BENCHMARK_MODEL,
+        "SEARCH_NLTK_DOWNLOAD": "0",
+        "SEARCH_INDEX_PATH": os.path.join(os.path.dirname(store_path), "no_index.npz"),
+        "SEARCH_WARM_CACHE_PATH": "",
+    }
+    subprocess.run(command, env=env, check=True)
+    with open(result_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def flatten(report, prefix=""):
+    """
+    Flatten a report into {"path.to.metric": value} for its numeric leaves.
+    """
+    if isinstance(report, dict):
+        items = report.items()
+    elif isinstance(report, list):
+        items = ((row.get("concurrency", index) if isinstance(row, dict) else index, row) for index, row in enumerate(report))
+    else:
+        return {prefix: report} if isinstance(report, (int, float)) and not isinstance(report, bool) else {}
+    flat = {}
+    for key, value in items:
+        flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+def compare_reports(baseline, current):
+    """
+    Print the timing and throughput metrics two reports have in common, with the relative change.
+    """
+    old, new = flatten(baseline["catalogs"]), flatten(current["catalogs"])
+    print(f"{baseline['commit'][:12]} -> {current['commit'][:12]}")
+    print(f"{'metric':<60}{'baseline':>12}{'current':>12}{'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        if key.endswith(("_ms", "_s", "seconds", "per_s")) and old[key]:
+            print(f"{key:<60}{old[key]:>12.2f}{new[key]:>12.2f}{(new[key] - old[key]) / old[key]:>+9.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of indexing and search over synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Products per synthetic catalog")
+    parser.add_argument("--workdir", default="./data/benchmark", help="Scratch directory for the generated catalogs and stores")
+    parser.add_argument("--preprocess-workers", type=int, default=None)
+    parser.add_argument("--embed-workers", type=int, default=1)
+    parser.add_argument("--index", choices=["exact", "ivf", "int8", "pq"], default="exact", help="Vector index searched")
+    parser.add_argument("--queries", type=int, default=500, help="search_products calls per concurrency level")
+    parser.add_argument("--chat-requests", type=int, default=200, help="/chat requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--chat-url", help="Load-test a running server's /chat instead of an in-process Flask server")
+    parser.add_argument("--redis", action="store_true", help="Use the configured Redis server as the L2 cache")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated catalogs and stores")
+    parser.add_argument("--output", help="Report path (default: data/benchmarks/<commit>.json)")
+    parser.add_argument("--compare", help="Baseline report to compare the new report with")
+    parser.add_argument("--search-store", help=argparse.SUPPRESS)
+    parser.add_argument("--search-result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.search_store:
+        with open(args.search_result, "w", encoding="utf-8") as file:
+            json.dump(run_search_benchmarks(args), file, indent=4)
+        sys.exit(0)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "encoder": BENCHMARK_MODEL,
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "settings": {key: value for key, value in vars(args).items() if not key.startswith("search_")},
+        "catalogs": {},
+    }
+
+    for size in args.sizes:
+        workdir = os.path.join(args.workdir, str(size))
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        print(f"Benchmarking a catalog of {size} products")
+        catalog = benchmark_indexing(workdir, size, args.preprocess_workers, args.embed_workers)
+        catalog.update(benchmark_search(os.path.join(workdir, "embedding_store"), args))
+        report["catalogs"][str(size)] = catalog
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        for row in catalog["search_products"]:
+            print(f"  search_products x{row['concurrency']}: {row['uncached']['per_s']:.0f} q/s, "
+                  f"p50 {row['uncached']['p50_ms']:.1f} ms, p99 {row['uncached']['p99_ms']:.1f} ms")
+        for row in catalog["chat"]:
+            print(f"  /chat x{row['concurrency']}: {row['per_s']:.0f} req/s, p50 {row['p50_ms']:.1f} ms, p99 {row['p99_ms']:.1f} ms")
+
+    output = args.output or os.path.join("./data/benchmarks", f"{commit[:12]}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare_reports(json.load(file), report)
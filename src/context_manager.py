@@ -1,39 +1,126 @@
 import redis
 import json
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Connect to Redis
+# Redis connection settings
 redis_host = os.getenv("REDIS_HOST", "localhost")
 redis_port = int(os.getenv("REDIS_PORT", 6379))
-redis_client = redis.StrictRedis(host=redis_host, port=redis_port, decode_responses=True)
+redis_db = int(os.getenv("REDIS_DB", 0))
+
+# Conversation turns kept per session, and seconds a session lives after its last read or write
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", 20))
+CONTEXT_TTL = int(os.getenv("CONTEXT_TTL", 86_400))
+
+# One pooled client per process, created on first use
+redis_client = None
+redis_client_lock = threading.Lock()
+
+def redis_settings():
+    """
+    Connection settings shared by the sync client and the asyncio server's client, so both
+    use the same server and DB. The pool is sized by REDIS_MAX_CONNECTIONS and
+    REDIS_SOCKET_TIMEOUT (seconds) bounds every command, so a stalled server cannot hang requests.
+    """
+    socket_timeout = os.getenv("REDIS_SOCKET_TIMEOUT")
+    return {
+        "host": redis_host,
+        "port": redis_port,
+        "db": redis_db,
+        "max_connections": int(os.getenv("REDIS_MAX_CONNECTIONS", 100)),
+        "socket_timeout": float(socket_timeout) if socket_timeout else None,
+        "decode_responses": True,
+    }
+
+def get_redis_client():
+    """
+    Returns the process-wide Redis client, pooled with the redis_settings.
+    """
+    global redis_client
+    with redis_client_lock:
+        if redis_client is None:
+            redis_client = redis.StrictRedis(connection_pool=redis.ConnectionPool(**redis_settings()))
+    return redis_client
+
+def context_key(session_id):
+    return f"context:{session_id}"
+
+def decode_turns(entries):
+    return [json.loads(entry) for entry in entries]
 
 class ContextManager:
-    def __init__(self, session_id):
+    """
+    Conversation context of one session, kept in Redis as a list capped at `max_turns`
+    whose TTL slides forward on every read and write.
+
+    The queue_* methods add commands to a pipeline (sync or asyncio), so callers can combine
+    context reads and writes with other Redis work in one round-trip. `client` defaults to the
+    process-wide pooled client; pass any redis-py compatible client (e.g. fakeredis) instead.
+    """
+
+    def __init__(self, session_id, client=None, max_turns=CONTEXT_MAX_TURNS, ttl=CONTEXT_TTL):
         """Initialize context storage for a specific session."""
         self.session_id = session_id  # Unique ID for each user/session
+        self.client = client
+        self.max_turns = max_turns
+        self.ttl = ttl
+
+    @property
+    def key(self):
+        return context_key(self.session_id)
+
+    def redis(self):
+        return self.client if self.client is not None else get_redis_client()
+
+    def queue_store_context(self, pipe, user_query, bot_response):
+        """Queues appending a turn, trimming the list to max_turns and renewing its TTL."""
+        pipe.rpush(self.key, json.dumps({"query": user_query, "response": bot_response}))
+        pipe.ltrim(self.key, -self.max_turns, -1)
+        pipe.expire(self.key, self.ttl)
+
+    def queue_get_context(self, pipe, last_n=5):
+        """Queues renewing the TTL and reading the last n turns; the read is the last reply."""
+        pipe.expire(self.key, self.ttl)
+        pipe.lrange(self.key, -last_n, -1)
 
     def store_context(self, user_query, bot_response):
-        """Store user query and bot response in Redis."""
-        conversation = {"query": user_query, "response": bot_response}
-        redis_client.rpush(f"context:{self.session_id}", json.dumps(conversation))
+        """Store user query and bot response in Redis, in one round-trip."""
+        with self.redis().pipeline(transaction=False) as pipe:
+            self.queue_store_context(pipe, user_query, bot_response)
+            pipe.execute()
 
     def get_context(self, last_n=5):
         """Retrieve the last 'n' conversations from Redis."""
-        conversations = redis_client.lrange(f"context:{self.session_id}", -last_n, -1)
-        return [json.loads(conv) for conv in conversations]
+        with self.redis().pipeline(transaction=False) as pipe:
+            self.queue_get_context(pipe, last_n)
+            return decode_turns(pipe.execute()[-1])
 
     def clear_context(self):
         """Clear stored context for this session."""
-        redis_client.delete(f"context:{self.session_id}")
+        self.redis().delete(self.key)
+
+def get_contexts(session_ids, last_n=5, client=None, ttl=CONTEXT_TTL):
+    """
+    Retrieves the last n turns of many sessions in one pipelined round-trip.
+    Returns {session id: [turn, ...]}; sessions without context map to [].
+    """
+    sessions = [ContextManager(session_id, client, ttl=ttl) for session_id in session_ids]
+    if not sessions:
+        return {}
+    with sessions[0].redis().pipeline(transaction=False) as pipe:
+        for session in sessions:
+            session.queue_get_context(pipe, last_n)
+        replies = pipe.execute()
+    return {session.session_id: decode_turns(replies[2 * i + 1]) for i, session in enumerate(sessions)}
 
 # Example usage
 if __name__ == "__main__":
     session = ContextManager("user_123")  # Unique user session
     session.store_context("Who is Elon Musk?", "Elon Musk is the CEO of Tesla.")
     session.store_context("Where was he born?", "He was born in South Africa.")
-    
+
     print("Stored Context:", session.get_context())  # Retrieve stored conversations
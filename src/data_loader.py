@@ -1,62 +1,45 @@
-import logging
-from neo4j_integration import Neo4jConnection
+import argparse
 import json
-import os
+import logging
+from embedding_store import CONTENT_FILE, DEFAULT_STORE_PATH, METADATA_FILE, EmbeddingStore
+from json_stream import iter_jsonl
+from neo4j_integration import bulk_load_products, close_neo4j_driver
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
-
-def load_products_to_neo4j(products):
+logging.basicConfig(level=logging.INFO)
+
+def iter_store_products(store_path):
+    """
+    Yields (product key, metadata) for every live product of an embedding store.
+    Products are keyed like the store's content.jsonl, so graph nodes can be matched
+    to embedding rows; tombstoned rows are skipped.
+    """
+    store = EmbeddingStore.open(store_path)
+    deleted = set(store.deleted.tolist())
+    rows = zip(iter_jsonl(store.file_path(METADATA_FILE)), iter_jsonl(store.file_path(CONTENT_FILE)))
+    for row, (metadata, content) in enumerate(rows):
+        if row not in deleted:
+            yield content['key'], metadata
+
+def load_products_to_neo4j(store_path=DEFAULT_STORE_PATH, batch_size=1000, parallelism=1, graph_driver=None):
+    """
+    Bulk-loads the products of an embedding store into Neo4j and returns the load report.
+    """
     try:
-        # Create a Neo4jConnection instance with the correct IP address
-        neo4j_connection = Neo4jConnection(
-            uri="bolt://172.28.32.1:7687",  # IP address of our Neo4j instance
-            user="neo4j",  # Your Neo4j username
-            password="your_password"  # Your Neo4j password
-        )
-
-        neo4j_connection.connect()
-
-        for product in products:
-            logging.debug(f"Processing product: {product}")
-            add_product_to_neo4j(neo4j_connection, product)
-
-        neo4j_connection.close()
-        logging.debug("Finished loading products into Neo4j.")
-    
+        return bulk_load_products(iter_store_products(store_path), graph_driver, batch_size, parallelism)
     except Exception as e:
         logging.error(f"Error loading products into Neo4j: {str(e)}")
-
-def add_product_to_neo4j(connection, product, product_id=None):
-    try:
-        # If no product_id is provided, generate a unique one based on the title or other fields
-        if not product_id:
-            product_id = f"{product['title'][:10]}_{product['categories'][0][:5]}"
-
-        query = f"""
-        CREATE (p:Product {{
-            id: '{product_id}',
-            title: '{product['title']}',
-            description: '{product['description']}',
-            category: '{', '.join(product['categories'])}',
-            features: '{', '.join(product['features'])}'
-        }})
-        """
-        connection.run_query(query)
-        logging.debug(f"Successfully added product: {product['title']}")
-    except Exception as e:
-        logging.error(f"Error adding product to Neo4j: {str(e)}")
+    finally:
+        if graph_driver is None:
+            close_neo4j_driver()
 
 if __name__ == "__main__":
-    # Define the path to your preprocessed JSON file
-    data_file_path = os.path.join(os.path.dirname(__file__), "../data/preprocessed.json")
-    
-    try:
-        # Load products from the preprocessed JSON file
-        with open(data_file_path, "r") as file:
-            products = json.load(file)
-
-        load_products_to_neo4j(products)
-    
-    except Exception as e:
-        logging.error(f"Error reading products file {data_file_path}: {str(e)}")
+    parser = argparse.ArgumentParser(description="Load the embedded product catalog into Neo4j in UNWIND batches.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Embedding store whose products are loaded")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Products per UNWIND batch")
+    parser.add_argument("--parallel", type=int, default=1, help="Batches written concurrently")
+    args = parser.parse_args()
+
+    report = load_products_to_neo4j(args.store, args.batch_size, args.parallel)
+    if report:
+        print(json.dumps(report, indent=4))
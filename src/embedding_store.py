@@ -0,0 +1,464 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import struct
+import numpy as np
+from vector_index import normalize_rows
+
+# Default location of the embedding store directory
+DEFAULT_STORE_PATH = "./data/embedding_store"
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+# Row-aligned JSONL sidecars written next to the matrices by the embedding pipeline
+METADATA_FILE = "metadata.jsonl"  # Product metadata
+CONTENT_FILE = "content.jsonl"  # Product key and per-field content hashes, for incremental updates
+TEXT_FILE = "text.jsonl"  # Preprocessed combined text, for lexical search
+
+# Every matrix file starts with a fixed-size header followed by the raw row-major matrix:
+# magic, format version, dtype code, rows, dim, padded to HEADER_SIZE bytes
+HEADER_MAGIC = b"SEMB"
+HEADER_FORMAT = "<4sHHQQ"
+HEADER_SIZE = 64
+
+DTYPE_CODES = {"float32": 0, "float16": 1}
+CODE_DTYPES = {code: name for name, code in DTYPE_CODES.items()}
+
+# Files replaced by an incremental update get the new version's tag before their extension,
+# e.g. metadata.<tag>.jsonl; the manifest maps each file's name to the file of its version
+VERSION_TAG_LENGTH = 12
+VERSIONED_FILE = re.compile(r".+\.[0-9a-f]{%d}\.[a-z]+" % VERSION_TAG_LENGTH)
+
+
+def matrix_file(field):
+    return f"{field}.emb"
+
+
+def matrix_path(store_path, field):
+    return os.path.join(store_path, matrix_file(field))
+
+
+def versioned_name(name, version):
+    root, extension = os.path.splitext(name)
+    return f"{root}.{version[:VERSION_TAG_LENGTH]}{extension}"
+
+
+def manifest_file(manifest, name):
+    """
+    File holding a store file (a field matrix or a sidecar) in the version a manifest describes.
+    """
+    return manifest.get("files", {}).get(name, name)
+
+
+def manifest_files(manifest):
+    """
+    Every file the version a manifest describes reads from.
+    """
+    names = {matrix_file(field) for field in manifest["fields"]} | set(manifest.get("files", {}))
+    return {manifest_file(manifest, name) for name in names}
+
+
+def pack_header(rows, dim, dtype):
+    """
+    Build the fixed-size header for a matrix file.
+    """
+    header = struct.pack(HEADER_FORMAT, HEADER_MAGIC, FORMAT_VERSION, DTYPE_CODES[dtype], rows, dim)
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def read_header(path):
+    """
+    Read (rows, dim, dtype) from a matrix file header.
+    """
+    with open(path, "rb") as file:
+        raw = file.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f"Truncated embedding file: {path}")
+    magic, version, dtype_code, rows, dim = struct.unpack_from(HEADER_FORMAT, raw)
+    if magic != HEADER_MAGIC:
+        raise ValueError(f"Not an embedding store file: {path}")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding store version {version} in {path}")
+    return rows, dim, CODE_DTYPES[dtype_code]
+
+
+def write_matrix(path, matrix, dtype="float32", chunk_size=65_536, normalize=True):
+    """
+    L2-normalize a matrix (unless `normalize` is False) and write it with its header.
+    Returns the SHA-1 of the data.
+    """
+    rows, dim = matrix.shape
+    digest = hashlib.sha1()
+    with open(path, "wb") as file:
+        file.write(pack_header(rows, dim, dtype))
+        for start in range(0, rows, chunk_size):
+            block = matrix[start:start + chunk_size]
+            if normalize:
+                block = normalize_rows(block)
+            block = np.asarray(block).astype(dtype).tobytes()
+            digest.update(block)
+            file.write(block)
+    return digest.hexdigest()
+
+
+def open_matrix(path):
+    """
+    Memory-map a matrix file read-only; pages are shared between processes through the OS cache.
+    """
+    rows, dim, dtype = read_header(path)
+    if rows == 0:
+        return np.empty((0, dim), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(rows, dim))
+
+
+def write_store(store_path, fields, dtype="float32"):
+    """
+    Write one normalized matrix per field plus a manifest. `fields` maps field name to a 2D array;
+    all fields must have the same shape. float16 halves the on-disk and resident size.
+    """
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+    shapes = {np.shape(matrix) for matrix in fields.values()}
+    if len(shapes) != 1:
+        raise ValueError(f"All fields must have the same shape, got {shapes}")
+    rows, dim = shapes.pop()
+
+    staging_path = f"{store_path}.partial"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    os.makedirs(staging_path)
+    digests = {field: write_matrix(matrix_path(staging_path, field), matrix, dtype) for field, matrix in fields.items()}
+    write_manifest(staging_path, list(fields), rows, dim, dtype, digests)
+    replace_store(staging_path, store_path)
+
+
+def replace_store(staging_path, store_path):
+    """
+    Swap a fully written staging directory in place of the live store. Processes that still
+    map the old files keep reading them until they reopen the store.
+    """
+    retired_path = f"{store_path}.old"
+    shutil.rmtree(retired_path, ignore_errors=True)
+    if os.path.exists(store_path):
+        os.replace(store_path, retired_path)
+    os.replace(staging_path, store_path)
+    shutil.rmtree(retired_path, ignore_errors=True)
+
+
+def hash_file(path, offset=0, block_size=1 << 24):
+    """
+    SHA-1 of a file's bytes from `offset` on.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        file.seek(offset)
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_matrix_file(path):
+    """
+    SHA-1 of a matrix file's data (header excluded), matching write_matrix's digest.
+    """
+    return hash_file(path, HEADER_SIZE)
+
+
+def store_version(fields, digests, deleted, files_digest=""):
+    payload = "".join(digests[field] for field in fields) + (json.dumps(deleted) if deleted else "") + files_digest
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def write_manifest(store_path, fields, rows, dim, dtype, digests, deleted=None, delta=None, version=None, files=None, superseded=None):
+    """
+    Write the store manifest; `version` changes whenever any matrix content, the set of
+    deleted (tombstoned) rows or a sidecar replaced by an update changes. `delta` describes an incremental update relative to
+    the previous version so live readers can patch their indexes instead of rebuilding them.
+    `files` maps store files to the versioned files holding them (see apply_delta) and
+    `superseded` lists the files of the previous version this one replaced.
+    """
+    deleted = sorted(int(row) for row in (deleted or []))
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "fields": fields,
+        "rows": rows,
+        "dim": dim,
+        "dtype": dtype,
+        "version": version or store_version(fields, digests, deleted),
+        "deleted": deleted,
+    }
+    if files:
+        manifest["files"] = files
+        manifest["superseded"] = superseded or []
+    if delta:
+        manifest["delta"] = delta
+    # Write-then-rename so readers never observe a half-written manifest
+    tmp_path = os.path.join(store_path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, os.path.join(store_path, MANIFEST_FILE))
+    return manifest
+
+
+def apply_delta(store_path, updated=None, appended=None, deleted=None, files=None):
+    """
+    Publish an incremental update of a store as a new manifest version.
+
+    `updated` maps field -> (row ids, vectors), `appended` maps field -> vectors (every
+    field must get the same number of new rows) and `deleted` lists the tombstoned row ids.
+    `files` maps sidecar names (metadata.jsonl, ...) to fully written replacements, which are
+    moved into the store.
+
+    The live files are never modified: each changed field matrix is copied and patched, and
+    every new file is stored under a name tagged with the new version. Renaming the manifest
+    is the only commit point, so a crash leaves the previous version intact and processes
+    that map its files never see half-applied rows. Files of the version before the previous
+    one are removed afterwards; readers pick up the change by reopening the store.
+    """
+    store = EmbeddingStore.open(store_path)
+    manifest = store.manifest
+    row_bytes = manifest["dim"] * np.dtype(manifest["dtype"]).itemsize
+    new_rows = {len(vectors) for vectors in (appended or {}).values()}
+    if len(new_rows) > 1:
+        raise ValueError(f"All fields must append the same number of rows, got {new_rows}")
+    rows = manifest["rows"] + (new_rows.pop() if new_rows else 0)
+
+    staged = dict(files or {})  # store file name -> path of its new version
+    updated_rows = set()
+    for field in manifest["fields"]:
+        field_rows, vectors = (updated or {}).get(field, ([], None))
+        if not len(field_rows) and not appended:
+            continue
+        staged_path = os.path.join(store_path, f"{matrix_file(field)}.tmp")
+        shutil.copyfile(store.file_path(matrix_file(field)), staged_path)
+        with open(staged_path, "r+b") as file:
+            for row, vector in zip(field_rows, normalize_rows(vectors) if len(field_rows) else []):
+                file.seek(HEADER_SIZE + int(row) * row_bytes)
+                file.write(vector.astype(manifest["dtype"]).tobytes())
+                updated_rows.add(int(row))
+            if appended:
+                file.seek(HEADER_SIZE + manifest["rows"] * row_bytes)
+                file.write(normalize_rows(appended[field]).astype(manifest["dtype"]).tobytes())
+            file.seek(0)
+            file.write(pack_header(rows, manifest["dim"], manifest["dtype"]))
+            file.flush()
+            os.fsync(file.fileno())
+        staged[matrix_file(field)] = staged_path
+
+    digests = {field: hash_matrix_file(staged.get(matrix_file(field), store.file_path(matrix_file(field))))
+               for field in manifest["fields"]}
+    deleted = sorted(set(manifest.get("deleted", [])) | {int(row) for row in (deleted or [])})
+    # Sidecar-only changes (e.g. a new description) make a new version too
+    matrices = {matrix_file(field) for field in manifest["fields"]}
+    files_digest = "".join(f"{name}{hash_file(staged[name])}" for name in sorted(staged) if name not in matrices)
+    version = store_version(manifest["fields"], digests, deleted, files_digest)
+
+    names = {name: manifest_file(manifest, name) for name in manifest.get("files", {})}
+    for name, path in staged.items():
+        names[name] = versioned_name(name, version)
+        with open(path, "rb") as file:
+            os.fsync(file.fileno())
+        os.replace(path, os.path.join(store_path, names[name]))
+    superseded = [manifest_file(manifest, name) for name in staged if manifest_file(manifest, name) != names[name]]
+
+    delta = {
+        "base_version": manifest["version"],
+        "base_rows": manifest["rows"],
+        "updated_rows": sorted(updated_rows),
+    }
+    new_manifest = write_manifest(store_path, manifest["fields"], rows, manifest["dim"], manifest["dtype"], digests,
+                                  deleted=deleted, delta=delta, version=version, files=names, superseded=superseded)
+    remove_unreferenced_files(store_path, manifest, new_manifest)
+
+
+def remove_unreferenced_files(store_path, previous, current):
+    """
+    After an update from the `previous` manifest to the `current` one, remove the files the
+    previous version superseded and versioned files of failed updates. Files of both versions
+    are kept, so readers still loading the previous version find all of its files.
+    """
+    keep = manifest_files(previous) | manifest_files(current)
+    candidates = set(previous.get("superseded", [])) | {name for name in os.listdir(store_path) if VERSIONED_FILE.fullmatch(name)}
+    for name in candidates - keep:
+        try:
+            os.remove(os.path.join(store_path, name))
+        except FileNotFoundError:
+            pass
+
+
+class StoreWriter:
+    """
+    Builds a store chunk by chunk in a staging directory (`<store>.partial`).
+
+    Rows are appended to each field file as they are encoded and `checkpoint()` records
+    how many rows are durable. If the build is interrupted, a new writer with the same
+    `build_info` truncates any rows written after the last checkpoint and resumes from
+    there; `resume_state` returns the caller's state saved with that checkpoint.
+    """
+
+    CHECKPOINT_FILE = "checkpoint.json"
+
+    def __init__(self, store_path, fields, dim, dtype="float32", build_info=None):
+        if dtype not in DTYPE_CODES:
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self.store_path = store_path
+        self.staging_path = f"{store_path}.partial"
+        self.fields = list(fields)
+        self.dim = dim
+        self.dtype = dtype
+        self.build_info = {"fields": self.fields, "dim": dim, "dtype": dtype, **(build_info or {})}
+        self.row_bytes = dim * np.dtype(dtype).itemsize
+
+        checkpoint = self._load_checkpoint()
+        if checkpoint is None:
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+            os.makedirs(self.staging_path)
+            for field in self.fields:
+                with open(matrix_path(self.staging_path, field), "wb") as file:
+                    file.write(pack_header(0, dim, dtype))
+            checkpoint = {"rows": 0, "state": {}}
+        else:
+            logging.info(f"Resuming embedding build at row {checkpoint['rows']}")
+
+        self.rows = checkpoint["rows"]
+        self.resume_state = checkpoint["state"]
+        self.files = {}
+        for field in self.fields:
+            file = open(matrix_path(self.staging_path, field), "r+b")
+            file.truncate(HEADER_SIZE + self.rows * self.row_bytes)  # drop rows past the checkpoint
+            file.seek(0, os.SEEK_END)
+            self.files[field] = file
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.staging_path, self.CHECKPOINT_FILE), "r", encoding="utf-8") as file:
+                checkpoint = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if checkpoint.get("build_info") != self.build_info:
+            logging.warning("Existing partial build has different settings, starting over")
+            return None
+        return checkpoint
+
+    def append(self, chunk):
+        """
+        Normalize and append one chunk; `chunk` maps every field to a (rows, dim) array.
+        """
+        sizes = {len(chunk[field]) for field in self.fields}
+        if len(sizes) != 1:
+            raise ValueError(f"All fields of a chunk must have the same number of rows, got {sizes}")
+        for field in self.fields:
+            self.files[field].write(normalize_rows(chunk[field]).astype(self.dtype).tobytes())
+        self.rows += sizes.pop()
+
+    def checkpoint(self, state=None):
+        """
+        Make the appended rows durable and record them, with the caller's `state`, as resumable.
+        """
+        for file in self.files.values():
+            file.seek(0)
+            file.write(pack_header(self.rows, self.dim, self.dtype))
+            file.seek(0, os.SEEK_END)
+            file.flush()
+            os.fsync(file.fileno())
+
+        checkpoint_path = os.path.join(self.staging_path, self.CHECKPOINT_FILE)
+        with open(checkpoint_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"build_info": self.build_info, "rows": self.rows, "state": state or {}}, file)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+        self.resume_state = state or {}
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+    def finalize(self):
+        """
+        Write the manifest and swap the staging directory in as the live store.
+        """
+        self.checkpoint(self.resume_state)
+        self.close()
+        digests = {field: hash_matrix_file(matrix_path(self.staging_path, field)) for field in self.fields}
+        write_manifest(self.staging_path, self.fields, self.rows, self.dim, self.dtype, digests)
+        os.remove(os.path.join(self.staging_path, self.CHECKPOINT_FILE))
+        replace_store(self.staging_path, self.store_path)
+
+
+class EmbeddingStore:
+    """
+    Read-only view over a store directory: one memory-mapped, L2-normalized matrix per field.
+    Scoring against it is a plain dot product.
+    """
+
+    def __init__(self, manifest, matrices, path=None):
+        self.manifest = manifest
+        self.matrices = matrices
+        self.path = path
+
+    @classmethod
+    def open(cls, store_path=DEFAULT_STORE_PATH):
+        with open(os.path.join(store_path, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding store version: {manifest.get('format_version')}")
+
+        matrices = {field: open_matrix(os.path.join(store_path, manifest_file(manifest, matrix_file(field))))
+                    for field in manifest["fields"]}
+        for field, matrix in matrices.items():
+            if matrix.shape != (manifest["rows"], manifest["dim"]):
+                raise ValueError(f"Field '{field}' has shape {matrix.shape}, manifest says "
+                                 f"{(manifest['rows'], manifest['dim'])}")
+        return cls(manifest, matrices, store_path)
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    def file_path(self, name):
+        """Path of a store file (a field matrix or a sidecar such as metadata.jsonl) in this version."""
+        return os.path.join(self.path, manifest_file(self.manifest, name))
+
+    @property
+    def deleted(self):
+        """Row ids tombstoned by incremental updates; they must never be returned."""
+        return np.asarray(self.manifest.get("deleted", []), dtype=np.int64)
+
+    @property
+    def fields(self):
+        return list(self.matrices)
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def __contains__(self, field):
+        return field in self.matrices
+
+    def __getitem__(self, field):
+        return self.matrices[field]
+
+
+def convert_legacy(npy_path, store_path=DEFAULT_STORE_PATH, dtype="float32"):
+    """
+    Convert a pickled-dict product_embeddings.npy into the memory-mapped store format.
+    """
+    embeddings = np.load(npy_path, allow_pickle=True).item()
+    write_store(store_path, embeddings, dtype)
+    logging.info(f"Converted {npy_path} to embedding store at {store_path}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a legacy product_embeddings.npy into an embedding store.")
+    parser.add_argument("--embeddings", default="./data/product_embeddings.npy")
+    parser.add_argument("--output", default=DEFAULT_STORE_PATH)
+    parser.add_argument("--dtype", choices=sorted(DTYPE_CODES), default="float32")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    convert_legacy(args.embeddings, args.output, args.dtype)
@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
+from vector_index import top_k
+
+# Below this many milliseconds of remaining budget the graph step is skipped outright
+MIN_GRAPH_TIMEOUT_MS = 5
+
+
+class GraphExpander:
+    """
+    Expands vector hits with their category neighbors from the knowledge graph and re-ranks
+    the merged candidates, within a latency budget.
+
+    `fetch_neighbors(product_ids, per_product, timeout)` returns
+    {product id: [(neighbor id, category overlap), ...]} for all hits in one call. It runs on
+    a worker thread and the caller waits at most the budget (or what is left before the
+    request deadline); on timeout or error the vector ranking is kept unchanged.
+    """
+
+    def __init__(self, fetch_neighbors, budget_ms=50, neighbors_per_hit=5, weight=0.2, max_workers=4):
+        self.fetch_neighbors = fetch_neighbors
+        self.budget = budget_ms / 1000
+        self.neighbors_per_hit = neighbors_per_hit
+        self.weight = weight
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="graph")
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "expanded": 0, "timeouts": 0, "errors": 0, "skipped": 0}
+        self.graph_time_total = 0.0
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def neighbors(self, product_ids, deadline=None):
+        """
+        Fetch the neighbors of all product ids in one call, or return None if the graph
+        does not answer within the budget (capped by `deadline`, a perf_counter timestamp).
+        """
+        self.count("calls")
+        timeout = self.budget
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.perf_counter())
+        if timeout * 1000 < MIN_GRAPH_TIMEOUT_MS or not product_ids:
+            self.count("skipped")
+            return None
+
+        started = time.perf_counter()
+        future = self.executor.submit(self.fetch_neighbors, product_ids, self.neighbors_per_hit, timeout)
+        try:
+            neighbors = future.result(timeout=timeout)
+            self.count("expanded")
+            return neighbors
+        except TimeoutError:
+            future.cancel()
+            self.count("timeouts")
+            logging.warning(f"Graph expansion exceeded its {timeout * 1000:.0f} ms budget, using vector results")
+        except Exception as e:
+            self.count("errors")
+            logging.warning(f"Graph expansion failed ({str(e)}), using vector results")
+        finally:
+            with self.lock:
+                self.graph_time_total += time.perf_counter() - started
+        return None
+
+    def rerank(self, ids, scores, neighbors, product_keys, row_by_key, score_rows, top_n=5):
+        """
+        Merge vector hits (row ids and scores) with their graph neighbors and re-rank them.
+
+        A hit keeps its vector score. A neighbor scores
+        (1 - weight) * its own vector score + weight * max over linked hits of (hit score x category overlap),
+        so products sharing most categories with the best hits move up. `score_rows(rows)` returns
+        vector scores for neighbor rows; neighbors missing from `row_by_key` (e.g. deleted) are dropped.
+        """
+        graph_scores = {}
+        for row, score in zip(ids.tolist(), scores.tolist()):
+            for neighbor_key, overlap in neighbors.get(product_keys[row], []):
+                neighbor_row = row_by_key.get(neighbor_key)
+                if neighbor_row is not None:
+                    graph_scores[neighbor_row] = max(graph_scores.get(neighbor_row, 0.0), score * overlap)
+
+        for row in ids.tolist():
+            graph_scores.pop(row, None)
+        if not graph_scores:
+            return ids[:top_n], scores[:top_n]
+
+        neighbor_rows = np.fromiter(graph_scores, dtype=np.int64, count=len(graph_scores))
+        neighbor_scores = (1 - self.weight) * score_rows(neighbor_rows) + self.weight * np.fromiter(
+            graph_scores.values(), dtype=np.float32, count=len(graph_scores))
+
+        rows = np.concatenate([ids, neighbor_rows])
+        merged, merged_scores = top_k(np.concatenate([scores, neighbor_scores]).astype(np.float32), top_n)
+        return rows[merged], merged_scores
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            fetches = counters["calls"] - counters["skipped"]
+            counters["mean_graph_ms"] = 1000 * self.graph_time_total / fetches if fetches else 0.0
+        return counters
@@ -0,0 +1,36 @@
+import os
+import shutil
+
+# Gunicorn settings for the Flask app:
+#   PYTHONPATH=src gunicorn -c src/gunicorn.conf.py app:app
+
+# Workers write their metrics to this directory so a /metrics scrape of any worker returns the
+# merged values of all of them (prometheus_client multiprocess mode). It must be set before
+# the app, and with it prometheus_client, is imported.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "./data/prometheus")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+
+# Preload mode imports the app and warms up the search engine once in the master process;
+# forked workers then share the model weights and memory-mapped store copy-on-write
+# instead of each loading their own copy. warm_up runs no inference, so torch's thread pools
+# are only started after the fork, in the workers.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+def on_starting(server):
+    # Samples of a previous run would be merged into this one's
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+    if preload_app:
+        import search_engine
+
+        timings = search_engine.warm_up()
+        server.log.info("Search engine warm-up: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+
+def child_exit(server, worker):
+    # Drop the gauges of the exited worker; its counters and histograms stay in the totals
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
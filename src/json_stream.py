@@ -0,0 +1,78 @@
+import json
+import os
+from itertools import islice
+
+def iter_json_array(path, buffer_size=1 << 20):
+    """
+    Yield the elements of a top-level JSON array one at a time, reading the file in
+    buffered blocks so memory stays bounded by the largest single element.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as file:
+        buffer = file.read(buffer_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        position, eof = 1, False
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if buffer.startswith("]", position):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # An element ending exactly at the buffer edge may be a truncated number
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                block = file.read(buffer_size)
+                eof = not block
+                buffer, position = buffer[position:] + block, 0
+                continue
+            yield item
+            position = end
+
+def iter_jsonl(path):
+    """
+    Yield one record per non-empty line of a JSON Lines file.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_records(path):
+    """
+    Stream records from a .jsonl file or a file holding a JSON array.
+    """
+    if path.endswith(".jsonl"):
+        return iter_jsonl(path)
+    return iter_json_array(path)
+
+def iter_chunks(records, chunk_size):
+    """
+    Group an iterator of records into lists of at most chunk_size.
+    """
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def write_json_array(records, path):
+    """
+    Stream records into a JSON array file, writing to a temporary file first so readers
+    never see a partial array.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write("[\n")
+        for position, record in enumerate(records):
+            if position:
+                file.write(",\n")
+            file.write(json.dumps(record))
+        file.write("\n]\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import re
+import numpy as np
+from scipy import sparse
+from embedding_store import TEXT_FILE
+from json_stream import iter_jsonl
+from vector_index import top_k
+
+# BM25 index file inside the embedding store, built from its text sidecar
+LEXICAL_INDEX_FILE = "bm25.npz"
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant: larger values flatten the advantage of top ranks
+RRF_K = 60
+
+
+def tokenize(text):
+    """
+    Lowercase word tokens; model numbers and SKUs such as "mx3-s" become "mx3" and "s".
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+class BM25Index:
+    """
+    BM25 over product texts, stored as a CSR term-document matrix whose entries are the
+    precomputed BM25 weights idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len)).
+
+    A query's scores are the sum of its terms' rows, so scoring touches only the postings of
+    the query terms and is a few vectorized NumPy operations regardless of catalog size.
+    """
+
+    def __init__(self, matrix, vocabulary):
+        self.matrix = matrix  # terms x documents, CSR
+        self.vocabulary = vocabulary  # term -> row of matrix
+
+    def __len__(self):
+        return self.matrix.shape[1]
+
+    @classmethod
+    def build(cls, texts, k1=BM25_K1, b=BM25_B):
+        vocabulary, doc_ids, term_ids, counts, lengths = {}, [], [], [], []
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            terms, tf = np.unique([vocabulary.setdefault(token, len(vocabulary)) for token in tokens], return_counts=True)
+            doc_ids.append(np.full(len(terms), doc, dtype=np.int32))
+            term_ids.append(terms.astype(np.int32))
+            counts.append(tf.astype(np.float32))
+
+        n_docs = len(lengths)
+        doc_ids = np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype=np.int32)
+        term_ids = np.concatenate(term_ids) if term_ids else np.empty(0, dtype=np.int32)
+        tf = np.concatenate(counts) if counts else np.empty(0, dtype=np.float32)
+        lengths = np.asarray(lengths, dtype=np.float32)
+
+        df = np.bincount(term_ids, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()) if n_docs else 0.0, 1.0))
+        weights = idf[term_ids] * tf * (k1 + 1) / (tf + norm[doc_ids])
+
+        matrix = sparse.csr_matrix((weights.astype(np.float32), (term_ids, doc_ids)), shape=(len(vocabulary), n_docs))
+        return cls(matrix, vocabulary)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(tmp_path, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                 shape=np.asarray(self.matrix.shape), vocabulary=np.asarray(json.dumps(terms)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as state:
+            matrix = sparse.csr_matrix((state["data"], state["indices"], state["indptr"]), shape=tuple(state["shape"]))
+            terms = json.loads(str(state["vocabulary"]))
+        return cls(matrix, {term: row for row, term in enumerate(terms)})
+
+    def score(self, query):
+        """
+        Return the BM25 score of every document for a query string. Each distinct query term
+        counts once, matching the word-set query canonicalization of the result cache.
+        """
+        rows = [self.vocabulary[token] for token in dict.fromkeys(tokenize(query)) if token in self.vocabulary]
+        if not rows:
+            return np.zeros(len(self), dtype=np.float32)
+        postings = self.matrix[rows]
+        return np.bincount(postings.indices, weights=postings.data, minlength=len(self)).astype(np.float32)
+
+    def search(self, query, top_n=5, mask=None, exclude=None):
+        """
+        Return (row ids, scores) of the best lexical matches, leaving out documents outside
+        `mask` (a boolean row mask) or in `exclude` and documents that match no query term.
+        """
+        scores = self.score(query)
+        if mask is not None:
+            scores[~mask] = 0
+        if exclude is not None and len(exclude):
+            scores[exclude] = 0
+        ids, ranked_scores = top_k(scores, top_n)
+        matched = ranked_scores > 0
+        return ids[matched], ranked_scores[matched]
+
+
+def build_lexical_index(store_path):
+    """
+    Build the BM25 index from the store's text sidecar and save it next to the matrices.
+    """
+    text_path = os.path.join(store_path, TEXT_FILE)
+    if not os.path.exists(text_path):
+        logging.warning(f"No {TEXT_FILE} in {store_path}, skipping the lexical index")
+        return None
+    index = BM25Index.build(iter_jsonl(text_path))
+    index.save(os.path.join(store_path, LEXICAL_INDEX_FILE))
+    return index
+
+
+def load_lexical_index(store):
+    """
+    Load the BM25 index of an EmbeddingStore's version, or return None when it is missing or
+    not row-aligned.
+    """
+    try:
+        index = BM25Index.load(store.file_path(LEXICAL_INDEX_FILE))
+    except FileNotFoundError:
+        return None
+    if len(index) != len(store):
+        logging.warning(f"Lexical index covers {len(index)} rows but the store has {len(store)}, ignoring it")
+        return None
+    return index
+
+
+def fuse(vector_ranked, lexical_ranked, lexical_weight, top_n=5, method="rrf"):
+    """
+    Fuse vector and lexical rankings, each (row ids, scores) best first.
+
+    "rrf" scores a row (1 - w) / (RRF_K + vector rank) + w / (RRF_K + lexical rank);
+    "weighted" blends the min-max scaled scores of both lists as (1 - w) * vector + w * lexical,
+    so cosine scores that are all negative or near zero keep their order and the 0-1 range.
+    Rows missing from a list get nothing from it.
+    """
+    fused = {}
+    for ranked, weight in ((vector_ranked, 1 - lexical_weight), (lexical_ranked, lexical_weight)):
+        ids, scores = ranked
+        if weight <= 0 or not len(ids):
+            continue
+        if method == "rrf":
+            contributions = weight / (RRF_K + np.arange(1, len(ids) + 1))
+        else:
+            scores = np.asarray(scores, dtype=np.float32)
+            span = float(scores.max() - scores.min())
+            contributions = weight * ((scores - scores.min()) / span if span > 0 else np.ones_like(scores))
+        for row, contribution in zip(ids.tolist(), contributions.tolist()):
+            fused[row] = fused.get(row, 0.0) + contribution
+
+    if not fused:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+    rows = np.fromiter(fused, dtype=np.int64, count=len(fused))
+    ids, scores = top_k(np.fromiter(fused.values(), dtype=np.float32, count=len(fused)), top_n)
+    return rows[ids], scores
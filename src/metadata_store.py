@@ -0,0 +1,93 @@
+import json
+import logging
+import mmap
+import os
+import numpy as np
+from embedding_store import METADATA_FILE
+
+# Byte offset of every row of the store's metadata.jsonl, plus its size, built alongside the matrices
+METADATA_OFFSETS_FILE = "metadata.offsets.npy"
+
+
+def line_offsets(path, chunk_size=1 << 24):
+    """
+    Byte offset of the start of every line of a file followed by the file size,
+    found by scanning for newlines without decoding anything.
+    """
+    offsets, position = [np.zeros(1, dtype=np.int64)], 0
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord("\n"))
+            offsets.append(newlines.astype(np.int64) + position + 1)
+            position += len(chunk)
+    offsets = np.concatenate(offsets)
+    if offsets[-1] != position:  # last line without a trailing newline
+        offsets = np.append(offsets, position)
+    return offsets
+
+
+def build_metadata_index(store_path):
+    """
+    Write the row offsets of the store's metadata sidecar next to the matrices.
+    """
+    offsets = line_offsets(os.path.join(store_path, METADATA_FILE))
+    tmp_path = os.path.join(store_path, f"{METADATA_OFFSETS_FILE}.tmp.npy")
+    np.save(tmp_path, offsets)
+    os.replace(tmp_path, os.path.join(store_path, METADATA_OFFSETS_FILE))
+    return offsets
+
+
+class MetadataStore:
+    """
+    Product metadata of an embedding store, row-aligned with its matrices and decoded on demand.
+
+    metadata.jsonl is memory-mapped and its row offsets are kept in a small int64 array, so
+    looking up a row decodes just that row. Workers hold no per-product Python objects and
+    share the file's pages through the OS cache.
+    """
+
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+        self.data = b""
+        if offsets[-1]:
+            with open(path, "rb") as file:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def open(cls, store):
+        """
+        Open the metadata of an EmbeddingStore's version; offsets missing or older than the
+        sidecar are rebuilt in memory.
+        """
+        path = store.file_path(METADATA_FILE)
+        try:
+            offsets = np.load(store.file_path(METADATA_OFFSETS_FILE), mmap_mode="r")
+        except FileNotFoundError:
+            offsets = None
+        if offsets is None or offsets[-1] != os.path.getsize(path):
+            logging.warning(f"No up-to-date {METADATA_OFFSETS_FILE} in {store.path}, scanning {METADATA_FILE}")
+            offsets = line_offsets(path)
+        return cls(path, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Metadata row {row} out of range")
+        return json.loads(self.data[self.offsets[row]:self.offsets[row + 1]])
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def rows(self, row_ids):
+        """
+        Decode the metadata of the given rows, in order.
+        """
+        return [self[row] for row in row_ids]
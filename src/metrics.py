@@ -0,0 +1,115 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Histogram buckets of latencies in seconds (0.5 ms to 10 s) and of per-query counts (1 to 10M)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Directory shared by all worker processes (gunicorn.conf.py sets it); when set, every process
+# writes its samples there and a scrape of any worker returns the values of all of them
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Fraction of search batches profiled with cProfile, and where the profiles are written
+PROFILE_SAMPLE_RATE = float(os.getenv("SEARCH_PROFILE_SAMPLE", 0))
+PROFILE_DIR = os.getenv("SEARCH_PROFILE_DIR", "./data/profiles")
+
+
+class MetricsRegistry:
+    """
+    Search metrics in the Prometheus text format, recorded with prometheus_client.
+
+    Latencies and sizes are bucketed histograms, so quantiles can be computed over any set of
+    workers with histogram_quantile(); cache lookups are counters and the catalog size a gauge.
+    Metrics are created on first use under their name. With PROMETHEUS_MULTIPROC_DIR set,
+    render() merges the samples of every process writing to that directory.
+    SEARCH_METRICS=0 turns recording off.
+    """
+
+    def __init__(self, enabled=True, multiproc_dir=None):
+        self.enabled = enabled
+        self.multiproc_dir = multiproc_dir
+        self.registry = CollectorRegistry()
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def family(self, kind, name, help, labels, **options):
+        family = self.families.get(name)
+        if family is None:
+            with self.lock:
+                family = self.families.get(name)
+                if family is None:
+                    family = self.families[name] = kind(name, help, tuple(labels), registry=self.registry, **options)
+        return family.labels(**labels) if labels else family
+
+    def observe(self, name, value, help="", buckets=LATENCY_BUCKETS, **labels):
+        if self.enabled:
+            self.family(Histogram, name, help, labels, buckets=buckets).observe(value)
+
+    def inc(self, name, help="", amount=1, **labels):
+        if self.enabled:
+            self.family(Counter, name, help, labels).inc(amount)
+
+    def set(self, name, value, help="", **labels):
+        """Set a gauge; across processes the most recently set value of a live process is reported."""
+        if self.enabled:
+            self.family(Gauge, name, help, labels, multiprocess_mode="livemostrecent").set(value)
+
+    @contextmanager
+    def timer(self, name, help="", **labels):
+        """Observe the seconds spent in the block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, help, **labels)
+
+    def stage(self, stage):
+        """Time one stage of the search path."""
+        return self.timer("search_stage_seconds", "Seconds spent in each stage of the search path.", stage=stage)
+
+    def render(self):
+        if not self.multiproc_dir:
+            return generate_latest(self.registry)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, self.multiproc_dir)
+        return generate_latest(registry)
+
+
+# Process-wide registry; in multiprocess mode its samples are merged with the other workers'
+metrics = MetricsRegistry(
+    enabled=os.getenv("SEARCH_METRICS", "1") == "1",
+    multiproc_dir=MULTIPROC_DIR,
+)
+
+# cProfile supports one active profiler per process, so concurrent sampled batches skip profiling
+profile_lock = threading.Lock()
+
+
+@contextmanager
+def sampled_profile(name):
+    """
+    Profile the block with cProfile for a SEARCH_PROFILE_SAMPLE fraction of calls and dump the
+    stats to SEARCH_PROFILE_DIR/<name>-<unix ms>-<pid>.prof (read them with pstats or snakeviz).
+    """
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE or not profile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{name}-{int(time.time() * 1000)}-{os.getpid()}.prof")
+            profiler.dump_stats(path)
+            logging.info(f"Wrote search profile to {path}")
+    finally:
+        profile_lock.release()
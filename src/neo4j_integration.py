@@ -1,10 +1,156 @@
-from neo4j import GraphDatabase
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from neo4j import GraphDatabase, Query
 
 # Neo4j connection setup
-uri = "bolt://localhost:7687"  # Change to your Neo4j instance URI
-username = "neo4j"
-password = "natty123"  # Replace with your Neo4j password
-driver = GraphDatabase.driver(uri, auth=(username, password))
+uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")  # Change to your Neo4j instance URI
+username = os.getenv("NEO4J_USER", "neo4j")
+password = os.getenv("NEO4J_PASSWORD", "natty123")  # Replace with your Neo4j password
+database = os.getenv("NEO4J_DATABASE")  # None uses the server's default database
+
+# One pooled driver per process, created on first use
+driver = None
+driver_lock = threading.Lock()
+
+# Schema created before loading: unique product ids and unique, indexed category names
+SCHEMA_QUERIES = [
+    "CREATE CONSTRAINT product_id IF NOT EXISTS FOR (p:Product) REQUIRE p.id IS UNIQUE",
+    "CREATE CONSTRAINT category_name IF NOT EXISTS FOR (c:Category) REQUIRE c.name IS UNIQUE",
+]
+
+# Upserts a batch of products and links each one to exactly its current categories: IN edges
+# to categories a product dropped are deleted first. Categories live only in the IN edges
+# (the categories list property of older loads is removed).
+UPSERT_PRODUCTS_QUERY = """
+UNWIND $rows AS row
+MERGE (p:Product {id: row.id})
+ON CREATE SET p.created = timestamp()
+SET p.title = row.title,
+    p.description = row.description,
+    p.features = row.features
+REMOVE p.categories
+WITH p, row
+OPTIONAL MATCH (p)-[old:IN]->(dropped:Category)
+WHERE NOT dropped.name IN row.categories
+DELETE old
+WITH DISTINCT p, row
+UNWIND row.categories AS category
+MERGE (c:Category {name: category})
+MERGE (p)-[:IN]->(c)
+"""
+
+# Category neighbors of a set of products, ranked by the share of each product's categories
+# they have in common; both counts come from the IN edges. Categories larger than
+# $max_category_size are skipped so a catch-all category cannot turn the expansion into a scan.
+CATEGORY_NEIGHBORS_QUERY = """
+UNWIND $ids AS id
+MATCH (p:Product {id: id})
+WITH id, p, COUNT { (p)-[:IN]->(:Category) } AS categories
+MATCH (p)-[:IN]->(c:Category)<-[:IN]-(n:Product)
+WHERE COUNT { (c)<-[:IN]-() } <= $max_category_size AND NOT n.id IN $ids
+WITH id, categories, n, count(c) AS shared
+ORDER BY shared DESC
+WITH id, collect({id: n.id, overlap: toFloat(shared) / categories})[..$per_product] AS neighbors
+RETURN id, neighbors
+"""
+
+def get_driver():
+    """
+    Returns the process-wide Neo4j driver, whose connection pool is shared by all sessions.
+    """
+    global driver
+    with driver_lock:
+        if driver is None:
+            driver = GraphDatabase.driver(
+                uri,
+                auth=(username, password),
+                max_connection_pool_size=int(os.getenv("NEO4J_MAX_POOL_SIZE", 50)),
+                max_transaction_retry_time=float(os.getenv("NEO4J_MAX_RETRY_TIME", 30)),
+            )
+    return driver
+
+def product_row(product, product_id):
+    """
+    Parameters for one product in an UNWIND batch.
+    """
+    return {
+        "id": str(product_id),
+        "title": product.get("title", ""),
+        "description": product.get("description", ""),
+        "features": product.get("features", []),  # Avoid KeyError
+        "categories": product.get("categories", []),  # Avoid KeyError
+    }
+
+def create_schema(graph_driver=None):
+    """
+    Creates the Product.id uniqueness constraint and the Category.name constraint (which is
+    backed by an index) if they are missing.
+    """
+    graph_driver = graph_driver or get_driver()
+    with graph_driver.session(database=database) as session:
+        for query in SCHEMA_QUERIES:
+            session.run(query).consume()
+
+def write_batch(tx, rows):
+    tx.run(UPSERT_PRODUCTS_QUERY, rows=rows).consume()
+
+def load_batch(graph_driver, rows):
+    """
+    Writes one batch in a managed write transaction; the driver retries it on transient
+    errors such as deadlocks between parallel batches merging the same category.
+    """
+    with graph_driver.session(database=database) as session:
+        session.execute_write(write_batch, rows)
+    return len(rows)
+
+def bulk_load_products(products, graph_driver=None, batch_size=1000, parallelism=1):
+    """
+    Loads (product_id, product) pairs into Neo4j as parameterized UNWIND batches.
+
+    Batches are sent one at a time, or `parallelism` at a time over the driver's connection
+    pool. Returns a report with the number of rows, batches, seconds and rows/sec.
+    """
+    graph_driver = graph_driver or get_driver()
+    create_schema(graph_driver)
+
+    pairs = iter(products)
+    batches = iter(lambda: [product_row(product, product_id) for product_id, product in islice(pairs, batch_size)], [])
+    rows, batch_count = 0, 0
+    start = time.perf_counter()
+
+    if parallelism == 1:
+        for batch in batches:
+            rows += load_batch(graph_driver, batch)
+            batch_count += 1
+    else:
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            # Keep a bounded number of batches in flight so memory stays flat
+            pending = deque()
+            for batch in batches:
+                pending.append(executor.submit(load_batch, graph_driver, batch))
+                if len(pending) >= 2 * parallelism:
+                    rows += pending.popleft().result()
+                    batch_count += 1
+            while pending:
+                rows += pending.popleft().result()
+                batch_count += 1
+
+    seconds = time.perf_counter() - start
+    report = {
+        "rows": rows,
+        "batches": batch_count,
+        "batch_size": batch_size,
+        "parallelism": parallelism,
+        "seconds": seconds,
+        "rows_per_s": rows / seconds if seconds else 0.0,
+    }
+    logging.info(f"Loaded {rows} products into Neo4j in {seconds:.1f}s ({report['rows_per_s']:.0f} rows/s)")
+    return report
 
 def add_product_to_neo4j(product, index):
     """
@@ -12,32 +158,19 @@ def add_product_to_neo4j(product, index):
     If no 'id' field is present, we generate a unique ID based on the index.
     """
     try:
-        product_id = str(index)
-
-        query = """
-        MERGE (p:Product {id: $id})
-        ON CREATE SET p.title = $title, 
-                      p.description = $description, 
-                      p.features = $features, 
-                      p.categories = $categories,
-                      p.created = timestamp()
-        """
-        with driver.session() as session:
-            session.run(query, 
-                        id=product_id, 
-                        title=product['title'], 
-                        description=product['description'],
-                        features=product.get('features', []),  # Avoid KeyError
-                        categories=product.get('categories', []))  # Avoid KeyError
+        load_batch(get_driver(), [product_row(product, product.get("id", index))])
     except Exception as e:
         print(f"Error adding product to Neo4j: {e}")
 
-def add_all_products_to_neo4j(products):
+def add_all_products_to_neo4j(products, batch_size=1000, parallelism=1):
     """
-    Adds all products to Neo4j.
+    Adds all products to Neo4j in batches.
     """
-    for index, product in enumerate(products):
-        add_product_to_neo4j(product, index)
+    return bulk_load_products(
+        ((product.get("id", index), product) for index, product in enumerate(products)),
+        batch_size=batch_size,
+        parallelism=parallelism,
+    )
 
 def get_product_recommendations(category, top_n=5):
     """
@@ -45,12 +178,11 @@ def get_product_recommendations(category, top_n=5):
     """
     try:
         query = """
-        MATCH (p:Product)
-        WHERE $category IN p.categories
+        MATCH (:Category {name: $category})<-[:IN]-(p:Product)
         RETURN p.title AS title, p.description AS description, p.features AS features
         LIMIT $top_n
         """
-        with driver.session() as session:
+        with get_driver().session(database=database) as session:
             result = session.run(query, category=category, top_n=top_n)
             recommendations = []
             for record in result:
@@ -64,8 +196,29 @@ def get_product_recommendations(category, top_n=5):
         print(f"Error fetching product recommendations from Neo4j: {e}")
         return []
 
+def get_category_neighbors(product_ids, per_product=5, timeout=None, max_category_size=10_000, graph_driver=None):
+    """
+    Fetches category neighbors for many products in one query.
+    Returns {product id: [(neighbor id, category overlap), ...]}; `timeout` (seconds) is
+    enforced by the server, which aborts the transaction when it runs out. `graph_driver`
+    defaults to the process-wide driver; any driver object (e.g. a local stand-in) works.
+    """
+    graph_driver = graph_driver or get_driver()
+    with graph_driver.session(database=database, default_access_mode="READ") as session:
+        result = session.run(
+            Query(CATEGORY_NEIGHBORS_QUERY, timeout=timeout),
+            ids=list(product_ids),
+            per_product=per_product,
+            max_category_size=max_category_size,
+        )
+        return {record["id"]: [(neighbor["id"], neighbor["overlap"]) for neighbor in record["neighbors"]] for record in result}
+
 def close_neo4j_driver():
     """
     Closes the Neo4j driver to free up resources.
     """
-    driver.close()
+    global driver
+    with driver_lock:
+        if driver is not None:
+            driver.close()
+            driver = None
@@ -1,5 +1,13 @@
+import argparse
 import json
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from json_stream import iter_chunks, iter_json_array
+
+# ASCII characters that are neither word characters nor whitespace; clean_text deletes them
+SPECIAL_CHARACTERS = str.maketrans('', '', ''.join(chr(code) for code in range(128) if not re.match(r'[\w\s]', chr(code))))
 
 def clean_text(text):
     """
@@ -10,58 +18,113 @@ def clean_text(text):
         return [clean_text(item) for item in text]
     elif isinstance(text, str):  # If the input is a string, clean it
         text = text.lower()
-        text = re.sub(r'[^\x00-\x7F]+', '', text)  # Remove non-ASCII characters
-        text = re.sub(r'[^\w\s]', '', text)  # Remove special characters
-        return text
+        text = text.encode('ascii', 'ignore').decode('ascii')  # Remove non-ASCII characters
+        return text.translate(SPECIAL_CHARACTERS)  # Remove special characters
     else:  # If the input is neither a list nor a string, return an empty string
         return ""
 
+def combine_text(title, description, features, product_details):
+    """
+    Combine cleaned title, description, features, and product details into a single string.
+    """
+    return f"{title} {description} {' '.join(features)} {' '.join(product_details)}"
+
 def get_combined_text(product):
     """
     Combine title, description, features, and product details into a single string.
     """
-    title = clean_text(product.get('title', ''))
-    description = clean_text(product.get('description', ''))
-    features = clean_text(product.get('features', []))
-    product_details = clean_text([f"{detail['type']}: {detail['value']}" for detail in product.get('product_details', [])])
-    
-    combined_text = f"{title} {description} {' '.join(features)} {' '.join(product_details)}"
-    return combined_text
+    return preprocess_product(product)['combined_text']
 
-def preprocess_data(input_file, output_file):
+def preprocess_product(product):
     """
-    Preprocess the dataset by cleaning and combining fields.
+    Clean every field of a product once and derive the combined text from the cleaned fields.
     """
-    try:
-        # Load the original JSON file
+    preprocessed_product = {
+        'title': clean_text(product.get('title', '')),
+        'description': clean_text(product.get('description', '')),
+        'categories': clean_text(product.get('categories', [])),
+        'features': clean_text(product.get('features', [])),
+        'product_details': clean_text([f"{detail['type']}: {detail['value']}" for detail in product.get('product_details', [])]),
+    }
+    preprocessed_product['combined_text'] = combine_text(  # Combined text for embeddings
+        preprocessed_product['title'],
+        preprocessed_product['description'],
+        preprocessed_product['features'],
+        preprocessed_product['product_details'],
+    )
+    return preprocessed_product
+
+def preprocess_chunk(chunk):
+    """
+    Preprocess a chunk of products (dicts, or raw JSON lines to parse) and return it as compact JSONL bytes.
+    """
+    return b''.join(
+        json.dumps(preprocess_product(json.loads(product) if isinstance(product, str) else product), separators=(',', ':')).encode('utf-8') + b'\n'
+        for product in chunk
+    )
+
+def iter_input_chunks(input_file, chunk_size):
+    """
+    Stream chunks of the input dataset. JSONL lines are passed on unparsed, so parsing
+    happens in the workers too; a JSON array is decoded incrementally here.
+    """
+    if input_file.endswith('.jsonl'):
         with open(input_file, 'r', encoding='utf-8') as file:
-            products = json.load(file)
+            yield from iter_chunks((line for line in file if line.strip()), chunk_size)
+    else:
+        yield from iter_chunks(iter_json_array(input_file), chunk_size)
 
-        # Preprocess each product
-        preprocessed_data = []
-        for product in products:
-            preprocessed_product = {
-                'title': clean_text(product.get('title', '')),
-                'description': clean_text(product.get('description', '')),
-                'categories': clean_text(product.get('categories', [])),
-                'features': clean_text(product.get('features', [])),
-                'product_details': clean_text([f"{detail['type']}: {detail['value']}" for detail in product.get('product_details', [])]),
-                'combined_text': get_combined_text(product)  # Combined text for embeddings
-            }
-            preprocessed_data.append(preprocessed_product)
+def preprocess_data(input_file, output_file, workers=None, chunk_size=1000):
+    """
+    Preprocess the dataset by cleaning and combining fields.
 
-        # Save the preprocessed data to a new JSON file
-        with open(output_file, 'w', encoding='utf-8') as file:
-            json.dump(preprocessed_data, file, indent=4)
+    Products are streamed from a JSON array or JSONL file and cleaned chunk_size at a time on
+    `workers` processes (default: one per core). Chunks are written in input order as compact
+    JSON Lines, so memory stays bounded by a few chunks per worker. Returns the number of products.
+    """
+    workers = workers or os.cpu_count() or 1
+    tmp_path = f"{output_file}.tmp"
+    count = 0
+    try:
+        with open(tmp_path, 'wb') as output:
+            chunks = iter_input_chunks(input_file, chunk_size)
+            if workers == 1:
+                for chunk in chunks:
+                    output.write(preprocess_chunk(chunk))
+                    count += len(chunk)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    # Keep a bounded number of chunks in flight and write them back in order
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append((len(chunk), executor.submit(preprocess_chunk, chunk)))
+                        if len(pending) >= 2 * workers:
+                            size, future = pending.popleft()
+                            output.write(future.result())
+                            count += size
+                    while pending:
+                        size, future = pending.popleft()
+                        output.write(future.result())
+                        count += size
 
-        print(f"Preprocessing complete. Saved data to {output_file}")
+        # Save the preprocessed data only once it is complete
+        os.replace(tmp_path, output_file)
+        print(f"Preprocessing complete. Saved {count} products to {output_file}")
+        return count
 
     except Exception as e:
         print(f"Error during preprocessing: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return count
 
-# Define the input and output file paths
-input_file = './data/products.json'  # Path to the original dataset
-output_file = './data/preprocessed.json'  # Path to save the preprocessed data
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the raw product dataset into JSON Lines for embedding.")
+    parser.add_argument("--input", default="./data/products.json", help="Path to the original dataset (JSON array or JSONL)")
+    parser.add_argument("--output", default="./data/preprocessed.jsonl", help="Path to save the preprocessed data")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
 
-# Run preprocessing
-preprocess_data(input_file, output_file)
\ No newline at end of file
+    # Run preprocessing
+    preprocess_data(args.input, args.output, args.workers, args.chunk_size)
@@ -0,0 +1,190 @@
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+from metrics import metrics
+
+# Default location of the precomputed catalog vocabulary embeddings
+DEFAULT_WARM_CACHE_PATH = "./data/term_cache"
+
+
+class TermEmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of term -> embedding vector with hit/miss counters.
+    """
+
+    def __init__(self, max_size=10_000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.warm_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, term, fallback=None):
+        """
+        Return the cached vector of a term, or None. On an LRU miss, `fallback(term)` (the warm
+        cache lookup) may supply the vector, which is then cached and counted as a warm hit.
+        """
+        with self.lock:
+            vector = self.entries.get(term)
+            if vector is not None:
+                self.entries.move_to_end(term)
+                self.hits += 1
+                result = "hit"
+            else:
+                vector = fallback(term) if fallback else None
+                if vector is None:
+                    self.misses += 1
+                    result = "miss"
+                else:
+                    self.warm_hits += 1
+                    self._put(term, vector)
+                    result = "warm_hit"
+        metrics.inc("search_term_cache_lookups_total", "Term embedding cache lookups by outcome.", result=result)
+        return vector
+
+    def put(self, term, vector):
+        with self.lock:
+            self._put(term, vector)
+
+    def _put(self, term, vector):
+        self.entries[term] = vector
+        self.entries.move_to_end(term)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.warm_hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "warm_hits": self.warm_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.warm_hits) / lookups if lookups else 0.0,
+            }
+
+
+class QueryEncoder:
+    """
+    Encodes expanded query terms with one batched model call for all cache misses.
+
+    Lookups go to the in-process LRU first, then to the optional read-only warm cache
+    of precomputed catalog vocabulary, and only the remaining terms reach the model.
+    The warm cache is only used when it was built with the same model (`model_name`).
+    """
+
+    def __init__(self, model, cache_size=10_000, batch_size=64, warm_cache_path=None, model_name=None):
+        self.model = model
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = TermEmbeddingCache(cache_size)
+        self.warm_terms, self.warm_vectors = {}, None
+        if warm_cache_path:
+            self.load_warm_cache(warm_cache_path)
+
+    def load_warm_cache(self, path):
+        """
+        Memory-map a warm cache written by build_warm_cache. A missing cache is not an error;
+        a cache built with another model or dimension is ignored, so its vectors never mix
+        with the current model's.
+        """
+        try:
+            with open(f"{path}.json", "r", encoding="utf-8") as file:
+                header = json.load(file)
+            vectors = np.load(f"{path}.npy", mmap_mode="r")
+        except FileNotFoundError:
+            logging.warning(f"Warm term cache not found at {path}")
+            return
+
+        # Caches from before the header existed are a bare term list and name no model
+        if isinstance(header, list):
+            header = {"terms": header}
+        dim = self.model.get_sentence_embedding_dimension() if hasattr(self.model, "get_sentence_embedding_dimension") else None
+        if header.get("model") != self.model_name or header.get("dim") != vectors.shape[1] or (dim and dim != vectors.shape[1]):
+            logging.warning(f"Warm term cache at {path} was built with model {header.get('model')} "
+                            f"({vectors.shape[1]} dims), not {self.model_name} ({dim} dims); ignoring it")
+            return
+        self.warm_vectors = vectors
+        self.warm_terms = {term: row for row, term in enumerate(header["terms"])}
+        logging.info(f"Loaded warm term cache with {len(self.warm_terms)} terms from {path}")
+
+    def warm_vector(self, term):
+        row = self.warm_terms.get(term)
+        return None if row is None else np.asarray(self.warm_vectors[row])
+
+    def encode_terms(self, terms):
+        """
+        Return a (len(terms), dim) matrix of term embeddings, encoding all misses in one batch.
+        """
+        vectors = {}
+        missing = []
+        for term in dict.fromkeys(terms):  # de-duplicate, keep order
+            vector = self.cache.get(term, self.warm_vector if self.warm_terms else None)
+            if vector is None:
+                missing.append(term)
+            else:
+                vectors[term] = vector
+
+        if missing:
+            encoded = self.model.encode(missing, batch_size=self.batch_size, convert_to_numpy=True)
+            for term, vector in zip(missing, encoded):
+                self.cache.put(term, vector)
+                vectors[term] = vector
+
+        return np.stack([vectors[term] for term in terms])
+
+    def encode_query(self, terms):
+        """
+        Return the mean embedding of the expanded query terms.
+        """
+        return self.encode_terms(terms).mean(axis=0)
+
+    def stats(self):
+        return {**self.cache.stats(), "warm_terms": len(self.warm_terms)}
+
+
+def catalog_vocabulary(products):
+    """
+    Collect the distinct lowercase words of product titles and categories.
+    """
+    vocabulary = set()
+    for product in products:
+        text = " ".join([product.get("title", "")] + product.get("categories", []))
+        vocabulary.update(re.findall(r"\b\w+\b", text.lower()))
+    return sorted(vocabulary)
+
+
+def build_warm_cache(model, terms, path=DEFAULT_WARM_CACHE_PATH, batch_size=256, model_name=None):
+    """
+    Precompute embeddings for a vocabulary and save them as <path>.npy plus a <path>.json
+    header holding the model name, the dimension and the term list.
+    """
+    vectors = model.encode(terms, batch_size=batch_size, convert_to_numpy=True)
+    np.save(f"{path}.npy", vectors.astype(np.float32))
+    with open(f"{path}.json", "w", encoding="utf-8") as file:
+        json.dump({"model": model_name, "dim": int(vectors.shape[1]), "terms": terms}, file)
+    logging.info(f"Saved warm term cache with {len(terms)} terms to {path}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from stub_encoder import load_encoder
+
+    parser = argparse.ArgumentParser(description="Precompute term embeddings for the catalog vocabulary.")
+    parser.add_argument("--metadata", default="./data/product_metadata.json")
+    parser.add_argument("--output", default=DEFAULT_WARM_CACHE_PATH)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    with open(args.metadata, "r", encoding="utf-8") as file:
+        products = json.load(file)
+    build_warm_cache(load_encoder(args.model), catalog_vocabulary(products), args.output, model_name=args.model)
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import redis
+from metrics import metrics
+
+
+def canonicalize_query(query):
+    """
+    Reduce a query to its sorted, de-duplicated lowercase words. Query expansion treats a
+    query as a set of words, so "Wireless Mouse", "wireless  mouse" and "mouse wireless"
+    produce identical results and share one cache entry.
+    """
+    return " ".join(sorted(set(re.findall(r"\b\w+\b", query.lower()))))
+
+
+def make_cache_key(query, params, catalog_version, prefix="search_results"):
+    """
+    Build a cache key from the canonical query, the ranking parameters and the catalog version.
+    Rebuilding the embedding store changes the version, so old entries stop matching at once.
+    """
+    payload = json.dumps({"query": canonicalize_query(query), "params": params}, sort_keys=True)
+    return f"{prefix}:{catalog_version[:12]}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+class LocalLRU:
+    """
+    Bounded, thread-safe in-process LRU with a per-entry TTL.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class ResultCache:
+    """
+    Two-tier result cache: an in-process L1 LRU in front of Redis (L2).
+
+    Concurrent misses on the same key are coalesced: the first caller computes the value
+    while the others wait for it, so a burst of identical queries costs one computation.
+    """
+
+    def __init__(self, redis_client=None, l1_size=1024, l1_ttl=300, ttl=3600):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.l1 = LocalLRU(l1_size, l1_ttl)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "coalesced": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+        metrics.inc("search_result_cache_lookups_total", "Result cache lookups by outcome.", result=name)
+
+    def get_or_compute(self, key, compute, extra_writes=None):
+        """
+        Return the cached value for key or compute, store and return it.
+        `extra_writes(pipe, value)` may queue more Redis commands (e.g. history updates) that
+        are sent in the same round-trip as the L2 write; it only runs when a value is computed.
+        """
+        value = self.l1.get(key)
+        if value is not None:
+            self.count("l1_hits")
+            return value
+
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            self.count("coalesced")
+            return future.result()
+
+        try:
+            value = self.l2_get(key)
+            if value is not None:
+                self.count("l2_hits")
+            else:
+                self.count("misses")
+                value = compute()
+                self.l2_put(key, value, extra_writes)
+            self.l1.put(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    def l2_get(self, key):
+        if not self.redis_client:
+            return None
+        try:
+            with metrics.stage("cache_get"):
+                cached = self.redis_client.get(key)
+        except redis.RedisError as e:
+            logging.error(f"Redis unavailable: {str(e)}")
+            return None
+        return json.loads(cached) if cached else None
+
+    def l2_put(self, key, value, extra_writes=None):
+        if not self.redis_client:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(key, json.dumps(value), ex=self.ttl)
+            if extra_writes:
+                extra_writes(pipe, value)
+            with metrics.stage("cache_write"):
+                pipe.execute()
+        except redis.RedisError as e:
+            logging.error(f"Redis unavailable: {str(e)}")
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = sum(counters.values())
+        counters["hit_ratio"] = (counters["l1_hits"] + counters["l2_hits"] + counters["coalesced"]) / lookups if lookups else 0.0
+        counters["l1_size"] = len(self.l1.entries)
+        return counters
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent coroutine calls with the same key onto one running computation.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+
+    async def run(self, key, compute):
+        """Await compute() once per key; concurrent callers share its result or exception."""
+        task = self.inflight.get(key)
+        if task is not None:
+            return await asyncio.shield(task)
+        task = self.inflight[key] = asyncio.ensure_future(compute())
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self.inflight.pop(key, None)
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import numpy as np
+from embedding_store import open_matrix, write_matrix
+from vector_index import ExactIndex, inner_products, top_k
+
+# Embedding fields produced by compute_embeddings, in scoring order
+FIELDS = ("titles", "categories", "features")
+
+DEFAULT_FIELD_WEIGHTS = {"titles": 0.6, "categories": 0.2, "features": 0.2}
+
+
+def parse_weights(spec):
+    """
+    Parse a weight spec such as "titles=0.6,categories=0.2,features=0.2" into a dict.
+    """
+    if not spec:
+        return None
+    weights = {}
+    for item in spec.split(","):
+        field, _, weight = item.partition("=")
+        weights[field.strip()] = weight.strip()
+    return weights
+
+
+def resolve_weights(overrides=None, defaults=DEFAULT_FIELD_WEIGHTS, fields=FIELDS):
+    """
+    Merge per-field weight overrides into the defaults and normalize them to sum to 1.
+    Fields missing from `fields` are dropped. Raises ValueError on bad input.
+    """
+    weights = {field: float(weight) for field, weight in defaults.items() if field in fields}
+    for field, weight in (overrides or {}).items():
+        if field not in fields:
+            raise ValueError(f"Unknown embedding field: {field}")
+        try:
+            weight = float(weight)
+        except (TypeError, ValueError):
+            raise ValueError(f"Weight for '{field}' must be a number")
+        if weight < 0 or not math.isfinite(weight):
+            raise ValueError(f"Weight for '{field}' must be a non-negative number")
+        weights[field] = weight
+
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("At least one field weight must be positive")
+    return {field: weights.get(field, 0.0) / total for field in fields}
+
+
+class ScoringEngine:
+    """
+    Scores products on a weighted sum of per-field cosine similarities.
+
+    Because every field matrix is L2-normalized, sum_f w_f * (E_f . q) equals
+    (sum_f w_f * E_f) . q, so the default weights are folded into one precombined
+    matrix and a query costs a single matrix-vector product. The precombined matrix
+    is cached in the store directory, so gunicorn workers memory-map the same file.
+    Per-request weight overrides score each field and combine the results.
+
+    The precombined matrix is always float32: NumPy multiplies float16 without BLAS, many
+    times slower, so a float16 store only saves space in its field matrices.
+    """
+
+    def __init__(self, embeddings, weights=None, index=None):
+        self.embeddings = embeddings
+        self.fields = [field for field in FIELDS if field in embeddings]
+        self.weights = resolve_weights(weights, fields=self.fields)
+        self.combined = self.precombine(self.weights)
+        self.index = index if index is not None else ExactIndex(self.combined)
+        # Tombstoned rows left by incremental updates are never returned
+        self.deleted = np.asarray(getattr(embeddings, "deleted", []), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.combined)
+
+    def index_source(self):
+        """
+        Identity of the precombined matrix a vector index is built on: the store version and
+        a hash of the field weights. A persisted index only matches vectors of the same source.
+        """
+        weights = json.dumps(self.weights, sort_keys=True).encode("utf-8")
+        return {
+            "store_version": getattr(self.embeddings, "version", "legacy"),
+            "weights": hashlib.sha1(weights).hexdigest()[:16],
+        }
+
+    def precombine(self, weights):
+        """
+        Build (or open the cached) float32 matrix sum_f w_f * E_f for the given weights.
+        """
+        active = [field for field, weight in weights.items() if weight > 0]
+        if len(active) == 1 and self.embeddings[active[0]].dtype == np.float32:
+            return self.embeddings[active[0]]
+
+        store_path = getattr(self.embeddings, "path", None)
+        if store_path is None:
+            return self._combine(weights)
+
+        key = hashlib.sha1(json.dumps([self.embeddings.version, weights, "float32"], sort_keys=True).encode("utf-8")).hexdigest()
+        cache_path = os.path.join(store_path, f"combined-{key[:16]}.emb")
+        if os.path.exists(cache_path):
+            return open_matrix(cache_path)
+
+        try:
+            # Write-then-rename so concurrently starting workers never map a partial file
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            write_matrix(tmp_path, self._combine(weights), dtype="float32", normalize=False)
+            os.replace(tmp_path, cache_path)
+            logging.info(f"Cached precombined field matrix at {cache_path}")
+            return open_matrix(cache_path)
+        except OSError as e:
+            logging.warning(f"Could not cache precombined field matrix ({str(e)}), keeping it in memory")
+            return self._combine(weights)
+
+    def _combine(self, weights, chunk_size=65_536):
+        first = self.embeddings[self.fields[0]]
+        combined = np.zeros(first.shape, dtype=np.float32)
+        for start in range(0, len(first), chunk_size):
+            for field, weight in weights.items():
+                if weight == 0:
+                    continue
+                combined[start:start + chunk_size] += weight * np.asarray(self.embeddings[field][start:start + chunk_size], dtype=np.float32)
+        return combined
+
+    def score(self, query, weights=None):
+        """
+        Return the weighted similarity of every product to a normalized query vector.
+        `weights` optionally overrides the default per-field weights for this query.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        weights = self.weights if weights is None else resolve_weights(weights, self.weights, self.fields)
+        if weights == self.weights:
+            return inner_products(self.combined, query)
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        for field, weight in weights.items():
+            if weight == 0:
+                continue
+            matrix = self.embeddings[field]
+            scores += weight * inner_products(matrix, query)
+        return scores
+
+    def score_batch(self, queries, weights=None):
+        """
+        Return an (n_products, batch) score matrix for a (batch, dim) matrix of normalized queries.
+        """
+        queries = np.asarray(queries, dtype=np.float32).T
+        weights = self.weights if weights is None else resolve_weights(weights, self.weights, self.fields)
+        if weights == self.weights:
+            return inner_products(self.combined, queries)
+
+        scores = np.zeros((len(self), queries.shape[1]), dtype=np.float32)
+        for field, weight in weights.items():
+            if weight == 0:
+                continue
+            matrix = self.embeddings[field]
+            scores += weight * inner_products(matrix, queries)
+        return scores
+
+    def score_rows(self, query, rows, weights=None):
+        """
+        Return the weighted similarity of normalized queries to the given rows only.
+        `query` is one vector or a (dim, B) matrix of query columns.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        rows = np.asarray(rows, dtype=np.int64)
+        weights = self.weights if weights is None else resolve_weights(weights, self.weights, self.fields)
+        if weights == self.weights:
+            return np.asarray(self.combined[rows], dtype=np.float32) @ query
+
+        scores = 0
+        for field, weight in weights.items():
+            if weight == 0:
+                continue
+            scores = scores + weight * (np.asarray(self.embeddings[field][rows], dtype=np.float32) @ query)
+        return scores
+
+    def search_rows(self, queries, rows, top_n=5, weights=None):
+        """
+        Rank only the given candidate rows (e.g. those passing a filter) for a (B, dim) batch
+        of queries, returning one (row ids, scores) pair per query. Deleted rows are skipped.
+        """
+        rows = np.setdiff1d(np.asarray(rows, dtype=np.int64), self.deleted)
+        scores = self.score_rows(np.asarray(queries, dtype=np.float32).T, rows, weights)
+        ranked = [top_k(scores[:, column], top_n) for column in range(scores.shape[1])]
+        return [(rows[ids], column_scores) for ids, column_scores in ranked]
+
+    def search(self, query, top_n=5, weights=None):
+        """
+        Return (row ids, scores) of the top_n products. Default weights go through the
+        vector index; overrides fall back to an exact scan with np.argpartition top-k.
+        """
+        if weights:
+            resolved = resolve_weights(weights, self.weights, self.fields)
+            if resolved != self.weights:
+                scores = self.score(query, resolved)
+                scores[self.deleted] = -np.inf
+                return top_k(scores, top_n)
+        return self.drop_deleted(*self.index.search(query, top_n, exclude=self.deleted), top_n)
+
+    def drop_deleted(self, ids, scores, top_n):
+        # The index scores tombstones -inf; they only surface when fewer than top_n rows are live
+        if len(self.deleted):
+            live = ~np.isin(ids, self.deleted)
+            ids, scores = ids[live], scores[live]
+        return ids[:top_n], scores[:top_n]
+
+    def search_batch(self, queries, top_n=5, weights=None):
+        """
+        Batched search: returns one (row ids, scores) pair per row of the query matrix.
+        """
+        if weights:
+            resolved = resolve_weights(weights, self.weights, self.fields)
+            if resolved != self.weights:
+                scores = self.score_batch(queries, resolved)
+                scores[self.deleted] = -np.inf
+                return [top_k(scores[:, column], top_n) for column in range(scores.shape[1])]
+        ranked = self.index.search_batch(queries, top_n, exclude=self.deleted)
+        return [self.drop_deleted(ids, scores, top_n) for ids, scores in ranked]
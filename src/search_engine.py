@@ -1,58 +1,335 @@
 import json
+import os
 import numpy as np
 import logging
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import redis
 from datetime import datetime
-from thefuzz import process
-import nltk
-from nltk.corpus import wordnet
 import re
+import threading
+import time
+from attribute_index import AttributeIndex, normalize_filters, product_matches
+from batch_scheduler import MicroBatcher
+from context_manager import ContextManager, decode_turns, get_redis_client
+from embedding_store import CONTENT_FILE, DEFAULT_STORE_PATH, MANIFEST_FILE, METADATA_FILE, EmbeddingStore
+from graph_retrieval import GraphExpander
+from json_stream import iter_jsonl
+from lexical_index import fuse, load_lexical_index
+from metrics import COUNT_BUCKETS, metrics, sampled_profile
+from metadata_store import MetadataStore
+from query_encoder import DEFAULT_WARM_CACHE_PATH, QueryEncoder
+from result_cache import ResultCache, make_cache_key
+from scoring_engine import ScoringEngine, parse_weights, resolve_weights
+from stub_encoder import load_encoder
+from vector_index import DEFAULT_INDEX_PATH, ExactIndex, build_index, load_index, normalize_rows
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Download necessary NLTK data
-nltk.download("wordnet")
+# Whether WordNet synonyms are available for query expansion (see ensure_wordnet)
+wordnet_available = False
+
+def ensure_wordnet():
+    """
+    Finds the WordNet corpus in the local NLTK data and only downloads it when it is missing
+    and SEARCH_NLTK_DOWNLOAD allows it (the default), then loads it: nltk loads corpora lazily
+    on first lookup, which would otherwise happen in the first query of each forked worker and
+    race between inference threads. Without it, queries are not expanded.
+    """
+    global wordnet_available
+    import nltk  # Importing nltk takes over a second, so it is deferred to warm-up
+
+    try:
+        nltk.data.find("corpora/wordnet")
+        wordnet_available = True
+    except LookupError:
+        if os.getenv("SEARCH_NLTK_DOWNLOAD", "1") == "1":
+            wordnet_available = nltk.download("wordnet", quiet=True)
+    if wordnet_available:
+        from nltk.corpus import wordnet
+
+        try:
+            wordnet.synsets("warmup")
+        except (LookupError, OSError) as e:
+            logging.warning(f"Could not load WordNet: {str(e)}")
+            wordnet_available = False
+    if not wordnet_available:
+        logging.warning("WordNet corpus not available, queries are searched without synonym expansion")
+    return wordnet_available
 
 # Initialize Redis client
 try:
-    redis_client = redis.StrictRedis(host="localhost", port=6379, db=0, decode_responses=True)
+    redis_client = get_redis_client()  # Pooled; see context_manager for the REDIS_* settings
 except redis.ConnectionError:
     logging.error("Failed to connect to Redis. Make sure Redis is running.")
     redis_client = None
 
-# Load product metadata
-try:
-    with open("./data/product_metadata.json", "r", encoding="utf-8") as file:
-        product_metadata = json.load(file)
-except FileNotFoundError:
-    logging.error("Product metadata file not found.")
-    product_metadata = []
+class Catalog:
+    """
+    One version of the loaded catalog: the embedding store and everything derived from it.
+    It is fully built before it is published with a single assignment to `catalog`, so code
+    that reads `catalog` once never pairs rows of one store version with the metadata or
+    indexes of another.
+    """
 
-# Load product embeddings
-try:
-    product_embeddings = np.load("./data/product_embeddings.npy", allow_pickle=True).item()
-    
-    # Ensure correct format
-    if not isinstance(product_embeddings, dict) or "titles" not in product_embeddings:
-        raise ValueError("Invalid embeddings file format")
-    
-    # Debugging: Log the shape and type of product embeddings
-    logging.info("Loaded product embeddings successfully.")
-    logging.info(f"Type of product_embeddings['titles']: {type(product_embeddings['titles'])}")
-    
-    if isinstance(product_embeddings["titles"], np.ndarray):
-        logging.info(f"Shape of product_embeddings['titles']: {product_embeddings['titles'].shape}")
-        logging.info(f"First 5 product embeddings: {product_embeddings['titles'][:5]}")
-    
-except (FileNotFoundError, ValueError) as e:
-    logging.error(f"Error loading product embeddings: {str(e)}")
-    product_embeddings = {"titles": np.array([])}
-
-# Initialize the SentenceTransformer model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+    def __init__(self, embeddings, metadata, keys, rows_by_key, attributes, lexical, engine):
+        self.embeddings = embeddings
+        self.metadata = metadata
+        self.keys = keys  # Product key of every row
+        self.rows_by_key = rows_by_key  # Key -> row of the live rows
+        self.attributes = attributes  # Inverted index of category and feature tokens
+        self.lexical = lexical  # BM25 index over each product's combined text, or None
+        self.engine = engine
+
+    @property
+    def version(self):
+        """The embedding store version, which changes whenever the catalog is re-embedded."""
+        return getattr(self.embeddings, "version", "legacy")
+
+# Search resources, loaded on first use or by warm_up
+store_path = os.getenv("SEARCH_STORE_PATH", DEFAULT_STORE_PATH)
+catalog = None
+model = None
+query_encoder = None
+
+def load_product_embeddings():
+    """
+    Opens the memory-mapped, pre-normalized embedding store, with a fallback to the legacy pickled dict.
+    """
+    try:
+        embeddings = EmbeddingStore.open(store_path)
+        logging.info(f"Opened embedding store {store_path} (version {embeddings.version})")
+    except FileNotFoundError:
+        try:
+            legacy_embeddings = np.load("./data/product_embeddings.npy", allow_pickle=True).item()
+
+            # Ensure correct format
+            if not isinstance(legacy_embeddings, dict) or "titles" not in legacy_embeddings:
+                raise ValueError("Invalid embeddings file format")
+
+            logging.warning("Embedding store not found, loading legacy product_embeddings.npy into memory")
+            embeddings = {field: normalize_rows(matrix) for field, matrix in legacy_embeddings.items()}
+        except (FileNotFoundError, ValueError) as e:
+            logging.error(f"Error loading product embeddings: {str(e)}")
+            embeddings = {"titles": np.empty((0, 0), dtype=np.float32)}
+    except ValueError as e:
+        logging.error(f"Error loading product embeddings: {str(e)}")
+        embeddings = {"titles": np.empty((0, 0), dtype=np.float32)}
+
+    logging.info(f"Shape of product_embeddings['titles']: {embeddings['titles'].shape}")
+    return embeddings
+
+def load_product_metadata(embeddings):
+    """
+    Loads product metadata, preferring the memory-mapped copy kept row-aligned inside the
+    embedding store, which decodes rows only when they are looked up.
+    """
+    if isinstance(embeddings, EmbeddingStore) and os.path.exists(embeddings.file_path(METADATA_FILE)):
+        return MetadataStore.open(embeddings)
+    try:
+        with open("./data/product_metadata.json", "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        logging.error("Product metadata file not found.")
+        return []
+
+
+def load_product_keys(embeddings):
+    """
+    Returns the product key of every store row and a key -> row map of the live rows.
+    Keys identify products in the knowledge graph; a legacy catalog has none.
+    """
+    if not isinstance(embeddings, EmbeddingStore) or not os.path.exists(embeddings.file_path(CONTENT_FILE)):
+        return [], {}
+    keys = [record["key"] for record in iter_jsonl(embeddings.file_path(CONTENT_FILE))]
+    deleted = set(embeddings.deleted.tolist())
+    return keys, {key: row for row, key in enumerate(keys) if row not in deleted}
+
+
+def load_store_lexical_index(embeddings):
+    """Loads the BM25 index built alongside the embedding store, if there is one."""
+    if not isinstance(embeddings, EmbeddingStore):
+        return None
+    return load_lexical_index(embeddings)
+
+
+def load_vector_index(engine):
+    """
+    Loads the persisted vector index for a scoring engine, falling back to an exact scan. An
+    index built for another store version or other field weights is not used.
+    SEARCH_INDEX_BACKEND selects the backend at load time: a persisted index of another
+    backend is ignored and the requested one (e.g. int8) is built in memory instead.
+    """
+    index_path = os.getenv("SEARCH_INDEX_PATH", DEFAULT_INDEX_PATH)
+    backend = os.getenv("SEARCH_INDEX_BACKEND")
+    try:
+        index = load_index(index_path, engine.combined, engine.index_source())
+        if backend and index.backend != backend:
+            raise ValueError(f"{index_path} is a {index.backend} index, not {backend}")
+        logging.info(f"Loaded {index.backend} vector index from {index_path}")
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        if not backend or backend == ExactIndex.backend:
+            logging.warning(f"Vector index not available ({str(e)}), using exact search")
+            return ExactIndex(engine.combined)
+        logging.warning(f"Vector index not available ({str(e)}), building a {backend} index")
+        index = build_index(engine.combined, backend)
+
+    if os.getenv("SEARCH_NPROBE") and hasattr(index, "nprobe"):
+        index.nprobe = int(os.getenv("SEARCH_NPROBE"))
+    if os.getenv("SEARCH_RERANK") and hasattr(index, "rerank"):
+        index.rerank = int(os.getenv("SEARCH_RERANK"))
+    return index
+
+def load_scoring_engine(embeddings):
+    """
+    Fuses the title, category and feature embeddings with configurable per-field weights
+    and attaches the vector index over the precombined field matrix.
+    """
+    engine = ScoringEngine(embeddings, parse_weights(os.getenv("SEARCH_FIELD_WEIGHTS")))
+    logging.info(f"Scoring fields with weights {engine.weights}")
+    engine.index = load_vector_index(engine)
+    return engine
+
+# Seconds between checks of the store manifest for an updated catalog (see refresh_embeddings)
+STORE_REFRESH_INTERVAL = float(os.getenv("SEARCH_STORE_REFRESH_INTERVAL", 5))
+store_checked_at = time.monotonic()
+store_refresh_lock = threading.Lock()
+
+def record_catalog_size(engine):
+    metrics.set("search_catalog_products", len(engine) - len(engine.deleted), "Live products in the loaded catalog.")
+
+def refresh_embeddings(force=False):
+    """
+    Picks up a new embedding store version without a restart.
+    An incremental update on top of the loaded version patches IVF and compressed indexes in
+    place (changed and appended rows are reassigned or re-encoded). Anything else (several
+    updates between checks, compactions, full rebuilds) rebuilds the index from the new
+    vectors with the same settings; the persisted index file is not trusted to match them.
+    The new catalog is built aside while searches keep using the current one, then swapped in.
+    """
+    global catalog, store_checked_at
+    current = catalog
+    if current is None or not isinstance(current.embeddings, EmbeddingStore):
+        return
+    if not force and time.monotonic() - store_checked_at < STORE_REFRESH_INTERVAL:
+        return
+
+    with store_refresh_lock:
+        if not force and time.monotonic() - store_checked_at < STORE_REFRESH_INTERVAL:
+            return
+        store_checked_at = time.monotonic()
+        try:
+            with open(os.path.join(store_path, MANIFEST_FILE), "r", encoding="utf-8") as file:
+                version = json.load(file)["version"]
+            if version == current.version:
+                return
+            store = EmbeddingStore.open(store_path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not check embedding store for updates: {str(e)}")
+            return
+
+        try:
+            engine = ScoringEngine(store, current.engine.weights)
+            delta = store.manifest.get("delta")
+            if hasattr(current.engine.index, "update") and delta and delta["base_version"] == current.version:
+                changed_rows = np.concatenate([delta["updated_rows"], np.arange(delta["base_rows"], len(store))])
+                engine.index = current.engine.index.update(engine.combined, changed_rows.astype(np.int64))
+            else:
+                started = time.perf_counter()
+                engine.index = current.engine.index.rebuild(engine.combined)
+                logging.info(f"Rebuilt {engine.index.backend} index over {len(engine)} rows in {time.perf_counter() - started:.1f}s")
+
+            metadata = load_product_metadata(store)
+            keys, rows_by_key = load_product_keys(store)
+            attributes, lexical = AttributeIndex.build(metadata), load_store_lexical_index(store)
+        except (OSError, ValueError) as e:
+            # E.g. a newer update removed this version's files meanwhile; the next check retries
+            logging.warning(f"Could not load embedding store version {store.version}: {str(e)}")
+            return
+        catalog = Catalog(store, metadata, keys, rows_by_key, attributes, lexical, engine)
+        record_catalog_size(engine)
+        logging.info(f"Switched to embedding store version {store.version} ({len(store)} rows, {len(store.deleted)} deleted)")
+
+# Query embedding model; "stub" selects the deterministic offline encoder used by the benchmarks
+SEARCH_MODEL = os.getenv("SEARCH_MODEL", "all-MiniLM-L6-v2")
+
+def load_model():
+    """
+    Loads the SEARCH_MODEL SentenceTransformer (importing it also loads torch, so it is deferred
+    too); "stub" loads the deterministic offline encoder used by the benchmarks.
+    """
+    return load_encoder(SEARCH_MODEL)
+
+def load_query_encoder():
+    """Batched encoder with an LRU cache of expanded-term embeddings."""
+    return QueryEncoder(
+        model,
+        cache_size=int(os.getenv("SEARCH_TERM_CACHE_SIZE", 10_000)),
+        warm_cache_path=os.getenv("SEARCH_WARM_CACHE_PATH", DEFAULT_WARM_CACHE_PATH),
+        model_name=SEARCH_MODEL,
+    )
+
+# Seconds spent loading each component, filled in by warm_up
+startup_timings = {}
+warmed_up = False
+warm_up_lock = threading.Lock()
+
+def timed_load(component, load):
+    started = time.perf_counter()
+    result = load()
+    startup_timings[component] = time.perf_counter() - started
+    logging.info(f"Loaded {component} in {startup_timings[component]:.2f}s")
+    return result
+
+def warm_up():
+    """
+    Loads WordNet, the embedding store, metadata, indexes and model once, and returns the
+    seconds spent on each component. Searches call it on first use; call it up front (as the
+    gunicorn config does in the master process with preload_app) to keep the cost out of
+    the first request and share the loaded pages copy-on-write with forked workers.
+    """
+    global catalog, model, query_encoder, store_checked_at, warmed_up
+    if warmed_up:
+        return startup_timings
+    with warm_up_lock:
+        if warmed_up:
+            return startup_timings
+        started = time.perf_counter()
+        timed_load("wordnet", ensure_wordnet)
+        embeddings = timed_load("embeddings", load_product_embeddings)
+        metadata = timed_load("metadata", lambda: load_product_metadata(embeddings))
+        keys, rows_by_key = timed_load("product_keys", lambda: load_product_keys(embeddings))
+        # Inverted index of category and feature tokens, used to pre-filter candidates
+        attributes = timed_load("attribute_index", lambda: AttributeIndex.build(metadata))
+        # BM25 index over each product's combined text, fused with the vector ranking
+        lexical = timed_load("lexical_index", lambda: load_store_lexical_index(embeddings))
+        engine = timed_load("scoring_engine", lambda: load_scoring_engine(embeddings))
+        catalog = Catalog(embeddings, metadata, keys, rows_by_key, attributes, lexical, engine)
+        model = timed_load("model", load_model)
+        query_encoder = timed_load("query_encoder", load_query_encoder)
+        startup_timings["total"] = time.perf_counter() - started
+        record_catalog_size(engine)
+        store_checked_at = time.monotonic()
+        warmed_up = True
+        logging.info(f"Search engine ready in {startup_timings['total']:.2f}s")
+    return startup_timings
+
+# Micro-batching scheduler for concurrent queries (see get_batch_scheduler)
+batch_scheduler = None
+batch_scheduler_pid = None
+batch_scheduler_lock = threading.Lock()
+
+# Latency budget of a search request; the graph expansion only gets what the vector stage leaves
+SEARCH_LATENCY_BUDGET_MS = float(os.getenv("SEARCH_LATENCY_BUDGET_MS", 250))
+
+# Lexical/vector fusion: default weight of the BM25 ranking, fusion method ("rrf" or "weighted")
+# and how many results of each ranking are fused
+SEARCH_LEXICAL_WEIGHT = float(os.getenv("SEARCH_LEXICAL_WEIGHT", 0.3))
+SEARCH_FUSION = os.getenv("SEARCH_FUSION", "rrf")
+SEARCH_FUSION_DEPTH = int(os.getenv("SEARCH_FUSION_DEPTH", 50))
+
+# Knowledge-graph expansion of vector hits (see get_graph_expander)
+graph_expander = None
+graph_expander_lock = threading.Lock()
 
 def simple_tokenize(text):
     """
@@ -65,6 +342,9 @@ def expand_query(query):
     Expands the search query using WordNet synonyms.
     """
     expanded_terms = set(simple_tokenize(query))  # Tokenize input query
+    if not wordnet_available:
+        return list(expanded_terms)
+    from nltk.corpus import wordnet
 
     for word in expanded_terms.copy():  # Iterate over original words
         for syn in wordnet.synsets(word):  # Find WordNet synsets
@@ -73,72 +353,318 @@ def expand_query(query):
 
     return list(expanded_terms)
 
-def search_products(user_id, query, top_n=5):
-    """Performs semantic search with caching and query expansion."""
-    redis_key = f"search_results:{query}"
-    cached_results = redis_client.get(redis_key) if redis_client else None
+def embed_queries(queries):
+    """
+    Expands each query and returns a (len(queries), dim) matrix of normalized mean embeddings.
+    The expanded terms of the whole batch are encoded together.
+    """
+    with metrics.stage("expand"):
+        expanded = [expand_query(query) or [query] for query in queries]
+    with metrics.stage("encode"):
+        term_vectors = query_encoder.encode_terms([term for terms in expanded for term in terms])
 
-    if cached_results:
-        logging.info("Cache hit for query: %s", query)
-        return json.loads(cached_results)
+    query_embeddings, start = [], 0
+    for terms in expanded:
+        query_embeddings.append(term_vectors[start:start + len(terms)].mean(axis=0))
+        start += len(terms)
+    return normalize_rows(np.stack(query_embeddings))
 
-    logging.info("Cache miss for query: %s", query)
-    query_terms = expand_query(query)
+def format_results(product_ids, similarities, metadata=None, scores=None):
+    """
+    Attaches product metadata to ranked product ids, decoding each result's row once.
+    `similarity` is the weighted cosine similarity to the query and `score` the value the
+    results are ranked by (the fused or graph-blended score; the similarity otherwise).
+    """
+    metadata = catalog.metadata if metadata is None else metadata
+    scores = similarities if scores is None else scores
+    products = [metadata[pid] if pid < len(metadata) else {} for pid in product_ids.tolist()]
+    return [
+        {
+            "title": product.get("title", "Unknown"),
+            "description": product.get("description", ""),
+            "categories": product.get("categories", []),
+            "features": product.get("features", []),
+            "similarity": float(similarity),
+            "score": float(score),
+        }
+        for product, similarity, score in zip(products, similarities, scores)
+    ]
 
-    # Compute mean embedding for expanded query
-    try:
-        query_embedding = np.mean([model.encode(term) for term in query_terms], axis=0)
-        logging.info(f"Query embedding shape: {query_embedding.shape}")
-    except Exception as e:
-        logging.error("Error computing query embedding: %s", str(e))
-        return []
+def get_graph_expander(keys):
+    """
+    Returns the process-wide graph expander when SEARCH_GRAPH_EXPANSION is enabled and the
+    catalog has product keys (`keys`) to match against the graph.
+    """
+    global graph_expander
+    if os.getenv("SEARCH_GRAPH_EXPANSION", "0") != "1" or not keys:
+        return None
+    with graph_expander_lock:
+        if graph_expander is None:
+            from neo4j_integration import get_category_neighbors
 
-    # Ensure embeddings are loaded properly
-    if "titles" not in product_embeddings or not isinstance(product_embeddings["titles"], np.ndarray):
-        logging.error("Product embeddings are not properly loaded.")
-        return []
+            graph_expander = GraphExpander(
+                get_category_neighbors,
+                budget_ms=float(os.getenv("SEARCH_GRAPH_BUDGET_MS", 50)),
+                neighbors_per_hit=int(os.getenv("SEARCH_GRAPH_NEIGHBORS", 5)),
+                weight=float(os.getenv("SEARCH_GRAPH_WEIGHT", 0.2)),
+            )
+    return graph_expander
 
-    product_vectors = product_embeddings["titles"]  # This is a 2D NumPy array
-    product_ids = list(range(len(product_vectors)))  # Generate numerical indices
+def resolve_lexical_weight(lexical_weight=None):
+    """
+    Returns the weight of the lexical ranking in [0, 1], defaulting to SEARCH_LEXICAL_WEIGHT.
+    Raises ValueError on bad input.
+    """
+    if lexical_weight is None:
+        return SEARCH_LEXICAL_WEIGHT
+    try:
+        lexical_weight = float(lexical_weight)
+    except (TypeError, ValueError):
+        raise ValueError("Lexical weight must be a number")
+    if not 0 <= lexical_weight <= 1:
+        raise ValueError("Lexical weight must be between 0 and 1")
+    return lexical_weight
 
-    if len(product_vectors) == 0:
+def rank_batch(requests):
+    """
+    Ranks a batch of (query, top_n, weights, filters, lexical_weight) requests without caching.
+    All queries are encoded in one batch and scored as one query-matrix x product-matrix
+    product per distinct weight and filter setting; filtered requests only score the rows
+    the attribute index lets through. With graph expansion enabled, the category neighbors
+    of all unfiltered hits are fetched in one query and merged into each ranking.
+    When the store has a BM25 index, each vector ranking is then fused with the BM25
+    ranking of the raw query, so exact model numbers and SKUs are found too.
+    """
+    warm_up()
+    started = time.perf_counter()
+    current = catalog  # One snapshot for the whole batch; a refresh may swap in a new catalog meanwhile
+    engine, metadata, keys, rows_by_key, attributes, lexical = current.engine, current.metadata, current.keys, current.rows_by_key, current.attributes, current.lexical
+    if len(engine) == 0:
         logging.error("No valid product embeddings found.")
-        return []
+        return [[] for _ in requests]
 
-    # Compute cosine similarity
-    similarities = cosine_similarity([query_embedding], product_vectors)[0]
-    
-    # Rank products based on similarity
-    ranked_products = sorted(zip(product_ids, similarities), key=lambda x: x[1], reverse=True)[:top_n]
+    requests = [(query, top_n, weights, filters, resolve_lexical_weight(lexical_weight))
+                for query, top_n, weights, filters, lexical_weight in requests]
+    # Fused requests rank deeper lists than they return
+    depths = [max(top_n, SEARCH_FUSION_DEPTH) if lexical and lexical_weight else top_n
+              for _, top_n, _, _, lexical_weight in requests]
 
-    # Format results
-    formatted_results = [
-        {
-            "title": product_metadata[pid]["title"] if pid < len(product_metadata) else "Unknown",
-            "description": product_metadata[pid].get("description", ""),
-            "categories": product_metadata[pid].get("categories", []),
-            "features": product_metadata[pid].get("features", []),
-            "similarity": float(similarity),
-        }
-        for pid, similarity in ranked_products
-    ]
+    query_embeddings = embed_queries([query for query, _, _, _, _ in requests])
 
-    # Cache the results
-    if redis_client:
-        redis_client.set(redis_key, json.dumps(formatted_results), ex=3600)
-        search_entry = {
-            "query": query,
-            "timestamp": datetime.now().isoformat(),
-            "result_count": len(formatted_results),
-        }
-        redis_client.lpush(f"user:{user_id}:search_history", json.dumps(search_entry))
-        redis_client.ltrim(f"user:{user_id}:search_history", 0, 9)
+    groups = {}
+    for position, (_, _, weights, filters, _) in enumerate(requests):
+        groups.setdefault(json.dumps([weights, filters], sort_keys=True), []).append(position)
+
+    ranked = [None] * len(requests)
+    for positions in groups.values():
+        _, _, weights, filters, _ = requests[positions[0]]
+        top_n = max(depths[position] for position in positions)
+        if filters:
+            with metrics.stage("filter"):
+                candidates = attributes.candidates(filters)
+            with metrics.stage("rank"):
+                group_ranked = engine.search_rows(query_embeddings[positions], candidates, top_n, weights)
+            candidate_count = len(candidates)
+        else:
+            with metrics.stage("rank"):
+                group_ranked = engine.search_batch(query_embeddings[positions], top_n, weights)
+            candidate_count = len(engine) - len(engine.deleted)
+        for position, (product_ids, similarities) in zip(positions, group_ranked):
+            ranked[position] = (product_ids[:depths[position]], similarities[:depths[position]])
+            metrics.observe("search_candidates", candidate_count, "Products eligible for ranking per query, after filters.", buckets=COUNT_BUCKETS)
+
+    expander = get_graph_expander(keys)
+    unfiltered = [position for position, request in enumerate(requests) if not request[3]]
+    if expander and unfiltered:
+        with metrics.stage("graph"):
+            hit_keys = sorted({keys[row] for position in unfiltered for row in ranked[position][0].tolist()})
+            neighbors = expander.neighbors(hit_keys, deadline=started + SEARCH_LATENCY_BUDGET_MS / 1000)
+            if neighbors:
+                for position in unfiltered:
+                    weights = requests[position][2]
+                    score_rows = lambda rows, position=position, weights=weights: engine.score_rows(query_embeddings[position], rows, weights)
+                    ranked[position] = expander.rerank(*ranked[position], neighbors, keys, rows_by_key, score_rows, depths[position])
+
+    for position, (query, top_n, _, filters, lexical_weight) in enumerate(requests):
+        if lexical and lexical_weight:
+            with metrics.stage("lexical"):
+                mask = attributes.mask(filters) if filters else None
+                lexical_ranked = lexical.search(query, depths[position], mask, engine.deleted)
+                ranked[position] = fuse(ranked[position], lexical_ranked, lexical_weight, top_n, SEARCH_FUSION)
+        else:
+            ranked[position] = (ranked[position][0][:top_n], ranked[position][1][:top_n])
+
+    with metrics.stage("format"):
+        # Fusion and graph re-ranking replace the scores, so the cosine similarity is recomputed for the returned rows
+        return [
+            format_results(product_ids, engine.score_rows(query_embeddings[position], product_ids, requests[position][2]), metadata, scores)
+            for position, (product_ids, scores) in enumerate(ranked)
+        ]
+
+def search_batch(requests):
+    """
+    rank_batch, profiled for SEARCH_PROFILE_SAMPLE of the batches. It runs on the micro-batcher
+    thread when batching is enabled, which is where the encoding and scoring happen.
+    """
+    with sampled_profile("search_batch"):
+        return rank_batch(requests)
+
+def get_batch_scheduler():
+    """
+    Returns the process-wide micro-batcher when SEARCH_MICROBATCH is enabled.
+    Created lazily so each forked gunicorn worker gets its own scheduler thread.
+    """
+    global batch_scheduler, batch_scheduler_pid
+    if os.getenv("SEARCH_MICROBATCH", "0") != "1":
+        return None
+    with batch_scheduler_lock:
+        if batch_scheduler is None or batch_scheduler_pid != os.getpid():
+            batch_scheduler = MicroBatcher(
+                search_batch,
+                max_batch_size=int(os.getenv("SEARCH_MAX_BATCH", 32)),
+                max_wait_ms=float(os.getenv("SEARCH_BATCH_WINDOW_MS", 5)),
+            )
+            batch_scheduler_pid = os.getpid()
+    return batch_scheduler
+
+def compute_results(query, top_n=5, weights=None, filters=None, lexical_weight=None):
+    """Ranks a single query, through the micro-batcher when it is enabled."""
+    scheduler = get_batch_scheduler()
+    if scheduler:
+        return scheduler.submit((query, top_n, weights, filters, lexical_weight)).result()
+    return search_batch([(query, top_n, weights, filters, lexical_weight)])[0]
+
+# Search results cache TTL and per-user history length
+RESULTS_CACHE_TTL = 3600
+SEARCH_HISTORY_LENGTH = 10
+
+# Two-tier result cache: in-process LRU in front of Redis, with request coalescing
+result_cache = ResultCache(
+    redis_client,
+    l1_size=int(os.getenv("SEARCH_L1_CACHE_SIZE", 1024)),
+    l1_ttl=float(os.getenv("SEARCH_L1_CACHE_TTL", 300)),
+    ttl=RESULTS_CACHE_TTL,
+)
 
-    return formatted_results
+def results_cache_key(query, top_n=5, weights=None, filters=None, lexical_weight=None):
+    """
+    Returns the cache key for a query's results with the resolved weights, normalized filters
+    and resolved lexical weight. The key covers the canonical query, top_n, the weights, the
+    filters, the lexical weight and the catalog version. Invalid parameters raise ValueError.
+    Loads the search resources and picks up catalog updates first; see build_cache_key for
+    callers that do both elsewhere.
+    """
+    warm_up()
+    refresh_embeddings()
+    return build_cache_key(query, top_n, weights, filters, lexical_weight)
+
+def build_cache_key(query, top_n=5, weights=None, filters=None, lexical_weight=None):
+    """
+    results_cache_key without the warm-up and refresh: cheap and never blocks on loading, for
+    the asyncio server, which warms up before serving and refreshes in a background task.
+    Everything in the key comes from one catalog snapshot. Searches read the catalog after
+    the key is built, so results are never older than the catalog version in their key.
+    """
+    current = catalog
+    if weights:
+        weights = resolve_weights(weights, current.engine.weights, current.engine.fields)
+        if weights == current.engine.weights:
+            weights = None
+    filters = normalize_filters(filters)
+    params = {"top_n": top_n, "weights": weights}
+    if filters:
+        params["filters"] = filters
+    lexical_weight = resolve_lexical_weight(lexical_weight)
+    if current.lexical is not None:
+        params["lexical_weight"] = lexical_weight
+    if get_graph_expander(current.keys):
+        params["graph"] = True  # Graph-expanded rankings differ from vector-only ones
+    redis_key = make_cache_key(query, params, current.version)
+    return redis_key, weights, filters, lexical_weight
+
+def search_history_key(user_id):
+    return f"user:{user_id}:search_history"
+
+def search_history_entry(query, results):
+    return json.dumps({
+        "query": query,
+        "timestamp": datetime.now().isoformat(),
+        "result_count": len(results),
+    })
+
+def queue_history_write(pipe, user_id, query, results):
+    """Queues the capped history update on a Redis pipeline (sync or asyncio)."""
+    pipe.lpush(search_history_key(user_id), search_history_entry(query, results))
+    pipe.ltrim(search_history_key(user_id), 0, SEARCH_HISTORY_LENGTH - 1)
+
+# Conversation turns returned with each /chat response
+SEARCH_CONTEXT_TURNS = int(os.getenv("SEARCH_CONTEXT_TURNS", 5))
+
+def queue_chat_turn(pipe, user_id, query, results):
+    """
+    Queues recording a /chat turn (the query and the result titles) in the user's conversation
+    context, then reading back the search history and the last SEARCH_CONTEXT_TURNS turns.
+    Works for sync and asyncio pipelines; chat_turn_replies unpacks the replies.
+    """
+    session = ContextManager(user_id)
+    session.queue_store_context(pipe, query, [result["title"] for result in results])
+    pipe.lrange(search_history_key(user_id), 0, -1)
+    session.queue_get_context(pipe, SEARCH_CONTEXT_TURNS)
+
+def chat_turn_replies(replies):
+    """Returns (history, context) from the replies of a pipeline ending with queue_chat_turn."""
+    return [json.loads(entry) for entry in replies[-3]], decode_turns(replies[-1])
+
+def record_chat_turn(user_id, query, results):
+    """
+    Records a /chat turn and returns the user's (history, context) in one pipelined round-trip.
+    """
+    if not redis_client:
+        return [], []
+    try:
+        with metrics.stage("history"), redis_client.pipeline(transaction=False) as pipe:
+            queue_chat_turn(pipe, user_id, query, results)
+            return chat_turn_replies(pipe.execute())
+    except redis.RedisError as e:
+        logging.error(f"Redis unavailable: {str(e)}")
+        return [], []
+
+def queue_result_writes(pipe, redis_key, user_id, query, results):
+    """
+    Queues the result cache write and the history update on a Redis pipeline,
+    so they go out in a single round-trip. Works for sync and asyncio pipelines.
+    """
+    pipe.set(redis_key, json.dumps(results), ex=RESULTS_CACHE_TTL)
+    queue_history_write(pipe, user_id, query, results)
+
+def search_products(user_id, query, top_n=5, weights=None, filters=None, lexical_weight=None):
+    """
+    Performs semantic search with caching and query expansion.
+    `weights` optionally overrides the per-field scoring weights, `filters`
+    ({"categories": [...], "features": [...]}) restricts the candidates before scoring and
+    `lexical_weight` (0-1) sets the share of the BM25 ranking in the fused results;
+    invalid parameters raise ValueError.
+    """
+    redis_key, weights, filters, lexical_weight = results_cache_key(query, top_n, weights, filters, lexical_weight)
+
+    def compute():
+        logging.info("Cache miss for query: %s", query)
+        return compute_results(query, top_n, weights, filters, lexical_weight)
+
+    # Cache misses also record the search, in the same round-trip as the cache write
+    try:
+        return result_cache.get_or_compute(
+            redis_key,
+            compute,
+            extra_writes=lambda pipe, results: queue_history_write(pipe, user_id, query, results),
+        )
+    except Exception as e:
+        logging.error("Error computing search results: %s", str(e))
+        return []
 
 def get_user_search_history(user_id):
     """Retrieves the last 10 searches by a user."""
-    search_history = redis_client.lrange(f"user:{user_id}:search_history", 0, -1) if redis_client else []
+    search_history = redis_client.lrange(search_history_key(user_id), 0, -1) if redis_client else []
     return [json.loads(entry) for entry in search_history]
 
 def recommend_based_on_history(user_id, top_n=5):
@@ -149,21 +675,16 @@ def recommend_based_on_history(user_id, top_n=5):
     return search_products(user_id, search_history[0]["query"], top_n)
 
 def filter_products(results, category_filter=None, feature_filters=None):
-    """Filters search results based on categories and features using fuzzy matching."""
-    if category_filter:
-        category_filter = [cat.lower() for cat in category_filter]
-        results = [
-            product
-            for product in results
-            if any(process.extractOne(cat, product.get("categories", []))[1] >= 80 for cat in category_filter)
-        ]
-
-    if feature_filters:
-        feature_filters = [feature.lower() for feature in feature_filters]
-        results = [
-            product
-            for product in results
-            if all(process.extractOne(feature, product.get("features", []))[1] >= 80 for feature in feature_filters)
-        ]
+    """
+    Filters search results based on categories and features, with the typo-tolerant token
+    matching of the attribute index. Prefer passing filters to search_products, which applies
+    them before ranking so filtered searches still return top_n results.
+    """
+    filters = normalize_filters({"categories": category_filter or [], "features": feature_filters or []})
+    if not filters:
+        return results
+    return [product for product in results if product_matches(filters, product)]
 
-    return results
+if __name__ == "__main__":
+    # Startup time per component, e.g. to compare a cold start with a warm page cache
+    print(json.dumps(warm_up(), indent=4))
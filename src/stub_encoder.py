@@ -0,0 +1,63 @@
+import hashlib
+import re
+from functools import lru_cache
+import numpy as np
+
+# Model names starting with this prefix load a StubEncoder instead of a SentenceTransformer
+STUB_MODEL_PREFIX = "stub"
+
+# Dimensions each word contributes to in a stub embedding
+STUB_WORD_DIMENSIONS = 16
+
+
+@lru_cache(maxsize=100_000)
+def word_projection(word, dim):
+    """
+    The dimensions and signs a word adds to a stub embedding, derived from a hash of the word.
+    """
+    digest = np.frombuffer(hashlib.blake2b(word.encode("utf-8"), digest_size=2 * STUB_WORD_DIMENSIONS).digest(), dtype=np.uint16)
+    return (digest % dim).astype(np.int64), np.where(digest & 0x8000, 1.0, -1.0).astype(np.float32)
+
+
+class StubEncoder:
+    """
+    Deterministic, offline stand-in for a SentenceTransformer, used by the benchmarks.
+
+    A text is embedded as a sparse random projection of its words, so texts sharing words
+    are similar and embeddings are identical across runs and machines, with no model
+    download or GPU. Encoding costs microseconds, so benchmarks measure the pipeline
+    around the model rather than the model itself.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else sentences
+        positions, signs = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.float32)]
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                word_dims, word_signs = word_projection(word, self.dim)
+                positions.append(word_dims + row * self.dim)
+                signs.append(word_signs)
+        embeddings = np.bincount(np.concatenate(positions), weights=np.concatenate(signs), minlength=len(texts) * self.dim)
+        embeddings = embeddings.astype(np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings /= norms
+        return embeddings[0] if single else embeddings
+
+
+def load_encoder(model_name):
+    """
+    Load a SentenceTransformer by name, or a StubEncoder for names starting with "stub".
+    """
+    if model_name.startswith(STUB_MODEL_PREFIX):
+        return StubEncoder()
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
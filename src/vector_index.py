@@ -0,0 +1,533 @@
+import json
+import logging
+import numpy as np
+
+# Default location of the persisted index, next to the embeddings file
+DEFAULT_INDEX_PATH = "./data/product_index.npz"
+
+
+def normalize_rows(vectors):
+    """
+    L2-normalize vectors row-wise so inner product equals cosine similarity.
+    Zero rows are left as zeros.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def inner_products(vectors, queries, chunk_size=8192):
+    """
+    vectors @ queries in float32, for a query vector or a (dim, batch) query matrix.
+    NumPy has no BLAS kernel for float16, so float16 rows are widened to float32 a block at a
+    time instead: the matrix stays half size and the product runs at float32 speed.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if vectors.dtype == np.float32:
+        return vectors @ queries
+    scores = np.empty((len(vectors),) + queries.shape[1:], dtype=np.float32)
+    for start in range(0, len(vectors), chunk_size):
+        scores[start:start + chunk_size] = np.asarray(vectors[start:start + chunk_size], dtype=np.float32) @ queries
+    return scores
+
+
+def exclude_rows(scores, exclude):
+    """
+    Score the given rows of a score vector (or rows x batch matrix) -inf, in place.
+    """
+    if exclude is not None and len(exclude):
+        scores[exclude] = -np.inf
+    return scores
+
+
+def top_k(scores, k):
+    """
+    Return (indices, scores) of the k highest scores, best first.
+    Uses np.argpartition so only the short list is fully sorted.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    order = np.argsort(-scores[candidates], kind="stable")
+    indices = candidates[order]
+    return indices, scores[indices]
+
+
+class ExactIndex:
+    """
+    Brute-force inner-product index: scores every row with one matrix-vector product.
+    """
+
+    backend = "exact"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, query, top_n=5, exclude=None):
+        """
+        Return (row ids, scores) of the top_n rows for a normalized query vector.
+        Rows in `exclude` (e.g. tombstones) are scored -inf, so they rank last.
+        """
+        scores = inner_products(self.vectors, query)
+        exclude_rows(scores, exclude)
+        return top_k(scores, top_n)
+
+    def search_batch(self, queries, top_n=5, exclude=None):
+        """Score a (batch, dim) query matrix with one matrix product; returns one (ids, scores) per query."""
+        scores = inner_products(self.vectors, np.asarray(queries, dtype=np.float32).T)
+        exclude_rows(scores, exclude)
+        return [top_k(scores[:, column], top_n) for column in range(scores.shape[1])]
+
+    def rebuild(self, vectors):
+        return ExactIndex(vectors)
+
+    def state(self):
+        return {}
+
+    @classmethod
+    def from_state(cls, vectors, state):
+        return cls(vectors)
+
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are clustered with spherical k-means and each query
+    only scores the rows of the `nprobe` closest clusters.
+
+    `nlist` (clusters, fixed at build time) and `nprobe` (clusters scanned per
+    query, adjustable at search time) trade recall against latency. A common
+    starting point is nlist ~ sqrt(N) and nprobe ~ 1-5% of nlist.
+    """
+
+    backend = "ivf"
+
+    def __init__(self, vectors, centroids, order, offsets, nprobe=8):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.order = order  # row ids grouped by cluster
+        self.offsets = offsets  # cluster c owns order[offsets[c]:offsets[c + 1]]
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, nlist=None, nprobe=8, n_iter=10, sample_size=100_000, seed=0, chunk_size=65_536):
+        """
+        Train centroids on a sample of the (normalized) vectors and assign every row
+        to its nearest centroid.
+        """
+        n_rows = len(vectors)
+        if nlist is None:
+            nlist = max(1, int(np.sqrt(n_rows)))
+        nlist = min(nlist, n_rows)
+
+        rng = np.random.default_rng(seed)
+        sample_ids = rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+        sample = np.asarray(vectors[np.sort(sample_ids)], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        assignments = np.empty(n_rows, dtype=np.int32)
+        for start in range(0, n_rows, chunk_size):
+            block = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            assignments[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+        return cls.from_assignments(vectors, centroids, assignments, nprobe)
+
+    @classmethod
+    def from_assignments(cls, vectors, centroids, assignments, nprobe=8):
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=len(centroids)))
+        return cls(vectors, centroids, order, offsets, nprobe=nprobe)
+
+    def update(self, vectors, rows):
+        """
+        Return an index over `vectors` (which may have grown) in which the given changed or
+        appended rows are reassigned to their nearest centroid. Centroids are kept as they are.
+        """
+        assignments = np.zeros(len(vectors), dtype=np.int32)
+        assignments[self.order] = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.offsets))
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows):
+            block = np.asarray(vectors[rows], dtype=np.float32)
+            assignments[rows] = np.argmax(block @ self.centroids.T, axis=1)
+        return self.from_assignments(vectors, self.centroids, assignments, self.nprobe)
+
+    def rebuild(self, vectors):
+        """Return an index of the same shape trained from scratch on `vectors`."""
+        return IVFIndex.build(vectors, nlist=self.nlist, nprobe=self.nprobe)
+
+    def search(self, query, top_n=5, nprobe=None, exclude=None):
+        """Return (row ids, scores) of the top_n rows among the probed clusters, leaving out `exclude`."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        query = np.asarray(query, dtype=np.float32)
+        probe, _ = top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        if exclude is not None and len(exclude):
+            candidates = candidates[~np.isin(candidates, exclude)]
+        if len(candidates) == 0:
+            return top_k(np.array([], dtype=np.float32), top_n)
+        candidates.sort()  # sequential access into the embedding matrix
+        scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+        positions, best = top_k(scores, top_n)
+        return candidates[positions], best
+
+    def search_batch(self, queries, top_n=5, nprobe=None, exclude=None):
+        """Search each query of a (batch, dim) matrix; probed clusters differ per query."""
+        return [self.search(query, top_n, nprobe, exclude) for query in queries]
+
+    def state(self):
+        return {
+            "centroids": self.centroids,
+            "order": self.order,
+            "offsets": self.offsets,
+            "nprobe": np.int64(self.nprobe),
+        }
+
+    @classmethod
+    def from_state(cls, vectors, state):
+        return cls(vectors, state["centroids"], state["order"], state["offsets"], nprobe=int(state["nprobe"]))
+
+
+def shortlist(scores, k):
+    """
+    top_k of approximate scores for re-ranking, minus any excluded (-inf) rows, which fill
+    the short list when fewer than k rows are left and would otherwise be re-scored exactly.
+    """
+    ids, approximate = top_k(scores, k)
+    live = approximate > -np.inf
+    return ids[live], approximate[live]
+
+
+def rerank_exact(vectors, query, candidates, top_n):
+    """
+    Re-score a short list of row ids exactly against the float vectors and return the top_n.
+    """
+    candidates = np.sort(candidates)  # sequential access into the embedding matrix
+    scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+    positions, best = top_k(scores, top_n)
+    return candidates[positions], best
+
+
+def quantize_int8(block, scale):
+    return np.clip(np.rint(block / scale), -127, 127).astype(np.int8)
+
+
+class Int8Index:
+    """
+    Scalar-quantized flat index: every row is kept as int8 codes with one scale per
+    dimension, a quarter of its float32 size. Queries scan the codes and the best
+    `rerank * top_n` rows are re-scored exactly against the float vectors, which are only
+    read for that short list. `rerank=0` returns the quantized scores as they are.
+    """
+
+    backend = "int8"
+    compressed = True
+
+    def __init__(self, vectors, codes, scale, rerank=4, chunk_size=65_536):
+        self.vectors = vectors
+        self.codes = codes  # (rows, dim) int8
+        self.scale = scale  # (dim,) float32, code * scale ~ value
+        self.rerank = rerank
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def build(cls, vectors, rerank=4, chunk_size=65_536):
+        """
+        Quantize the vectors symmetrically with each dimension's largest absolute value mapped to 127.
+        """
+        n_rows, dim = vectors.shape
+        peak = np.zeros(dim, dtype=np.float32)
+        for start in range(0, n_rows, chunk_size):
+            block = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            peak = np.maximum(peak, np.abs(block).max(axis=0))
+        scale = np.where(peak > 0, peak / 127, 1.0).astype(np.float32)
+
+        codes = np.empty((n_rows, dim), dtype=np.int8)
+        for start in range(0, n_rows, chunk_size):
+            codes[start:start + chunk_size] = quantize_int8(np.asarray(vectors[start:start + chunk_size], dtype=np.float32), scale)
+        return cls(vectors, codes, scale, rerank)
+
+    def update(self, vectors, rows):
+        """
+        Return an index over `vectors` (which may have grown) with the given rows re-quantized.
+        The scales are kept, so values beyond the original range are clipped until a rebuild.
+        """
+        codes = np.zeros((len(vectors), self.codes.shape[1]), dtype=np.int8)
+        kept = min(len(self.codes), len(vectors))
+        codes[:kept] = self.codes[:kept]
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows):
+            codes[rows] = quantize_int8(np.asarray(vectors[rows], dtype=np.float32), self.scale)
+        return Int8Index(vectors, codes, self.scale, self.rerank, self.chunk_size)
+
+    def rebuild(self, vectors):
+        """Return an index with the same settings quantized from scratch from `vectors`."""
+        return Int8Index.build(vectors, rerank=self.rerank, chunk_size=self.chunk_size)
+
+    def approximate_scores(self, queries):
+        """
+        Quantized scores of every row for a (batch, dim) query matrix, as a (rows, batch) matrix.
+        Codes are widened a chunk at a time so the scan never holds a float copy of the catalog.
+        """
+        scaled = (np.asarray(queries, dtype=np.float32) * self.scale).T
+        scores = np.empty((len(self.codes), scaled.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.codes), self.chunk_size):
+            scores[start:start + self.chunk_size] = self.codes[start:start + self.chunk_size].astype(np.float32) @ scaled
+        return scores
+
+    def search(self, query, top_n=5, rerank=None, exclude=None):
+        """Return (row ids, scores) of the top_n rows for a normalized query vector."""
+        return self.search_batch(np.asarray(query, dtype=np.float32)[None, :], top_n, rerank, exclude)[0]
+
+    def search_batch(self, queries, top_n=5, rerank=None, exclude=None):
+        """Scan the codes once for a (batch, dim) query matrix; returns one (ids, scores) per query."""
+        rerank = self.rerank if rerank is None else rerank
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = exclude_rows(self.approximate_scores(queries), exclude)
+        results = []
+        for column, query in enumerate(queries):
+            ids, approximate = shortlist(scores[:, column], top_n * rerank if rerank else top_n)
+            results.append(rerank_exact(self.vectors, query, ids, top_n) if rerank else (ids, approximate))
+        return results
+
+    def state(self):
+        return {"codes": self.codes, "scale": self.scale, "rerank": np.int64(self.rerank)}
+
+    @classmethod
+    def from_state(cls, vectors, state):
+        return cls(vectors, state["codes"], state["scale"], rerank=int(state["rerank"]))
+
+
+def nearest_centroids(block, centroids):
+    return np.argmin((centroids ** 2).sum(axis=1) - 2 * block @ centroids.T, axis=1)
+
+
+def train_codebook(sample, ksub, n_iter, rng):
+    """
+    k-means (squared L2) over the subvectors of one subspace.
+    """
+    centroids = sample[rng.choice(len(sample), size=ksub, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = nearest_centroids(sample, centroids)
+        counts = np.bincount(assignments, minlength=ksub)
+        sums = np.stack([np.bincount(assignments, weights=sample[:, d], minlength=ksub) for d in range(sample.shape[1])], axis=1)
+        empty = counts == 0
+        # Re-seed empty clusters from random sample points
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        counts[empty] = 1
+        centroids = (sums / counts[:, None]).astype(np.float32)
+    return centroids
+
+
+class PQIndex:
+    """
+    Product-quantized flat index: each vector is split into `m` subvectors and each
+    subvector is stored as the uint8 id of its nearest of (up to) 256 sub-centroids, so a
+    row takes m bytes. A query precomputes a (m, 256) lookup table of inner products with
+    the sub-centroids, and a row's approximate score is the sum of its m table entries.
+    The best `rerank * top_n` rows are re-scored exactly against the float vectors.
+    """
+
+    backend = "pq"
+    compressed = True
+
+    def __init__(self, vectors, codebooks, codes, rerank=8):
+        self.vectors = vectors
+        self.codebooks = codebooks  # (m, ksub, dim / m) float32
+        self.codes = codes  # (m, rows) uint8, one contiguous row per subspace
+        self.rerank = rerank
+
+    def __len__(self):
+        return self.codes.shape[1]
+
+    @property
+    def m(self):
+        return len(self.codebooks)
+
+    @classmethod
+    def build(cls, vectors, m=48, ksub=256, rerank=8, n_iter=10, sample_size=100_000, seed=0, chunk_size=65_536):
+        """
+        Train one codebook per subspace on a sample of the vectors and encode every row.
+        """
+        n_rows, dim = vectors.shape
+        if dim % m:
+            raise ValueError(f"Dimension {dim} is not divisible into {m} subspaces")
+        ksub = min(ksub, 256, n_rows)
+        sub_dim = dim // m
+
+        rng = np.random.default_rng(seed)
+        sample_ids = rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+        sample = np.asarray(vectors[np.sort(sample_ids)], dtype=np.float32)
+        codebooks = np.stack([
+            train_codebook(sample[:, j * sub_dim:(j + 1) * sub_dim], ksub, n_iter, rng) for j in range(m)
+        ])
+
+        index = cls(vectors, codebooks, np.empty((m, n_rows), dtype=np.uint8), rerank)
+        for start in range(0, n_rows, chunk_size):
+            index.codes[:, start:start + chunk_size] = index.encode(vectors[start:start + chunk_size])
+        return index
+
+    def encode(self, block):
+        """
+        Codes of a block of vectors, as a (m, rows) uint8 matrix.
+        """
+        block = np.asarray(block, dtype=np.float32).reshape(len(block), self.m, -1)
+        return np.stack([nearest_centroids(block[:, j], self.codebooks[j]) for j in range(self.m)]).astype(np.uint8)
+
+    def update(self, vectors, rows):
+        """
+        Return an index over `vectors` (which may have grown) with the given rows re-encoded.
+        Codebooks are kept as they are.
+        """
+        codes = np.zeros((self.m, len(vectors)), dtype=np.uint8)
+        kept = min(len(self), len(vectors))
+        codes[:, :kept] = self.codes[:, :kept]
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows):
+            codes[:, rows] = self.encode(vectors[rows])
+        return PQIndex(vectors, self.codebooks, codes, self.rerank)
+
+    def rebuild(self, vectors):
+        """Return an index with the same settings trained from scratch on `vectors`."""
+        return PQIndex.build(vectors, m=self.m, ksub=self.codebooks.shape[1], rerank=self.rerank)
+
+    def approximate_scores(self, query):
+        """
+        Approximate inner product of every row with a query, summed from the lookup table.
+        """
+        table = np.einsum("jd,jkd->jk", np.asarray(query, dtype=np.float32).reshape(self.m, -1), self.codebooks)
+        scores = np.zeros(len(self), dtype=np.float32)
+        for j in range(self.m):
+            scores += table[j][self.codes[j]]
+        return scores
+
+    def search(self, query, top_n=5, rerank=None, exclude=None):
+        """Return (row ids, scores) of the top_n rows for a normalized query vector."""
+        rerank = self.rerank if rerank is None else rerank
+        query = np.asarray(query, dtype=np.float32)
+        scores = exclude_rows(self.approximate_scores(query), exclude)
+        ids, approximate = shortlist(scores, top_n * rerank if rerank else top_n)
+        return rerank_exact(self.vectors, query, ids, top_n) if rerank else (ids, approximate)
+
+    def search_batch(self, queries, top_n=5, rerank=None, exclude=None):
+        """Search each query of a (batch, dim) matrix; every query has its own lookup table."""
+        return [self.search(query, top_n, rerank, exclude) for query in queries]
+
+    def state(self):
+        return {"codebooks": self.codebooks, "codes": self.codes, "rerank": np.int64(self.rerank)}
+
+    @classmethod
+    def from_state(cls, vectors, state):
+        return cls(vectors, state["codebooks"], state["codes"], rerank=int(state["rerank"]))
+
+
+INDEX_BACKENDS = {
+    ExactIndex.backend: ExactIndex,
+    IVFIndex.backend: IVFIndex,
+    Int8Index.backend: Int8Index,
+    PQIndex.backend: PQIndex,
+}
+
+
+def resident_bytes(index):
+    """
+    Bytes an index keeps in memory to answer queries: its own arrays, plus the float vectors
+    for backends that scan them. Compressed backends only read the re-ranked short list.
+    """
+    state_bytes = sum(np.asarray(value).nbytes for value in index.state().values())
+    if getattr(index, "compressed", False):
+        return state_bytes
+    return state_bytes + np.asarray(index.vectors).nbytes
+
+
+def build_index(vectors, backend="exact", **params):
+    """
+    Build an index of the given backend over normalized vectors.
+    """
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend: {backend}")
+    if backend == ExactIndex.backend:
+        return ExactIndex(vectors)
+    return INDEX_BACKENDS[backend].build(vectors, **params)
+
+
+def save_index(index, path=DEFAULT_INDEX_PATH, source=None):
+    """
+    Persist the index structure (not the vectors) as an .npz file. `source` identifies the
+    vectors it was built on (see ScoringEngine.index_source) and is checked by load_index.
+    """
+    header = {"backend": index.backend, "rows": len(index), "source": source}
+    np.savez(path, header=np.array(json.dumps(header)), **index.state())
+    logging.info(f"Saved {index.backend} index over {len(index)} rows to {path}")
+
+
+def load_index(path, vectors, source=None):
+    """
+    Load an index persisted with save_index and attach it to the vectors it was built on.
+    Raises ValueError when the index was built over other vectors: a different row count or
+    a different `source` (store version and field weights), as after an update of the
+    catalog that kept its size.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data["header"]))
+        state = {key: data[key] for key in data.files if key != "header"}
+
+    if header["rows"] != len(vectors):
+        raise ValueError(f"Index was built over {header['rows']} rows but embeddings have {len(vectors)}")
+    if header.get("source") != source:
+        raise ValueError(f"Index was built over {header.get('source')}, not {source}")
+    return INDEX_BACKENDS[header["backend"]].from_state(vectors, state)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the vector index over the precombined field embeddings.")
+    parser.add_argument("--store", default="./data/embedding_store")
+    parser.add_argument("--output", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--backend", choices=sorted(INDEX_BACKENDS), default="ivf")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--rerank", type=int, default=None, help="Short list multiplier re-ranked with float vectors (int8, pq)")
+    parser.add_argument("--m", type=int, default=48, help="Subspaces of the pq backend (must divide the dimension)")
+    parser.add_argument("--weights", help="Field weights the index is built for, e.g. titles=0.6,categories=0.2,features=0.2")
+    args = parser.parse_args()
+
+    from embedding_store import EmbeddingStore
+    from scoring_engine import ScoringEngine, parse_weights
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    engine = ScoringEngine(EmbeddingStore.open(args.store), parse_weights(args.weights))
+    params = {
+        IVFIndex.backend: {"nlist": args.nlist, "nprobe": args.nprobe},
+        PQIndex.backend: {"m": args.m},
+    }.get(args.backend, {})
+    if args.rerank is not None and getattr(INDEX_BACKENDS[args.backend], "compressed", False):
+        params["rerank"] = args.rerank
+    save_index(build_index(engine.combined, args.backend, **params), args.output, engine.index_source())
@@ -0,0 +1,52 @@
+import time
+
+
+class StubResult:
+    def __init__(self, records):
+        self.records = records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def consume(self):
+        return None
+
+
+class StubSession:
+    def __init__(self, driver, config):
+        self.driver = driver
+        self.config = config
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, **params):
+        self.driver.runs.append((getattr(query, "text", query), params))
+        if self.driver.delay:
+            time.sleep(self.driver.delay)
+        return StubResult(self.driver.respond(getattr(query, "text", query), params))
+
+    def execute_write(self, work, *args):
+        self.driver.write_transactions += 1
+        return work(self, *args)  # the session stands in for the transaction
+
+
+class StubDriver:
+    """
+    Local stand-in for a neo4j driver: records every query with its parameters and answers
+    with `respond(query text, params)` (no records by default) after an optional delay.
+    """
+
+    def __init__(self, respond=None, delay=0.0):
+        self.respond = respond or (lambda query, params: [])
+        self.delay = delay
+        self.runs = []
+        self.sessions = []
+        self.write_transactions = 0
+
+    def session(self, **config):
+        self.sessions.append(config)
+        return StubSession(self, config)
@@ -0,0 +1,45 @@
+import json
+import os
+import time
+from attribute_index import AttributeIndex, normalize_filters, product_matches
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "product_metadata.json")
+
+
+def test_index_of_shipped_catalog_stays_small_and_fast():
+    with open(CATALOG_PATH, "r", encoding="utf-8") as file:
+        metadata = json.load(file)
+
+    started = time.perf_counter()
+    index = AttributeIndex.build(metadata)
+    seconds = time.perf_counter() - started
+
+    variants = sum(len(tokens) for field in index.variants.values() for tokens in field.values())
+    assert variants < 100 * len(metadata)  # 6.5k per product when every word pair was indexed
+    assert seconds < 5
+    assert len(index.candidates(normalize_filters({"categories": ["kitchen"]}))) > 0
+
+
+def test_category_typos_match():
+    product = {"categories": ["Kitchen & Dining"], "features": []}
+    assert product_matches(normalize_filters({"categories": ["kitchn"]}), product)
+    assert not product_matches(normalize_filters({"categories": ["garden"]}), product)
+
+
+def test_compound_words_match_both_ways():
+    assert product_matches(normalize_filters({"features": ["nonstick"]}), {"features": ["Non-stick coating"]})
+    assert product_matches(normalize_filters({"features": ["non-stick"]}), {"features": ["nonstick pan"]})
+
+
+def test_long_feature_words_match_exactly():
+    product = {"features": ["Brushed stainless steel body"]}
+    assert product_matches(normalize_filters({"features": ["stainless steel"]}), product)
+    assert not product_matches(normalize_filters({"features": ["stainles"]}), product)
+    # Short feature words still tolerate a typo
+    assert product_matches(normalize_filters({"features": ["stel"]}), product)
+
+
+def test_feature_filters_require_every_term():
+    product = {"features": ["USB-C charging", "LED display"]}
+    assert product_matches(normalize_filters({"features": ["usb c", "led"]}), product)
+    assert not product_matches(normalize_filters({"features": ["usb c", "bluetooth"]}), product)
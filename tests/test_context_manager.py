@@ -0,0 +1,81 @@
+import asyncio
+import fakeredis
+import fakeredis.aioredis
+import context_manager
+from context_manager import ContextManager, context_key, get_contexts, redis_settings
+
+
+def test_context_is_capped_to_the_last_turns():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    session = ContextManager("u1", client, max_turns=3)
+    for turn in range(5):
+        session.store_context(f"q{turn}", f"r{turn}")
+
+    assert client.llen(context_key("u1")) == 3
+    assert [turn["query"] for turn in session.get_context(last_n=10)] == ["q2", "q3", "q4"]
+    assert [turn["query"] for turn in session.get_context(last_n=2)] == ["q3", "q4"]
+
+
+def test_reads_and_writes_renew_the_ttl():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    session = ContextManager("u1", client, ttl=100)
+    session.store_context("q", "r")
+    assert 0 < client.ttl(context_key("u1")) <= 100
+
+    client.expire(context_key("u1"), 5)
+    session.get_context()
+    assert client.ttl(context_key("u1")) > 5
+
+
+def test_queued_commands_share_one_pipeline():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    session = ContextManager("u1", client, max_turns=2)
+    with client.pipeline(transaction=False) as pipe:
+        session.queue_store_context(pipe, "q1", "r1")
+        session.queue_store_context(pipe, "q2", "r2")
+        session.queue_store_context(pipe, "q3", "r3")
+        session.queue_get_context(pipe, last_n=5)
+        replies = pipe.execute()
+
+    assert len(replies) == 3 * 3 + 2
+    assert [context_manager.decode_turns(replies[-1])[i]["query"] for i in range(2)] == ["q2", "q3"]
+
+
+def test_get_contexts_reads_many_sessions():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    ContextManager("a", client).store_context("qa", "ra")
+    ContextManager("b", client).store_context("qb", "rb")
+
+    contexts = get_contexts(["a", "b", "missing"], client=client)
+    assert contexts == {"a": [{"query": "qa", "response": "ra"}], "b": [{"query": "qb", "response": "rb"}], "missing": []}
+    assert client.ttl(context_key("missing")) == -2  # renewing a missing session does not create it
+
+
+def test_asyncio_pipeline_uses_the_same_commands():
+    async def run():
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        session = ContextManager("u1", max_turns=2, ttl=50)
+        async with client.pipeline(transaction=False) as pipe:
+            for turn in range(3):
+                session.queue_store_context(pipe, f"q{turn}", f"r{turn}")
+            session.queue_get_context(pipe)
+            replies = await pipe.execute()
+        return replies, await client.ttl(context_key("u1"))
+
+    replies, ttl = asyncio.run(run())
+    assert [turn["query"] for turn in context_manager.decode_turns(replies[-1])] == ["q1", "q2"]
+    assert 0 < ttl <= 50
+
+
+def test_sync_and_async_clients_share_settings(monkeypatch):
+    import asgi_app
+
+    monkeypatch.setattr(context_manager, "redis_db", 3)
+    monkeypatch.setenv("REDIS_SOCKET_TIMEOUT", "0.5")
+    settings = redis_settings()
+    assert settings["db"] == 3 and settings["socket_timeout"] == 0.5
+
+    monkeypatch.setattr(asgi_app.aioredis, "Redis", fakeredis.aioredis.FakeRedis)
+    asyncio.run(asgi_app.connect_redis())
+    assert asgi_app.redis_client.connection_pool.connection_kwargs["db"] == 3
+    assert asgi_app.redis_client.connection_pool.connection_kwargs["socket_timeout"] == 0.5
@@ -0,0 +1,88 @@
+import json
+import os
+import numpy as np
+import Compute_embeddings
+from Compute_embeddings import SIDECAR_FILES, compute_embeddings
+from embedding_store import MANIFEST_FILE, EmbeddingStore, StoreWriter
+
+PRODUCTS = [
+    {"title": f"Product {i}", "description": f"Description {i}", "categories": [f"category {i % 4}"], "features": [f"feature {i % 7}"]}
+    for i in range(45)
+]
+
+
+def read_manifest(store_path):
+    with open(os.path.join(store_path, MANIFEST_FILE), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def assert_same_store(store_path, expected_path):
+    assert read_manifest(store_path) == read_manifest(expected_path)
+    store, expected = EmbeddingStore.open(store_path), EmbeddingStore.open(expected_path)
+    for field in expected.fields:
+        np.testing.assert_array_equal(np.array(store[field]), np.array(expected[field]))
+
+
+def test_resumed_writer_matches_an_uninterrupted_one(tmp_path):
+    rng = np.random.default_rng(0)
+    chunks = [{field: rng.standard_normal((8, 16)).astype(np.float32) for field in ("titles", "features")} for _ in range(3)]
+
+    writer = StoreWriter(str(tmp_path / "expected"), ["titles", "features"], 16)
+    for chunk in chunks:
+        writer.append(chunk)
+        writer.checkpoint()
+    writer.finalize()
+
+    # Stop after the first chunk's checkpoint, with half of the second chunk already appended
+    writer = StoreWriter(str(tmp_path / "store"), ["titles", "features"], 16)
+    writer.append(chunks[0])
+    writer.checkpoint({"chunks": 1})
+    writer.append({field: matrix[:4] for field, matrix in chunks[1].items()})
+    writer.close()
+
+    resumed = StoreWriter(str(tmp_path / "store"), ["titles", "features"], 16)
+    assert resumed.rows == 8 and resumed.resume_state == {"chunks": 1}
+    for chunk in chunks[1:]:
+        resumed.append(chunk)
+        resumed.checkpoint()
+    resumed.finalize()
+
+    assert_same_store(str(tmp_path / "store"), str(tmp_path / "expected"))
+    assert not os.path.exists(str(tmp_path / "store.partial"))
+
+
+def test_interrupted_build_resumes_to_the_same_store(tmp_path, monkeypatch):
+    input_path = str(tmp_path / "products.jsonl")
+    with open(input_path, "w", encoding="utf-8") as file:
+        file.writelines(json.dumps(product) + "\n" for product in PRODUCTS)
+    build = lambda store: compute_embeddings(input_path, str(tmp_path / f"{store}.json"), str(tmp_path / store), model_name="stub", chunk_size=10)
+    build("expected")
+
+    # Fail the third checkpoint: its chunk's rows and sidecar records are written but not recorded
+    checkpoint, calls = StoreWriter.checkpoint, []
+
+    def failing_checkpoint(writer, state=None):
+        calls.append(writer.rows)
+        if len(calls) == 3:
+            raise OSError("interrupted")
+        checkpoint(writer, state)
+
+    monkeypatch.setattr(StoreWriter, "checkpoint", failing_checkpoint)
+    build("store")
+    assert not os.path.exists(str(tmp_path / "store")) and calls == [10, 20, 30]
+
+    monkeypatch.undo()
+    encode_chunk, encoded = Compute_embeddings.encode_chunk, []
+
+    def counting_encode_chunk(model, chunk, batch_size=32):
+        encoded.append(len(chunk))
+        return encode_chunk(model, chunk, batch_size)
+
+    monkeypatch.setattr(Compute_embeddings, "encode_chunk", counting_encode_chunk)
+    build("store")
+
+    assert encoded == [10, 10, 5]  # Only the chunks after the last checkpoint are encoded again
+    assert_same_store(str(tmp_path / "store"), str(tmp_path / "expected"))
+    for name in SIDECAR_FILES:
+        with open(tmp_path / "store" / name, "rb") as file, open(tmp_path / "expected" / name, "rb") as expected:
+            assert file.read() == expected.read()
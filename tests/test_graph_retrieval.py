@@ -0,0 +1,58 @@
+from functools import partial
+import numpy as np
+from graph_retrieval import GraphExpander
+from neo4j_integration import CATEGORY_NEIGHBORS_QUERY, get_category_neighbors
+from stub_neo4j import StubDriver
+
+
+def neighbor_records(query, params):
+    return [{"id": "a", "neighbors": [{"id": "c", "overlap": 0.5}]}] if query == CATEGORY_NEIGHBORS_QUERY else []
+
+
+def test_neighbors_come_from_one_read_query():
+    driver = StubDriver(neighbor_records)
+    expander = GraphExpander(partial(get_category_neighbors, graph_driver=driver), budget_ms=500)
+
+    assert expander.neighbors(["a", "b"]) == {"a": [("c", 0.5)]}
+    assert [params["ids"] for _, params in driver.runs] == [["a", "b"]]
+    assert driver.sessions[0]["default_access_mode"] == "READ"
+    assert expander.stats()["expanded"] == 1
+
+
+def test_slow_graph_is_abandoned_at_the_budget():
+    driver = StubDriver(neighbor_records, delay=0.5)
+    expander = GraphExpander(partial(get_category_neighbors, graph_driver=driver), budget_ms=20)
+
+    assert expander.neighbors(["a"]) is None
+    stats = expander.stats()
+    assert stats["timeouts"] == 1 and stats["expanded"] == 0
+    assert stats["mean_graph_ms"] < 400
+
+
+def test_spent_request_budget_skips_the_graph():
+    driver = StubDriver(neighbor_records)
+    expander = GraphExpander(partial(get_category_neighbors, graph_driver=driver), budget_ms=50)
+
+    assert expander.neighbors(["a"], deadline=0.0) is None
+    assert expander.stats()["skipped"] == 1
+    assert driver.runs == []
+
+
+def test_graph_errors_keep_the_vector_ranking():
+    def fail(query, params):
+        raise RuntimeError("graph down")
+
+    expander = GraphExpander(partial(get_category_neighbors, graph_driver=StubDriver(fail)), budget_ms=500)
+    assert expander.neighbors(["a"]) is None
+    assert expander.stats()["errors"] == 1
+
+
+def test_rerank_merges_neighbors_of_hits():
+    expander = GraphExpander(lambda *args: {}, weight=0.5)
+    keys = ["a", "b", "c"]
+    ids, scores = expander.rerank(
+        np.array([0, 1]), np.array([0.9, 0.8], dtype=np.float32), {"a": [("c", 1.0)]},
+        keys, {key: row for row, key in enumerate(keys)}, lambda rows: np.full(len(rows), 0.8, dtype=np.float32), top_n=3,
+    )
+    assert ids.tolist() == [0, 2, 1]
+    np.testing.assert_allclose(scores, [0.9, 0.85, 0.8])
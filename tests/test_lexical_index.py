@@ -0,0 +1,26 @@
+import numpy as np
+from lexical_index import BM25Index, fuse
+from result_cache import canonicalize_query
+
+TEXTS = ["wireless mouse", "mechanical keyboard", "mouse pad", "keyboard and mouse combo"]
+
+
+def test_queries_sharing_a_cache_key_score_alike():
+    index = BM25Index.build(TEXTS)
+    assert canonicalize_query("mouse mouse keyboard") == canonicalize_query("keyboard mouse")
+    np.testing.assert_array_equal(index.score("mouse mouse keyboard"), index.score("keyboard mouse"))
+
+
+def test_search_finds_exact_tokens():
+    index = BM25Index.build(TEXTS + ["logitech mx3-s"])
+    ids, scores = index.search("MX3-S", top_n=3)
+    assert ids.tolist() == [4] and scores[0] > 0
+
+
+def test_weighted_fusion_scales_negative_vector_scores():
+    vector = (np.array([0, 1, 2]), np.array([-0.1, -0.2, -0.4], dtype=np.float32))
+    lexical = (np.array([2]), np.array([4.0], dtype=np.float32))
+    ids, scores = fuse(vector, lexical, 0.5, top_n=3, method="weighted")
+
+    assert ids.tolist() == [0, 2, 1]
+    assert ((scores >= 0) & (scores <= 1)).all()
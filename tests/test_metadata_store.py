@@ -0,0 +1,99 @@
+import json
+import logging
+import numpy as np
+import pytest
+from Compute_embeddings import compute_embeddings, update_embeddings
+from embedding_store import METADATA_FILE, EmbeddingStore
+from json_stream import iter_jsonl
+from metadata_store import METADATA_OFFSETS_FILE, MetadataStore, line_offsets
+
+PRODUCTS = [
+    {"title": "Café crème mug", "description": "Grès émaillé, 350 ml", "categories": ["cuisine"], "features": ["lave-vaisselle"]},
+    {"title": "Wireless mouse", "description": "", "categories": ["electronics"], "features": ["usb"]},
+    {"title": "Чайник", "description": "Нержавеющая сталь", "categories": ["кухня"], "features": ["1.7 л"]},
+    {"title": "保温杯", "description": "不锈钢 🍵", "categories": ["厨房"], "features": ["500毫升"]},
+]
+
+
+def write_catalog(path, products):
+    # ensure_ascii=False keeps the multi-byte characters as raw UTF-8 in the input
+    with open(path, "w", encoding="utf-8") as file:
+        for product in products:
+            file.write(json.dumps(product, ensure_ascii=False) + "\n")
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    input_path, store_path = str(tmp_path / "products.jsonl"), str(tmp_path / "store")
+    write_catalog(input_path, PRODUCTS)
+    compute_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+    return store_path
+
+
+def test_line_offsets_count_bytes_across_chunks(tmp_path):
+    path = tmp_path / "rows.jsonl"
+    lines = ['{"t": "é"}\n', '{"t": "🍵"}\n', '{"t": "a"}']  # no trailing newline
+    path.write_bytes("".join(lines).encode("utf-8"))
+
+    sizes = [len(line.encode("utf-8")) for line in lines]
+    expected = np.cumsum([0] + sizes)
+    np.testing.assert_array_equal(line_offsets(str(path), chunk_size=5), expected)
+    np.testing.assert_array_equal(line_offsets(str(path)), expected)
+
+
+def test_rows_of_a_raw_utf8_sidecar_are_sliced_by_byte_offset(tmp_path):
+    # Builds escape non-ASCII text, but a sidecar holding raw UTF-8 must slice on bytes, not characters
+    path = str(tmp_path / METADATA_FILE)
+    write_catalog(path, PRODUCTS)
+    metadata = MetadataStore(path, line_offsets(path, chunk_size=7))
+
+    assert len(metadata) == len(PRODUCTS)
+    assert list(metadata) == PRODUCTS
+    assert metadata.rows([3, 2]) == [PRODUCTS[3], PRODUCTS[2]]
+
+
+def test_rows_decode_multi_byte_text(store_path):
+    store = EmbeddingStore.open(store_path)
+    metadata = MetadataStore.open(store)
+    expected = list(iter_jsonl(store.file_path(METADATA_FILE)))
+
+    assert len(metadata) == len(PRODUCTS) == len(expected)
+    assert list(metadata) == expected
+    assert metadata[3]["title"] == "保温杯" and metadata[-2]["title"] == "Чайник"
+    assert metadata.rows([3, 0]) == [expected[3], expected[0]]
+    with pytest.raises(IndexError):
+        metadata[len(PRODUCTS)]
+
+
+def test_reopening_after_an_update_reads_the_rewritten_rows(store_path, tmp_path):
+    store = EmbeddingStore.open(store_path)
+    before = MetadataStore.open(store)
+    old_rows = list(before)
+
+    changed = [dict(PRODUCTS[0], description="Grès noir, 450 ml"), *PRODUCTS[1:], {"title": "Tasse à thé", "description": "Porcelaine", "categories": ["cuisine"], "features": ["🫖"]}]
+    write_catalog(str(tmp_path / "products.jsonl"), changed)
+    update_embeddings(str(tmp_path / "products.jsonl"), str(tmp_path / "metadata.json"), store_path, model_name="stub")
+
+    updated = EmbeddingStore.open(store_path)
+    assert updated.file_path(METADATA_FILE) != store.file_path(METADATA_FILE)
+    after = MetadataStore.open(updated)
+    assert list(after) == list(iter_jsonl(updated.file_path(METADATA_FILE)))
+    live = [after[row] for row in range(len(after)) if row not in set(updated.deleted.tolist())]
+    assert sorted(row["title"] for row in live) == sorted(product["title"] for product in changed)
+    assert "Grès noir, 450 ml" in [row["description"] for row in live]
+    # A reader still holding the previous version keeps seeing its rows
+    assert list(before) == old_rows
+
+
+def test_out_of_date_offsets_are_rescanned(store_path, caplog):
+    store = EmbeddingStore.open(store_path)
+    offsets_path = store.file_path(METADATA_OFFSETS_FILE)
+    # Offsets of a shorter sidecar, e.g. left behind by an older build
+    np.save(offsets_path, np.load(offsets_path)[:-1])
+
+    with caplog.at_level(logging.WARNING):
+        metadata = MetadataStore.open(store)
+
+    assert METADATA_OFFSETS_FILE in caplog.text
+    assert len(metadata) == len(PRODUCTS)
+    assert list(metadata) == list(iter_jsonl(store.file_path(METADATA_FILE)))
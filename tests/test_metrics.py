@@ -0,0 +1,68 @@
+import os
+import pstats
+import subprocess
+import sys
+import metrics
+from batch_scheduler import MicroBatcher
+from metrics import COUNT_BUCKETS, MetricsRegistry, sampled_profile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def test_observations_are_bucketed_histograms():
+    registry = MetricsRegistry()
+    for seconds in (0.002, 0.003, 0.2):
+        registry.observe("search_stage_seconds", seconds, "Stage seconds.", stage="encode")
+    registry.observe("search_candidates", 5000, "Candidates.", buckets=COUNT_BUCKETS)
+    registry.inc("search_result_cache_lookups_total", "Lookups.", result="misses")
+
+    text = registry.render().decode()
+    assert "# TYPE search_stage_seconds histogram" in text
+    assert 'search_stage_seconds_bucket{le="0.005",stage="encode"} 2.0' in text
+    assert 'search_stage_seconds_bucket{le="0.25",stage="encode"} 3.0' in text
+    assert 'search_stage_seconds_count{stage="encode"} 3.0' in text
+    assert 'search_candidates_bucket{le="1000.0"} 0.0' in text
+    assert 'search_candidates_bucket{le="10000.0"} 1.0' in text
+    assert 'search_result_cache_lookups_total{result="misses"} 1.0' in text
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    registry.observe("search_stage_seconds", 0.1, stage="encode")
+    assert b"search_stage_seconds" not in registry.render()
+
+
+def test_multiprocess_scrape_merges_all_workers(tmp_path):
+    # prometheus_client picks its storage when imported, so each worker is a fresh interpreter
+    worker = (
+        "from metrics import metrics\n"
+        "metrics.observe('http_request_seconds', 0.01, endpoint='chat')\n"
+        "metrics.inc('search_result_cache_lookups_total', result='misses')\n"
+    )
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path), "PYTHONPATH": SRC}
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], env=env, check=True)
+
+    scrape = subprocess.run([sys.executable, "-c", "from metrics import metrics; print(metrics.render().decode())"],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    assert 'http_request_seconds_count{endpoint="chat"} 2.0' in scrape
+    assert 'search_result_cache_lookups_total{result="misses"} 2.0' in scrape
+
+
+def test_sampled_profile_covers_the_batcher_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+
+    def rank_items(items):
+        return [item * 2 for item in items]
+
+    def handler(items):
+        with sampled_profile("search_batch"):
+            return rank_items(items)
+
+    batcher = MicroBatcher(handler, max_batch_size=4, max_wait_ms=1)
+    assert batcher.submit(21).result(timeout=5) == 42
+
+    (profile,) = tmp_path.iterdir()
+    assert profile.name.startswith("search_batch-")
+    assert any(function == "rank_items" for _, _, function in pstats.Stats(str(profile)).stats)
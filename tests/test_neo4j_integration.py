@@ -0,0 +1,40 @@
+from neo4j_integration import CATEGORY_NEIGHBORS_QUERY, SCHEMA_QUERIES, UPSERT_PRODUCTS_QUERY, bulk_load_products
+from stub_neo4j import StubDriver
+
+
+def products(count):
+    return [(f"p{i}", {"title": f"Product {i}", "categories": ["kitchen", f"c{i % 3}"]}) for i in range(count)]
+
+
+def test_bulk_load_sends_schema_then_unwind_batches():
+    driver = StubDriver()
+    report = bulk_load_products(products(25), driver, batch_size=10)
+
+    assert [query for query, _ in driver.runs[:len(SCHEMA_QUERIES)]] == SCHEMA_QUERIES
+    batches = [params["rows"] for query, params in driver.runs if query == UPSERT_PRODUCTS_QUERY]
+    assert [len(rows) for rows in batches] == [10, 10, 5]
+    assert driver.write_transactions == 3
+    assert batches[0][0] == {"id": "p0", "title": "Product 0", "description": "", "features": [], "categories": ["kitchen", "c0"]}
+    assert report["rows"] == 25 and report["batches"] == 3
+
+
+def test_parallel_load_sends_every_row_once():
+    driver = StubDriver()
+    report = bulk_load_products(products(95), driver, batch_size=10, parallelism=4)
+
+    ids = [row["id"] for query, params in driver.runs if query == UPSERT_PRODUCTS_QUERY for row in params["rows"]]
+    assert sorted(ids) == sorted(f"p{i}" for i in range(95))
+    assert report["rows"] == 95 and report["batches"] == 10
+
+
+def test_upsert_replaces_category_edges_instead_of_a_list_property():
+    # Edges to dropped categories are deleted before the current ones are merged
+    assert UPSERT_PRODUCTS_QUERY.index("DELETE old") < UPSERT_PRODUCTS_QUERY.index("MERGE (p)-[:IN]->(c)")
+    assert "NOT dropped.name IN row.categories" in UPSERT_PRODUCTS_QUERY
+    assert "p.categories =" not in UPSERT_PRODUCTS_QUERY
+    assert "REMOVE p.categories" in UPSERT_PRODUCTS_QUERY
+
+
+def test_neighbor_overlap_counts_category_edges():
+    assert "p.categories" not in CATEGORY_NEIGHBORS_QUERY
+    assert "COUNT { (p)-[:IN]->(:Category) }" in CATEGORY_NEIGHBORS_QUERY
@@ -0,0 +1,74 @@
+import json
+import numpy as np
+import pytest
+from query_encoder import QueryEncoder, TermEmbeddingCache, build_warm_cache
+from stub_encoder import StubEncoder
+
+
+class CountingEncoder(StubEncoder):
+    """Stub encoder recording the terms of every model call."""
+
+    def __init__(self, dim=384):
+        super().__init__(dim)
+        self.calls = []
+
+    def encode(self, sentences, **kwargs):
+        self.calls.append(list(sentences))
+        return super().encode(sentences, **kwargs)
+
+
+def test_lru_evicts_the_least_recently_used_term():
+    cache = TermEmbeddingCache(max_size=2)
+    cache.put("a", np.ones(2))
+    cache.put("b", np.ones(2))
+    assert cache.get("a") is not None  # "b" is now the least recently used
+    cache.put("c", np.ones(2))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (2, 3, 1)
+
+
+def test_misses_are_encoded_in_one_call_and_cached():
+    model = CountingEncoder()
+    encoder = QueryEncoder(model)
+
+    first = encoder.encode_terms(["mouse", "pad", "mouse"])
+    second = encoder.encode_terms(["mouse", "wireless"])
+
+    assert model.calls == [["mouse", "pad"], ["wireless"]]
+    np.testing.assert_array_equal(first[0], second[0])
+    stats = encoder.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 3, 0.25)
+
+
+def test_warm_cache_serves_terms_without_the_model(tmp_path):
+    path = str(tmp_path / "term_cache")
+    build_warm_cache(StubEncoder(), ["mouse", "keyboard"], path, model_name="stub")
+    model = CountingEncoder()
+    encoder = QueryEncoder(model, warm_cache_path=path, model_name="stub")
+
+    vectors = encoder.encode_terms(["mouse", "mouse"])
+    encoder.encode_terms(["mouse", "cable"])
+
+    assert model.calls == [["cable"]]
+    np.testing.assert_allclose(vectors[0], StubEncoder().encode("mouse"), rtol=1e-6)
+    stats = encoder.stats()
+    assert (stats["warm_hits"], stats["hits"], stats["misses"], stats["warm_terms"]) == (1, 1, 1, 2)
+
+
+@pytest.mark.parametrize("built_with, dim", [("other-model", 384), ("stub", 32), (None, 384)])
+def test_warm_cache_of_another_model_or_dimension_is_ignored(tmp_path, built_with, dim):
+    path = str(tmp_path / "term_cache")
+    build_warm_cache(StubEncoder(dim), ["mouse"], path, model_name=built_with)
+    if built_with is None:
+        # Caches written before the header named the model hold just the term list
+        with open(f"{path}.json", "w", encoding="utf-8") as file:
+            json.dump(["mouse"], file)
+    model = CountingEncoder()
+    encoder = QueryEncoder(model, warm_cache_path=path, model_name="stub")
+
+    assert encoder.stats()["warm_terms"] == 0
+    assert encoder.encode_terms(["mouse"]).shape == (1, 384)
+    assert model.calls == [["mouse"]]
@@ -0,0 +1,104 @@
+import threading
+import time
+import pytest
+import result_cache
+from result_cache import ResultCache
+
+WAITERS = 4
+
+
+def run_concurrently(cache, key, compute, callers):
+    """Start `callers` threads on one key; return their results, errors and threads."""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(cache.get_or_compute(key, compute))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return results, errors, threads
+
+
+def wait_for_waiters(cache, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while cache.stats()["coalesced"] < count:
+        assert time.monotonic() < deadline, "callers never coalesced onto the first computation"
+        time.sleep(0.001)
+
+
+def test_l1_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    cache = ResultCache(redis_client=None, l1_ttl=10)
+    computed = []
+
+    def compute():
+        computed.append(now[0])
+        return [{"title": "Mouse"}]
+
+    cache.get_or_compute("key", compute)
+    now[0] += 9
+    assert cache.get_or_compute("key", compute) == [{"title": "Mouse"}]
+    now[0] += 2
+    cache.get_or_compute("key", compute)
+
+    assert computed == [1000.0, 1011.0]
+    stats = cache.stats()
+    assert (stats["l1_hits"], stats["misses"], stats["l1_size"]) == (1, 2, 1)
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = ResultCache(redis_client=None)
+    release, calls = threading.Event(), []
+
+    def compute():
+        calls.append(threading.current_thread().name)
+        release.wait(timeout=5)
+        return [{"title": "Mouse"}]
+
+    results, errors, threads = run_concurrently(cache, "key", compute, WAITERS + 1)
+    wait_for_waiters(cache, WAITERS)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(calls) == 1 and not errors
+    assert results == [[{"title": "Mouse"}]] * (WAITERS + 1)
+    assert (cache.stats()["misses"], cache.stats()["coalesced"]) == (1, WAITERS)
+    assert cache.inflight == {}
+
+
+def test_failed_computation_releases_its_waiters():
+    cache = ResultCache(redis_client=None)
+    release = threading.Event()
+
+    def compute():
+        release.wait(timeout=5)
+        raise ValueError("ranking failed")
+
+    results, errors, threads = run_concurrently(cache, "key", compute, WAITERS + 1)
+    wait_for_waiters(cache, WAITERS)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert not results and len(errors) == WAITERS + 1
+    assert all(isinstance(error, ValueError) for error in errors)
+    # The failure is neither cached nor left in flight, so the next caller computes again
+    assert cache.inflight == {} and cache.l1.get("key") is None
+    assert cache.get_or_compute("key", lambda: [{"title": "Mouse"}]) == [{"title": "Mouse"}]
+
+
+def test_without_redis_extra_writes_are_skipped():
+    cache = ResultCache(redis_client=None)
+    extra_writes = pytest.fail  # Only called with a Redis pipeline
+
+    assert cache.get_or_compute("key", lambda: [], extra_writes) == []
+    assert cache.get_or_compute("key", lambda: pytest.fail("recomputed"), extra_writes) == []
+    assert cache.stats()["l1_hits"] == 1
@@ -0,0 +1,59 @@
+import json
+import pytest
+from Compute_embeddings import compute_embeddings, update_embeddings
+
+PRODUCTS = [
+    {"title": f"Product {i}", "description": "", "categories": [f"category {i % 4}"], "features": [f"feature {i % 7}"]}
+    for i in range(40)
+]
+
+
+def write_catalog(path, products):
+    with open(path, "w", encoding="utf-8") as file:
+        for product in products:
+            file.write(json.dumps(product) + "\n")
+
+
+@pytest.fixture
+def search_engine(tmp_path, monkeypatch):
+    input_path, store_path = str(tmp_path / "products.jsonl"), str(tmp_path / "store")
+    write_catalog(input_path, PRODUCTS)
+    compute_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+
+    monkeypatch.setenv("SEARCH_NLTK_DOWNLOAD", "0")
+    monkeypatch.setenv("SEARCH_INDEX_PATH", str(tmp_path / "no_index.npz"))
+    monkeypatch.setenv("SEARCH_WARM_CACHE_PATH", "")
+    import search_engine
+
+    monkeypatch.setattr(search_engine, "store_path", store_path)
+    monkeypatch.setattr(search_engine, "SEARCH_MODEL", "stub")
+    monkeypatch.setattr(search_engine, "warmed_up", False)
+    search_engine.warm_up()
+    return search_engine, input_path, tmp_path
+
+
+def top_title(search_engine, query):
+    return search_engine.rank_batch([(query, 1, None, None, 0)])[0][0]["title"]
+
+
+def test_searches_during_a_refresh_see_one_catalog(search_engine, monkeypatch):
+    engine, input_path, tmp_path = search_engine
+    old_key = engine.build_cache_key("Product 30")[0]
+    # Dropping half the catalog compacts the store, so every remaining row id shifts
+    write_catalog(input_path, PRODUCTS[20:])
+    update_embeddings(input_path, str(tmp_path / "metadata.json"), engine.store_path, model_name="stub")
+
+    during = []
+    build = engine.AttributeIndex.build
+
+    def build_during_search(metadata):
+        during.append((engine.build_cache_key("Product 30")[0], top_title(engine, "Product 30")))
+        return build(metadata)
+
+    monkeypatch.setattr(engine.AttributeIndex, "build", build_during_search)
+    engine.refresh_embeddings(force=True)
+
+    assert during == [(old_key, "Product 30")]
+    assert engine.build_cache_key("Product 30")[0] != old_key
+    assert top_title(engine, "Product 30") == "Product 30"
+    assert len(engine.catalog.metadata) == len(engine.catalog.engine) == 20
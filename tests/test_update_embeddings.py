@@ -0,0 +1,106 @@
+import json
+import os
+import numpy as np
+import embedding_store
+from Compute_embeddings import ProductKeys, compute_embeddings, update_embeddings
+from embedding_store import CONTENT_FILE, METADATA_FILE, VERSIONED_FILE, EmbeddingStore
+from json_stream import iter_jsonl
+
+
+def write_catalog(path, products):
+    with open(path, "w", encoding="utf-8") as file:
+        for product in products:
+            file.write(json.dumps(product) + "\n")
+
+
+def build(tmp_path, products):
+    input_path, store_path = str(tmp_path / "products.jsonl"), str(tmp_path / "store")
+    write_catalog(input_path, products)
+    compute_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+    return input_path, store_path
+
+
+def live_metadata(store_path):
+    store = EmbeddingStore.open(store_path)
+    deleted = set(store.deleted.tolist())
+    return [record for row, record in enumerate(iter_jsonl(store.file_path(METADATA_FILE))) if row not in deleted]
+
+
+CATALOG = [
+    {"title": "Desk lamp", "description": "A", "categories": ["lighting"], "features": ["led"]},
+    {"title": "Desk lamp", "description": "B", "categories": ["office"], "features": ["usb"]},
+    {"title": "Kettle", "description": "C", "categories": ["kitchen"], "features": ["steel"]},
+]
+
+
+def test_repeated_titles_get_unique_keys():
+    keys = ProductKeys()
+    assert len({keys(product) for product in CATALOG}) == len(CATALOG)
+
+
+def test_unchanged_catalog_with_repeated_titles_is_up_to_date(tmp_path, capsys):
+    input_path, store_path = build(tmp_path, CATALOG)
+    version = EmbeddingStore.open(store_path).version
+
+    update_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+
+    assert "is up to date" in capsys.readouterr().out
+    assert EmbeddingStore.open(store_path).version == version
+    assert [product["description"] for product in live_metadata(store_path)] == ["A", "B", "C"]
+
+
+def test_update_of_one_repeated_title_keeps_the_other(tmp_path):
+    input_path, store_path = build(tmp_path, CATALOG)
+    before = np.array(EmbeddingStore.open(store_path)["categories"])
+
+    changed = [dict(CATALOG[0]), dict(CATALOG[1], description="B2"), dict(CATALOG[2])]
+    write_catalog(input_path, changed)
+    update_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+
+    store = EmbeddingStore.open(store_path)
+    assert len(store) == 3 and len(store.deleted) == 0
+    assert [product["description"] for product in live_metadata(store_path)] == ["A", "B2", "C"]
+    np.testing.assert_array_equal(np.array(store["categories"]), before)
+    keys = [record["key"] for record in iter_jsonl(store.file_path(CONTENT_FILE))]
+    assert len(set(keys)) == 3
+
+
+def test_interrupted_update_leaves_the_store_as_it_was(tmp_path, monkeypatch):
+    input_path, store_path = build(tmp_path, CATALOG)
+    store = EmbeddingStore.open(store_path)
+    before = {field: np.array(store[field]) for field in store.fields}
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    # Fail at the commit point, after every new file is written
+    write_catalog(input_path, CATALOG[:2] + [dict(CATALOG[2], title="Electric kettle")])
+    monkeypatch.setattr(embedding_store, "write_manifest", crash)
+    update_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+
+    reopened = EmbeddingStore.open(store_path)
+    assert reopened.version == store.version
+    for field in store.fields:
+        np.testing.assert_array_equal(np.array(reopened[field]), before[field])
+        np.testing.assert_array_equal(np.array(store[field]), before[field])  # Mapped rows never change
+    assert [product["title"] for product in live_metadata(store_path)] == ["Desk lamp", "Desk lamp", "Kettle"]
+
+    monkeypatch.undo()
+    update_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+    assert [product["title"] for product in live_metadata(store_path)] == ["Desk lamp", "Desk lamp", "Electric kettle"]
+    np.testing.assert_array_equal(np.array(store["titles"]), before["titles"])
+
+
+def test_updates_keep_only_the_last_two_versions(tmp_path):
+    input_path, store_path = build(tmp_path, CATALOG)
+    versions = []
+    for description in ("C2", "C3", "C4"):
+        write_catalog(input_path, CATALOG[:2] + [dict(CATALOG[2], description=description)])
+        update_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+        versions.append(EmbeddingStore.open(store_path).version)
+
+    assert len(set(versions)) == 3
+    tags = {name.split(".")[-2] for name in os.listdir(store_path) if VERSIONED_FILE.fullmatch(name)}
+    assert tags == {version[:12] for version in versions[-2:]}
+    assert not os.path.exists(f"{store_path}.delta")
+    assert live_metadata(store_path)[2]["description"] == "C4"
@@ -0,0 +1,77 @@
+import json
+import numpy as np
+import pytest
+from Compute_embeddings import compute_embeddings, update_embeddings
+from embedding_store import EmbeddingStore
+from scoring_engine import ScoringEngine
+from vector_index import build_index, load_index, normalize_rows, save_index
+
+PRODUCTS = [
+    {"title": f"Product {i}", "description": "", "categories": [f"category {i % 4}"], "features": [f"feature {i % 7}"]}
+    for i in range(40)
+]
+
+
+def write_catalog(path, products):
+    with open(path, "w", encoding="utf-8") as file:
+        for product in products:
+            file.write(json.dumps(product) + "\n")
+
+
+@pytest.fixture
+def store(tmp_path):
+    input_path, store_path = str(tmp_path / "products.jsonl"), str(tmp_path / "store")
+    write_catalog(input_path, PRODUCTS)
+    compute_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+    return input_path, store_path
+
+
+@pytest.mark.parametrize("backend", ["exact", "ivf"])
+def test_excluded_rows_are_never_returned(backend):
+    vectors = normalize_rows(np.random.default_rng(0).standard_normal((500, 32)).astype(np.float32))
+    index = build_index(vectors, backend)
+    exclude = np.arange(0, 500, 2)
+
+    for ids, _ in index.search_batch(vectors[:4], 5, exclude=exclude):
+        assert len(ids) == 5 and not np.isin(ids, exclude).any()
+
+
+@pytest.mark.parametrize("backend", ["int8", "pq"])
+def test_excluded_rows_stay_out_of_a_short_rerank_list(backend):
+    vectors = normalize_rows(np.random.default_rng(0).standard_normal((100, 32)).astype(np.float32))
+    params = {"m": 8} if backend == "pq" else {}
+    index = build_index(vectors, backend, rerank=4, **params)
+    live = np.array([3, 17, 42, 58, 61, 77, 90, 99])  # fewer than top_n * rerank = 20
+    exclude = np.setdiff1d(np.arange(100), live)
+
+    for ids, scores in index.search_batch(vectors[:4], 5, exclude=exclude):
+        assert len(ids) == 5 and np.isin(ids, live).all() and np.isfinite(scores).all()
+    ids, _ = index.search(vectors[0], 10, exclude=exclude)
+    assert sorted(ids) == sorted(live)
+
+
+def test_persisted_index_matches_its_source(store, tmp_path):
+    _, store_path = store
+    engine = ScoringEngine(EmbeddingStore.open(store_path))
+    index_path = str(tmp_path / "index.npz")
+    save_index(build_index(engine.combined, "int8"), index_path, engine.index_source())
+
+    assert load_index(index_path, engine.combined, engine.index_source()).backend == "int8"
+    reweighted = ScoringEngine(EmbeddingStore.open(store_path), {"titles": 1, "categories": 0, "features": 0})
+    with pytest.raises(ValueError):
+        load_index(index_path, reweighted.combined, reweighted.index_source())
+
+
+def test_same_size_update_invalidates_the_persisted_index(store, tmp_path):
+    input_path, store_path = store
+    engine = ScoringEngine(EmbeddingStore.open(store_path))
+    index_path = str(tmp_path / "index.npz")
+    save_index(build_index(engine.combined, "int8"), index_path, engine.index_source())
+
+    write_catalog(input_path, PRODUCTS[:7] + [dict(PRODUCTS[7], features=["zebra quokka"])] + PRODUCTS[8:])
+    update_embeddings(input_path, str(tmp_path / "metadata.json"), store_path, model_name="stub")
+
+    updated = ScoringEngine(EmbeddingStore.open(store_path))
+    assert len(updated) == len(engine)
+    with pytest.raises(ValueError):
+        load_index(index_path, updated.combined, updated.index_source())